@@ -21,7 +21,14 @@ def main(args: dict) -> None:
         )  # type: ignore
 
     if args.get(build_utils.FLAG_MAKE):
-        build_docker.build_docker_image(COMPONENT_NAME, version, exit_on_error=True)
+        build_docker.build_docker_image(
+            COMPONENT_NAME,
+            version,
+            docker_image_prefix=docker_image_prefix,
+            exit_on_error=True,
+            cache_dir=args.get(build_docker.FLAG_DOCKER_CACHE_DIR),
+            cache_from_previous=args.get(build_docker.FLAG_DOCKER_CACHE_FROM_PREVIOUS),
+        )
 
     if args.get(build_utils.FLAG_CHECK):
         build_docker.lint_dockerfile(exit_on_error=False)
@@ -30,6 +37,7 @@ def main(args: dict) -> None:
         completed_process = build_docker.check_image(
             image=build_docker.get_image_name(name=COMPONENT_NAME, tag=version),
             exit_on_error=exit_on_error,
+            cache_dir=args.get(build_utils.FLAG_CACHE_DIR),
         )
         if completed_process and completed_process.returncode != 0:
             build_utils.log(
@@ -18,10 +18,10 @@ def main(args: dict) -> None:
     # set script path as working dir
     os.chdir(HERE)
 
-    # Build react webapp
-    build_utils.build(REACT_WEBAPP_COMPONENT, args)
-    # Build python lib
-    build_utils.build(PYTHON_LIB_COMPONENT, args)
+    # Build react webapp and python lib, both do not depend on any other component
+    build_utils.build_components(
+        {REACT_WEBAPP_COMPONENT: [], PYTHON_LIB_COMPONENT: []}, args
+    )
 
     if args.get(build_utils.FLAG_MAKE):
         # Duplicate api docs into the mkdocs documentation
@@ -48,11 +48,8 @@ def main(args: dict) -> None:
             )
             build_utils.exit_process(1)
 
-    # Build docker container
-    build_utils.build(DOCKER_COMPONENT, args)
-
-    # Build mkdocs documentation
-    build_utils.build(DOCS_COMPONENT, args)
+    # Build docker container and mkdocs documentation
+    build_utils.build_components({DOCKER_COMPONENT: [], DOCS_COMPONENT: []}, args)
 
 
 if __name__ == "__main__":
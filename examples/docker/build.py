@@ -20,7 +20,14 @@ def main(args: dict) -> None:
         docker_image_prefix = DOCKER_IMAGE_PREFIX  # type: ignore
 
     if args.get(build_utils.FLAG_MAKE):
-        build_docker.build_docker_image(COMPONENT_NAME, version, exit_on_error=True)
+        build_docker.build_docker_image(
+            COMPONENT_NAME,
+            version,
+            docker_image_prefix=docker_image_prefix,
+            exit_on_error=True,
+            cache_dir=args.get(build_docker.FLAG_DOCKER_CACHE_DIR),
+            cache_from_previous=args.get(build_docker.FLAG_DOCKER_CACHE_FROM_PREVIOUS),
+        )
 
     if args.get(build_utils.FLAG_CHECK):
         build_docker.lint_dockerfile(exit_on_error=True)
@@ -26,48 +26,87 @@ def main(args: dict) -> None:
 
     if args.get(build_utils.FLAG_MAKE):
         # Install pipenv dev requirements
-        build_python.install_build_env(exit_on_error=True)
+        build_python.install_build_env(
+            exit_on_error=True,
+            cache_dir=args.get(build_utils.FLAG_CACHE_DIR),
+            offline=args.get(build_python.FLAG_OFFLINE),
+            wheelhouse=args.get(build_python.FLAG_WHEELHOUSE),
+        )
         # Create API documentation via lazydocs
         build_python.generate_api_docs(
             github_url=GITHUB_URL, main_package=MAIN_PACKAGE, exit_on_error=True
         )
         # Build distribution via setuptools
-        build_python.build_distribution(exit_on_error=True)
+        build_python.build_distribution(
+            exit_on_error=True, cache_dir=args.get(build_utils.FLAG_CACHE_DIR)
+        )
 
     if args.get(build_utils.FLAG_CHECK):
-        build_python.code_checks(exit_on_error=True, safety=False)
+        build_python.code_checks(
+            exit_on_error=True,
+            safety=False,
+            cache_dir=args.get(build_utils.FLAG_CACHE_DIR),
+        )
 
     if args.get(build_utils.FLAG_TEST):
         # Remove coverage files
-        build_utils.run("pipenv run coverage erase", exit_on_error=False)
+        build_utils.run(
+            build_python.get_tool_command("coverage") + " erase", exit_on_error=False
+        )
 
         test_markers = args.get(build_utils.FLAG_TEST_MARKER)
+        # Only run the affected tests if requested, release builds always run all tests
+        affected_only = bool(
+            args.get(build_python.FLAG_AFFECTED_ONLY)
+            and not args.get(build_utils.FLAG_RELEASE)
+        )
 
         if (
             isinstance(test_markers, list)
             and build_utils.TEST_MARKER_SLOW in test_markers
         ):
             # Run if slow test marker is set: test in multiple environments
-            # Python 3.6
-            build_python.test_with_py_version(
-                python_version="3.6.12", exit_on_error=True
-            )
-
-            # Python 3.7
-            build_python.test_with_py_version(
-                python_version="3.7.9", exit_on_error=True
+            # Python 3.6 and 3.7 at the same time
+            build_python.test_with_py_versions(
+                python_versions=["3.6.12", "3.7.9"],
+                exit_on_error=True,
+                cache_dir=args.get(build_utils.FLAG_CACHE_DIR),
+                offline=args.get(build_python.FLAG_OFFLINE),
+                wheelhouse=args.get(build_python.FLAG_WHEELHOUSE),
             )
 
             # Activated Python Environment (3.8)
-            build_python.install_build_env()
-            # Run pytest in pipenv environment
-            build_utils.run("pipenv run pytest", exit_on_error=True)
+            build_python.install_build_env(
+                exit_on_error=True,
+                cache_dir=args.get(build_utils.FLAG_CACHE_DIR),
+                offline=args.get(build_python.FLAG_OFFLINE),
+                wheelhouse=args.get(build_python.FLAG_WHEELHOUSE),
+            )
+            # Run pytest in pipenv environment, split into parallel shards
+            build_python.run_pytest(
+                shards=args.get(build_utils.FLAG_JOBS),
+                cache_dir=args.get(build_utils.FLAG_CACHE_DIR),
+                exit_on_error=True,
+                affected_only=affected_only,
+                fail_fast=not args.get(build_utils.FLAG_RELEASE),
+            )
 
             # Update pipfile.lock when all tests are successfull (lock environment)
             build_utils.run("pipenv lock", exit_on_error=True)
         else:
             # Run fast tests
-            build_utils.run('pipenv run pytest -m "not slow"', exit_on_error=True)
+            build_python.run_pytest(
+                '-m "not slow"',
+                shards=args.get(build_utils.FLAG_JOBS),
+                cache_dir=args.get(build_utils.FLAG_CACHE_DIR),
+                exit_on_error=True,
+                affected_only=affected_only,
+                fail_fast=not args.get(build_utils.FLAG_RELEASE),
+            )
+
+        # Create the coverage reports from the combined data of all test runs,
+        # the coverage of a run with only the affected tests is incomplete
+        build_python.combine_coverage(report=not affected_only)
 
     if args.get(build_utils.FLAG_RELEASE):
         # Publish distribution on pypi
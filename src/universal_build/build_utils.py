@@ -1,12 +1,35 @@
 """Universal build utilities."""
 
 import argparse
+import ast
+import asyncio
+import hashlib
+import importlib.util
+import json
+import mmap
 import os
 import re
+import runpy
+import shlex
 import shutil
 import subprocess
 import sys
-from typing import Dict, List, Match, Optional, Tuple, Union
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Match,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 from universal_build._utilities import DashInsensitiveDict
 
@@ -21,10 +44,15 @@ FLAG_VERSION = "version"
 FLAG_CHECK = "check"
 FLAG_RUN = "run"
 FLAG_FORCE = "force"
+FLAG_JOBS = "jobs"
+FLAG_CACHE_DIR = "cache_dir"
 
 _FLAG_SKIP_PATH = "skip_path"
 _FLAG_SANITIZED = "_sanitized"
 
+# Environment variables of arguments that do not use the upper-case argument name
+_ARGUMENT_ENV_VARIABLES = {FLAG_CACHE_DIR: "UNIVERSAL_BUILD_CACHE_DIR"}
+
 TEST_MARKER_SLOW = "slow"
 
 EXIT_CODE_GENERAL = 1
@@ -35,6 +63,40 @@ EXIT_CODE_DEV_VERSION_REQUIRED = 5
 EXIT_CODE_DEV_VERSION_NOT_MATCHES_BRANCH = 6
 EXIT_CODE_INVALID_ARGUMENTS = 7
 
+# Modes to collect the output of commands executed via `run`
+CAPTURE_NONE = "none"
+CAPTURE_TAIL = "tail"
+CAPTURE_FULL = "full"
+CAPTURE_FILE = "file"
+
+# Arguments that select the build phases or only affect how the build is executed.
+# Those are not part of the cache key of a build phase.
+_CACHE_IGNORED_ARGS = [
+    FLAG_MAKE,
+    FLAG_TEST,
+    FLAG_CHECK,
+    FLAG_RELEASE,
+    FLAG_RUN,
+    FLAG_JOBS,
+    FLAG_CACHE_DIR,
+    _FLAG_SKIP_PATH,
+    _FLAG_SANITIZED,
+]
+_CACHE_ENTRY_FILE = "cache-entry.json"
+_CACHE_OUTPUTS_DIR = "outputs"
+
+# Environment variable used to pass the resolved git metadata to nested build scripts
+_GIT_METADATA_ENV = "UNIVERSAL_BUILD_GIT_METADATA"
+# Resolved git metadata (e.g. branch, tags) per git repository root
+_git_metadata: Dict[str, Dict[str, Any]] = {}
+
+# Cache keys computed before a phase is executed, used to store the results afterwards
+_pending_cache_keys: Dict[Tuple[str, str], str] = {}
+
+# Thread-local state, e.g. used to buffer the log output of parallel builds or
+# to track the nesting depth of in-process builds
+_thread_context = threading.local()
+
 
 class _Version:
     """Parsed semantic version."""
@@ -89,12 +151,76 @@ class _Version:
         )
 
 
+class _OutputCapture:
+    """Collects the output lines of a command based on the capture mode."""
+
+    def __init__(
+        self, mode: str, tail_lines: int = 100, file_path: Optional[str] = None
+    ):
+        if mode not in [CAPTURE_NONE, CAPTURE_TAIL, CAPTURE_FULL, CAPTURE_FILE]:
+            raise ValueError(f"Unknown capture mode: {mode}")
+
+        self.mode = mode
+        self._lines: Union[List[str], deque] = []
+        if mode == CAPTURE_TAIL:
+            self._lines = deque(maxlen=tail_lines)
+
+        self._file = None
+        self._remove_file = False
+        if mode == CAPTURE_FILE:
+            if not file_path:
+                file_descriptor, file_path = tempfile.mkstemp(suffix=".log")
+                os.close(file_descriptor)
+                self._remove_file = True
+            self._file_path = file_path
+            self._file = open(file_path, "w", encoding="utf-8")
+
+    def write(self, line: str) -> None:
+        if self._file:
+            self._file.write(line)
+        elif self.mode != CAPTURE_NONE:
+            self._lines.append(line)
+
+    def get_output(self) -> Union[str, bytes, mmap.mmap]:
+        """Get the collected output.
+
+        Returns:
+            Union[str, bytes, mmap.mmap]: The output as string, or a read-only memory-mapped view of the output file for `CAPTURE_FILE`.
+        """
+        if not self._file:
+            return "".join(self._lines)
+
+        self.close()
+        output: Union[bytes, mmap.mmap] = b""
+        if os.path.getsize(self._file_path) > 0:
+            with open(self._file_path, "rb") as f:
+                output = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._remove_file:
+            try:
+                # The memory-mapped view stays valid after the file is removed
+                os.remove(self._file_path)
+            except OSError:
+                pass
+        return output
+
+    def close(self) -> None:
+        if self._file and not self._file.closed:
+            self._file.close()
+
+
 def log(message: str) -> None:
     """Log message to stdout.
 
+    If called from a parallel build task, the message is buffered and logged
+    together with the remaining output of the task once it is finished.
+
     Args:
         message (str): Message to log.
     """
+    log_buffer = getattr(_thread_context, "log_buffer", None)
+    if log_buffer is not None:
+        log_buffer.append(message)
+        return
     print(message, flush=True)
 
 
@@ -173,6 +299,10 @@ def parse_arguments(
     # load from env variables
     args = _load_from_env_variables(args, input_args)
 
+    if args.get(FLAG_CACHE_DIR):
+        # Use an absolute path, so that all components share the same cache directory
+        args[FLAG_CACHE_DIR] = os.path.abspath(args[FLAG_CACHE_DIR])
+
     if args.get(_FLAG_SANITIZED):
         log("Sanatized Arguments: " + str(args))
         return DashInsensitiveDict(args)
@@ -239,8 +369,9 @@ def _load_from_env_variables(sanatized_args: dict, program_args: List[str]) -> d
             # Argument was provided via command line arguments
             continue
 
-        if os.environ.get(argument.upper()):
-            sanatized_args[argument] = os.environ.get(argument.upper())
+        env_variable = _ARGUMENT_ENV_VARIABLES.get(argument, argument.upper())
+        if os.environ.get(env_variable):
+            sanatized_args[argument] = os.environ.get(env_variable)
 
         if os.environ.get("INPUT_" + argument.upper()):
             # Support for github action inputs
@@ -265,8 +396,9 @@ def _concat_command_line_arguments(args: Dict[str, Union[str, bool, List[str]]])
             for sys_arg in sys.argv
         ):
             # For some args the underscores must be converted back to dashes,
-            # since the argparser initially transforms all dashes to underscores
-            cli_arg_name = cli_arg_name.replace("_", "-")
+            # since the argparser initially transforms all dashes to underscores.
+            # A leading underscore is part of the flag name (e.g. `--_sanitized`).
+            cli_arg_name = cli_arg_name[:1] + cli_arg_name[1:].replace("_", "-")
         if arg_value:
             # For boolean types, the existence of the flag is enough
             if type(arg_value) == bool:
@@ -309,6 +441,9 @@ def create_git_tag(
         log(
             f"Executing `git tag` for version v{version} might have a problem: {completed_process.stderr}"
         )
+    else:
+        # The cached tags are outdated now
+        _reset_git_metadata("latest_tag", "remote_tags")
 
     if completed_process.returncode == 0 and push:
         completed_process = run(
@@ -318,25 +453,114 @@ def create_git_tag(
     return completed_process
 
 
-def build(component_path: str, args: Dict[str, Union[str, bool, List[str]]]) -> None:
+def build(
+    component_path: str,
+    args: Dict[str, Union[str, bool, List[str]]],
+    outputs: Optional[List[str]] = None,
+    in_process: bool = False,
+    inputs: Optional[List[str]] = None,
+    tool_versions: Optional[List[str]] = None,
+) -> None:
     """Run the build logic of the specified component, except if the path is a (sub-)path in skipped-paths.
 
+    If a cache directory is configured (`--cache-dir`), the build is skipped if the inputs of the component are unchanged
+    since the last successful build with the same arguments and tool versions. In this case, the declared `outputs` are restored from the cache.
+    Builds with the `release` or `run` phase are never skipped.
+
     Args:
         component_path (str): The path of the component to be built. The path must contain a build.py file.
         args (Dict): The arguments to be passed to the component's build.py file. The default arguments that were used to call this
             script are passed down to the component.
+        outputs (List[str], optional): Artifacts created by the component build (e.g. `dist`), relative to the component path.
+            Those are stored in and restored from the build cache.
+        in_process (bool, optional): If `True`, the component's build.py is imported and executed in the current Python process
+            instead of starting a new interpreter. The `main(args)` function of the build script is called with the sanitized arguments.
+            If the build script does not have a `main` function, it is executed as `__main__` script. Defaults to `False`.
+        inputs (List[str], optional): Additional input files or directories of the component build, relative to the component path.
+            Those are part of the cache key even if they are ignored by git (e.g. generated files that are copied into the component).
+        tool_versions (List[str], optional): Commands that print the version of the tools used in the component build, e.g. `node --version`.
     """
 
-    if _is_path_skipped(component_path, args):
-        return
+    if not _build_component(
+        component_path, args, outputs, in_process, inputs, tool_versions
+    ):
+        exit_process(EXIT_CODE_GENERAL)
 
-    build_command = _create_build_cmd_from_args(component_path, args)
-    completed_process = run(build_command, exit_on_error=False)
 
-    if completed_process.returncode > 0:
-        log(
-            f"Failed to build module {component_path}. Code: {completed_process.returncode}."
-        )
+def build_components(
+    components: Dict[str, List[str]],
+    args: Dict[str, Union[str, bool, List[str]]],
+    outputs: Optional[Dict[str, List[str]]] = None,
+    in_process: bool = False,
+    inputs: Optional[Dict[str, List[str]]] = None,
+    tool_versions: Optional[Dict[str, List[str]]] = None,
+) -> None:
+    """Run the build logic of multiple components based on their dependencies.
+
+    A component is only built after all of the components it depends on were built successfully.
+    If the `--jobs` flag is set to a value higher than 1, components that do not depend on each other are built in parallel.
+    In this case, the output of every component is prefixed with the component path and logged as one block as soon as the component build is finished.
+    If any of the component builds fails, no further builds are started and the process exits after the running builds are finished.
+
+    Example:
+    ```
+    build_components(
+        {
+            "react-webapp": [],
+            "python-lib": [],
+            "docker": ["python-lib"],
+        },
+        args,
+    )
+    ```
+
+    Args:
+        components (Dict[str, List[str]]): Mapping of the component paths to the paths of the components they depend on. Every path must contain a build.py file.
+        args (Dict): The arguments to be passed to the component's build.py file. The default arguments that were used to call this
+            script are passed down to the components.
+        outputs (Dict[str, List[str]], optional): Mapping of the component paths to the artifacts created by the component build.
+            Those are stored in and restored from the build cache (see `build`).
+        in_process (bool, optional): If `True`, the components are executed in the current Python process (see `build`).
+            Only supported for sequential builds, parallel builds always start a new interpreter for every component. Defaults to `False`.
+        inputs (Dict[str, List[str]], optional): Mapping of the component paths to additional input files or directories (see `build`).
+            The cache key of a component also includes the cache keys of the components it depends on.
+        tool_versions (Dict[str, List[str]], optional): Mapping of the component paths to commands that print the version of the tools
+            used in the component build (see `build`).
+    """
+    outputs = outputs or {}
+    inputs = inputs or {}
+    tool_versions = tool_versions or {}
+    try:
+        _get_task_order(components)
+    except ValueError as ex:
+        log(f"Invalid component dependencies: {ex}")
+        exit_process(EXIT_CODE_INVALID_ARGUMENTS)
+
+    jobs = int(args.get(FLAG_JOBS) or 1)  # type: ignore
+    if in_process and jobs > 1:
+        # The working directory is shared by all threads of the process
+        log("In-process builds are not supported for parallel builds.")
+        in_process = False
+
+    # Cache keys of the built components, a component is only built after its dependencies
+    cache_keys: Dict[str, str] = {}
+    failed_components = _run_task_graph(
+        components,
+        lambda component_path: _build_component(
+            component_path,
+            args,
+            outputs.get(component_path),  # type: ignore
+            in_process,
+            inputs.get(component_path),  # type: ignore
+            tool_versions.get(component_path),  # type: ignore
+            dependencies=components[component_path],
+            cache_keys=cache_keys,
+        ),
+        jobs=jobs,
+    )
+
+    if failed_components:
+        log("Failed to build components: " + ", ".join(failed_components))
         exit_process(EXIT_CODE_GENERAL)
 
 
@@ -346,61 +570,305 @@ def run(  # type: ignore
     disable_stderr_logging: bool = False,
     exit_on_error: bool = True,
     timeout: Optional[int] = None,
+    capture: str = CAPTURE_FULL,
+    capture_lines: int = 100,
+    capture_file: Optional[str] = None,
 ) -> subprocess.CompletedProcess:
     """Run a specified command.
 
     Args:
         command (str): The shell command that is executed via subprocess.Popen.
         disable_stdout_logging (bool): Disable stdout logging when it is too much or handled by the caller.
+        disable_stderr_logging (bool): Disable stderr logging. The stderr output is still collected in the returned CompletedProcess.
         exit_on_error (bool): Exit program if the exit code of the command is not 0.
         timeout (Optional[int]): If the process does not terminate after timeout seconds, raise a TimeoutExpired exception.
+        capture (str): How the output is collected for the returned CompletedProcess: `CAPTURE_FULL` keeps the full output in memory,
+            `CAPTURE_TAIL` only keeps the last `capture_lines` lines, `CAPTURE_FILE` writes the output to a file and returns a read-only
+            memory-mapped view (`mmap.mmap`) of this file, and `CAPTURE_NONE` does not keep any output. Defaults to `CAPTURE_FULL`.
+        capture_lines (int): Number of lines that are kept with `CAPTURE_TAIL`. Defaults to 100.
+        capture_file (Optional[str]): File to write the output to with `CAPTURE_FILE`. The stderr output is written to the same path
+            with an additional `.stderr` suffix. If not provided, temporary files are used.
 
     Returns:
-        subprocess.CompletedProcess: State
+        subprocess.CompletedProcess: State with the separately collected `stdout` and `stderr` output.
     """
     # Add timeout to command
     if timeout:
         command = f"timeout {timeout} {command}"
     log(f"Executing: {command}")
 
+    stdout_capture = _OutputCapture(capture, capture_lines, capture_file)
+    stderr_capture = _OutputCapture(
+        capture, capture_lines, capture_file + ".stderr" if capture_file else None
+    )
+    # Output of the stderr reader thread is buffered as well in parallel builds
+    log_buffer = getattr(_thread_context, "log_buffer", None)
+
     with subprocess.Popen(
         command,
         shell=True,
         stdout=subprocess.PIPE,
-        # TODO: Collect stdout and stderr separately instead of merging them. This requires an implementation using thread to avoid dead locks:
-        # https://stackoverflow.com/questions/17190221/subprocess-popen-cloning-stdout-and-stderr-both-to-terminal-and-variables
-        stderr=subprocess.STDOUT if not disable_stderr_logging else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
         universal_newlines=True,
     ) as process:
 
         try:
-            stdout = ""
-            with process.stdout:  # type: ignore
-                for line in iter(process.stdout.readline, ""):  # type: ignore
-                    if not disable_stdout_logging:
-                        log(line.rstrip("\n"))
-                    stdout += line
+            # Both pipes are read at the same time to avoid dead locks if the buffer of one pipe is full
+            stderr_thread = threading.Thread(
+                target=_stream_output,
+                args=(
+                    process.stderr,
+                    stderr_capture,
+                    not disable_stderr_logging,
+                    log_buffer,
+                    True,
+                ),
+                daemon=True,
+            )
+            stderr_thread.start()
+            _stream_output(
+                process.stdout,  # type: ignore
+                stdout_capture,
+                not disable_stdout_logging,
+                log_buffer,
+            )
+            stderr_thread.join()
             exitcode = process.wait(timeout=timeout)
-            process.stdout.close()  # type: ignore
+            stdout = stdout_capture.get_output()
+            stderr = stderr_capture.get_output()
 
             if exit_on_error and exitcode != 0:
                 exit_process(exitcode)
 
             return subprocess.CompletedProcess(
-                args=command, returncode=exitcode, stdout=stdout, stderr=stdout
+                args=command, returncode=exitcode, stdout=stdout, stderr=stderr
             )
         except Exception as ex:
             log(f"Exception during command run: {ex}")
+            stdout_capture.close()
+            stderr_capture.close()
             process.terminate()
             exit_process(1)
 
 
+async def run_async(
+    command: Union[str, List[str]],
+    disable_stdout_logging: bool = False,
+    disable_stderr_logging: bool = False,
+    exit_on_error: bool = True,
+    timeout: Optional[int] = None,
+    capture: str = CAPTURE_FULL,
+    capture_lines: int = 100,
+    capture_file: Optional[str] = None,
+    prefix: str = "",
+) -> subprocess.CompletedProcess:
+    """Run a specified command as coroutine.
+
+    Works the same way as `run`, but allows to run multiple commands concurrently within an asyncio event loop (see `run_all`).
+
+    Args:
+        command (Union[str, List[str]]): The shell command that is executed, or a list of the program and its arguments which is executed without shell.
+        disable_stdout_logging (bool): Disable stdout logging when it is too much or handled by the caller.
+        disable_stderr_logging (bool): Disable stderr logging. The stderr output is still collected in the returned CompletedProcess.
+        exit_on_error (bool): Exit program if the exit code of the command is not 0.
+        timeout (Optional[int]): If the process does not terminate after timeout seconds, it is terminated.
+        capture (str): How the output is collected for the returned CompletedProcess (see `run`). Defaults to `CAPTURE_FULL`.
+        capture_lines (int): Number of lines that are kept with `CAPTURE_TAIL`. Defaults to 100.
+        capture_file (Optional[str]): File to write the output to with `CAPTURE_FILE` (see `run`).
+        prefix (str): If set, every logged line is prefixed with `[prefix]` to distinguish the output of concurrent commands.
+
+    Returns:
+        subprocess.CompletedProcess: State with the separately collected `stdout` and `stderr` output.
+    """
+    # Add timeout to command
+    if timeout:
+        if isinstance(command, str):
+            command = f"timeout {timeout} {command}"
+        else:
+            command = ["timeout", str(timeout)] + list(command)
+    log_prefix = f"[{prefix}] " if prefix else ""
+    log(
+        log_prefix
+        + "Executing: "
+        + (command if isinstance(command, str) else " ".join(command))
+    )
+
+    stdout_capture = _OutputCapture(capture, capture_lines, capture_file)
+    stderr_capture = _OutputCapture(
+        capture, capture_lines, capture_file + ".stderr" if capture_file else None
+    )
+
+    try:
+        if isinstance(command, str):
+            process = await asyncio.create_subprocess_shell(
+                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        else:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+
+        # Both streams are piped
+        assert process.stdout is not None and process.stderr is not None
+        await asyncio.gather(
+            _stream_output_async(
+                process.stdout,
+                stdout_capture,
+                None if disable_stdout_logging else log_prefix,
+            ),
+            _stream_output_async(
+                process.stderr,
+                stderr_capture,
+                None if disable_stderr_logging else log_prefix,
+            ),
+        )
+        exitcode = await process.wait()
+        stdout = stdout_capture.get_output()
+        stderr = stderr_capture.get_output()
+    except Exception as ex:
+        log(f"{log_prefix}Exception during command run: {ex}")
+        stdout_capture.close()
+        stderr_capture.close()
+        exit_process(1)
+
+    if exit_on_error and exitcode != 0:
+        exit_process(exitcode)
+
+    return subprocess.CompletedProcess(
+        args=command, returncode=exitcode, stdout=stdout, stderr=stderr
+    )
+
+
+async def run_all_async(
+    commands: Sequence[Union[str, List[str]]],
+    max_concurrency: Optional[int] = None,
+    prefixes: Optional[List[str]] = None,
+    exit_on_error: bool = True,
+    group_output: bool = False,
+    **kwargs: Any,
+) -> List[subprocess.CompletedProcess]:
+    """Run multiple commands concurrently as coroutine.
+
+    Every command is executed via `run_async` and the logged output lines are prefixed to distinguish the commands.
+    If `exit_on_error` is `True`, the process exits after all commands are finished if any of the commands failed.
+
+    Args:
+        commands (Sequence[Union[str, List[str]]]): The commands to execute (see `run_async`).
+        max_concurrency (Optional[int]): Maximum number of commands running at the same time. If `None`, all commands are started at once.
+        prefixes (Optional[List[str]]): Prefixes for the output of every command. Defaults to the position of the command (starting with 1).
+        exit_on_error (bool): Exit program if the exit code of any command is not 0.
+        group_output (bool): If `True`, the output of every command is logged as one block (stdout followed by stderr) once the command is finished,
+            instead of logging every line as soon as it is available. Defaults to `False`.
+        **kwargs: Additional arguments that are passed to `run_async` (e.g. `capture` or `timeout`).
+
+    Returns:
+        List[subprocess.CompletedProcess]: The states of all commands in the order of the provided commands.
+    """
+    prefixes = prefixes or [str(index + 1) for index in range(len(commands))]
+    semaphore = asyncio.Semaphore(max_concurrency or max(len(commands), 1))
+
+    if group_output:
+        log_stdout = not kwargs.pop("disable_stdout_logging", False)
+        log_stderr = not kwargs.pop("disable_stderr_logging", False)
+        kwargs["disable_stdout_logging"] = True
+        kwargs["disable_stderr_logging"] = True
+
+    async def run_with_semaphore(
+        command: Union[str, List[str]], prefix: str
+    ) -> subprocess.CompletedProcess:
+        async with semaphore:
+            completed_process = await run_async(
+                command, exit_on_error=False, prefix=prefix, **kwargs
+            )
+        if group_output:
+            outputs = []
+            if log_stdout:
+                outputs.append(completed_process.stdout)
+            if log_stderr:
+                outputs.append(completed_process.stderr)
+            for output in outputs:
+                if not isinstance(output, str):
+                    output = bytes(output).decode("utf-8", errors="replace")
+                for line in output.splitlines():
+                    log(f"[{prefix}] {line}")
+        return completed_process
+
+    completed_processes = await asyncio.gather(
+        *[
+            run_with_semaphore(command, prefix)
+            for command, prefix in zip(commands, prefixes)
+        ]
+    )
+
+    if exit_on_error:
+        for completed_process in completed_processes:
+            if completed_process.returncode != 0:
+                exit_process(completed_process.returncode)
+
+    return list(completed_processes)
+
+
+def run_all(
+    commands: Sequence[Union[str, List[str]]],
+    max_concurrency: Optional[int] = None,
+    prefixes: Optional[List[str]] = None,
+    exit_on_error: bool = True,
+    group_output: bool = False,
+    **kwargs: Any,
+) -> List[subprocess.CompletedProcess]:
+    """Run multiple commands concurrently.
+
+    Synchronous wrapper of `run_all_async` that runs the commands in a new event loop.
+
+    Example:
+    ```
+    run_all(
+        ["yarn run lint:js", "yarn run lint:css"],
+        max_concurrency=2,
+        prefixes=["lint:js", "lint:css"],
+    )
+    ```
+
+    Args:
+        commands (Sequence[Union[str, List[str]]]): The commands to execute (see `run_async`).
+        max_concurrency (Optional[int]): Maximum number of commands running at the same time. If `None`, all commands are started at once.
+        prefixes (Optional[List[str]]): Prefixes for the output of every command. Defaults to the position of the command (starting with 1).
+        exit_on_error (bool): Exit program if the exit code of any command is not 0.
+        group_output (bool): If `True`, the output of every command is logged as one block once the command is finished. Defaults to `False`.
+        **kwargs: Additional arguments that are passed to `run_async` (e.g. `capture` or `timeout`).
+
+    Returns:
+        List[subprocess.CompletedProcess]: The states of all commands in the order of the provided commands.
+    """
+    loop = asyncio.new_event_loop()
+    # The loop needs to be set as current loop to attach the child watcher (Python < 3.8)
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(
+            run_all_async(
+                commands,
+                max_concurrency=max_concurrency,
+                prefixes=prefixes,
+                exit_on_error=exit_on_error,
+                group_output=group_output,
+                **kwargs,
+            )
+        )
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
 def exit_process(code: int = 0) -> None:
     """Exit the process with exit code.
 
     `sys.exit` seems to be a bit unreliable, process just sleeps and does not exit.
     So we are using os._exit instead and doing some manual cleanup.
+    Within an in-process component build, `SystemExit` is raised instead to only stop the component build.
     """
+    if getattr(_thread_context, "in_process_depth", 0) > 0:
+        raise SystemExit(code)
+
     import atexit
     import gc
 
@@ -520,6 +988,80 @@ def copy(
     return True
 
 
+def restore_from_cache(
+    name: str,
+    args: Dict[str, Union[str, bool, List[str]]],
+    outputs: Optional[List[str]] = None,
+    tool_versions: Optional[List[str]] = None,
+) -> bool:
+    """Check whether a build phase can be skipped because it already ran successfully with the same inputs.
+
+    The cache key is based on the content of all input files of the current working directory (respecting `.gitignore`),
+    the sanitized arguments, and the versions of the used tools. If a matching cache entry exists,
+    the declared outputs are restored from the cache. The cache is only used if a cache directory is configured (`--cache-dir`).
+
+    Example:
+    ```
+    if args.get(build_utils.FLAG_MAKE) and not build_utils.restore_from_cache(
+        build_utils.FLAG_MAKE, args, outputs=["dist"]
+    ):
+        build_python.build_distribution()
+        build_utils.save_to_cache(build_utils.FLAG_MAKE, args, outputs=["dist"])
+    ```
+
+    Args:
+        name (str): Name of the build phase, e.g. `make`.
+        args (Dict): The sanitized arguments of the build.
+        outputs (List[str], optional): Files or directories created by the build phase, relative to the working directory.
+        tool_versions (List[str], optional): Commands that print the version of the tools used in the build phase, e.g. `node --version`.
+
+    Returns:
+        bool: `True` if the build phase can be skipped and all outputs were restored.
+    """
+    cache_dir = args.get(FLAG_CACHE_DIR)
+    if not cache_dir:
+        return False
+
+    outputs = outputs or []
+    cache_key = _get_cache_key(name, args, "./", outputs, tool_versions)
+    _pending_cache_keys[(os.path.realpath("./"), name)] = cache_key
+
+    return _restore_cache_entry(
+        _get_cache_entry_dir(str(cache_dir), "./", name), cache_key, "./", outputs
+    )
+
+
+def save_to_cache(
+    name: str,
+    args: Dict[str, Union[str, bool, List[str]]],
+    outputs: Optional[List[str]] = None,
+    tool_versions: Optional[List[str]] = None,
+) -> None:
+    """Store the outputs of a successful build phase in the build cache.
+
+    If `restore_from_cache` was called for the same phase before, the cache key computed at that point is used.
+    The cache is only used if a cache directory is configured (`--cache-dir`).
+
+    Args:
+        name (str): Name of the build phase, e.g. `make`.
+        args (Dict): The sanitized arguments of the build.
+        outputs (List[str], optional): Files or directories created by the build phase, relative to the working directory.
+        tool_versions (List[str], optional): Commands that print the version of the tools used in the build phase, e.g. `node --version`.
+    """
+    cache_dir = args.get(FLAG_CACHE_DIR)
+    if not cache_dir:
+        return
+
+    outputs = outputs or []
+    cache_key = _pending_cache_keys.pop((os.path.realpath("./"), name), None)
+    if not cache_key:
+        cache_key = _get_cache_key(name, args, "./", outputs, tool_versions)
+
+    _save_cache_entry(
+        _get_cache_entry_dir(str(cache_dir), "./", name), cache_key, "./", outputs
+    )
+
+
 # Private functions
 
 
@@ -529,9 +1071,15 @@ def _get_current_branch() -> Tuple[str, str]:
     Returns:
         Tuple: (branchname, type)
     """
-    full_branch_name = run(
-        "git branch --show-current", disable_stdout_logging=True, exit_on_error=False
-    ).stdout.rstrip("\n")
+    full_branch_name = _get_git_metadata(
+        "branch",
+        lambda: run(
+            "git branch --show-current",
+            disable_stdout_logging=True,
+            disable_stderr_logging=True,
+            exit_on_error=False,
+        ).stdout.rstrip("\n"),
+    )
     if full_branch_name == "":
         full_branch_name = "HEAD"
     path_parts = full_branch_name.split("/")
@@ -545,6 +1093,413 @@ def _get_current_branch() -> Tuple[str, str]:
     return (path_parts[0], merged_branch_name)
 
 
+def _build_component(
+    component_path: str,
+    args: Dict[str, Union[str, bool, List[str]]],
+    outputs: Optional[List[str]] = None,
+    in_process: bool = False,
+    inputs: Optional[List[str]] = None,
+    tool_versions: Optional[List[str]] = None,
+    dependencies: Optional[List[str]] = None,
+    cache_keys: Optional[Dict[str, str]] = None,
+) -> bool:
+    """Run the build.py script of a component, except if the path is a (sub-)path in skipped-paths.
+
+    The cache keys of the `dependencies` are taken from `cache_keys` and are part of the cache key of the component,
+    which is added to `cache_keys` as well.
+
+    Returns:
+        bool: `True` if the component was built successfully, skipped, or restored from the build cache.
+    """
+    if _is_path_skipped(component_path, args):
+        return True
+
+    cache_dir = args.get(FLAG_CACHE_DIR)
+    if args.get(FLAG_RELEASE) or args.get(FLAG_RUN):
+        # Releasing and running have side effects, those builds are never skipped
+        cache_dir = None
+    outputs = outputs or []
+    if cache_dir:
+        # The selected phases are part of the key since the whole component build is cached
+        phases = [
+            phase for phase in [FLAG_MAKE, FLAG_CHECK, FLAG_TEST] if args.get(phase)
+        ]
+        dependency_keys = [
+            (cache_keys or {}).get(dependency, "") for dependency in dependencies or []
+        ]
+        cache_key = _get_cache_key(
+            "build:" + ",".join(phases),
+            args,
+            component_path,
+            outputs,
+            tool_versions,
+            inputs,
+            dependency_keys,
+        )
+        if cache_keys is not None:
+            cache_keys[component_path] = cache_key
+        cache_entry_dir = _get_cache_entry_dir(str(cache_dir), component_path, "build")
+        if _restore_cache_entry(cache_entry_dir, cache_key, component_path, outputs):
+            return True
+
+    if in_process:
+        exit_code = _run_build_script_in_process(component_path, args)
+    else:
+        build_command = _create_build_cmd_from_args(component_path, args)
+        # The output is only logged, there is no need to keep it in memory
+        exit_code = run(
+            build_command, exit_on_error=False, capture=CAPTURE_NONE
+        ).returncode
+
+    if exit_code > 0:
+        log(f"Failed to build module {component_path}. Code: {exit_code}.")
+        return False
+
+    if cache_dir:
+        _save_cache_entry(cache_entry_dir, cache_key, component_path, outputs)
+    return True
+
+
+def _get_cache_key(
+    name: str,
+    args: Dict[str, Union[str, bool, List[str]]],
+    path: str,
+    outputs: List[str],
+    tool_versions: Optional[List[str]] = None,
+    inputs: Optional[List[str]] = None,
+    dependency_keys: Optional[List[str]] = None,
+) -> str:
+    """Compute the cache key of a build phase based on its input files, arguments, tool versions, and the cache keys of its dependencies."""
+    from universal_build import _about
+
+    key_hash = hashlib.sha256()
+    key_hash.update(name.encode("utf-8"))
+
+    cache_args = {
+        str(arg): value
+        for arg, value in args.items()
+        if str(arg).replace("-", "_") not in _CACHE_IGNORED_ARGS
+    }
+    key_hash.update(json.dumps(cache_args, sort_keys=True, default=str).encode("utf-8"))
+
+    key_hash.update(sys.version.encode("utf-8"))
+    key_hash.update(_about.__version__.encode("utf-8"))
+    for tool_version_command in tool_versions or []:
+        completed_process = run(
+            tool_version_command,
+            disable_stdout_logging=True,
+            disable_stderr_logging=True,
+            exit_on_error=False,
+        )
+        # Some tools print their version to stderr
+        tool_version = completed_process.stdout + completed_process.stderr
+        key_hash.update(tool_version.encode("utf-8"))
+
+    for dependency_key in dependency_keys or []:
+        key_hash.update(dependency_key.encode("utf-8"))
+
+    excluded_paths = [os.path.normpath(output) for output in outputs]
+    cache_dir = args.get(FLAG_CACHE_DIR)
+    if cache_dir:
+        excluded_paths.append(os.path.relpath(str(cache_dir), path))
+
+    input_files = set(_get_input_files(path))
+    # Declared inputs are included even if they are ignored by git
+    for input_path in inputs or []:
+        input_path = os.path.normpath(input_path)
+        full_input_path = os.path.join(path, input_path)
+        if os.path.isfile(full_input_path):
+            input_files.add(input_path)
+        for root, _, files in os.walk(full_input_path):
+            for file_name in files:
+                input_files.add(os.path.relpath(os.path.join(root, file_name), path))
+
+    for input_file in sorted(input_files):
+        if any(
+            input_file == excluded_path or input_file.startswith(excluded_path + os.sep)
+            for excluded_path in excluded_paths
+        ):
+            continue
+        key_hash.update(input_file.encode("utf-8"))
+        key_hash.update(_get_file_hash(os.path.join(path, input_file)).encode("utf-8"))
+
+    return key_hash.hexdigest()
+
+
+def _get_input_files(path: str) -> List[str]:
+    """Get all files in the path relative to the path, respecting `.gitignore` if the path is inside a git repository."""
+    completed_process = run(
+        f"cd '{path}' && git ls-files -z --cached --others --exclude-standard",
+        disable_stdout_logging=True,
+        disable_stderr_logging=True,
+        exit_on_error=False,
+    )
+
+    input_files: List[str] = []
+    if completed_process.returncode == 0:
+        for input_file in completed_process.stdout.split("\0"):
+            if not input_file:
+                continue
+            input_file = os.path.normpath(input_file)
+            if os.path.isfile(os.path.join(path, input_file)):
+                input_files.append(input_file)
+    else:
+        for root, dirs, files in os.walk(path):
+            # Skip hidden directories (e.g. .git) and python caches
+            dirs[:] = [
+                directory
+                for directory in dirs
+                if not directory.startswith(".") and directory != "__pycache__"
+            ]
+            for file_name in files:
+                input_files.append(os.path.relpath(os.path.join(root, file_name), path))
+    return sorted(input_files)
+
+
+def _get_file_hash(file_path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _get_cache_entry_dir(cache_dir: str, path: str, name: str) -> str:
+    """Get the directory of the cache entry for a build phase of the component in the path."""
+    real_path = os.path.realpath(path)
+    git_root = _get_git_root(path)
+    component_id = os.path.basename(real_path)
+    if git_root:
+        component_id = os.path.relpath(real_path, git_root)
+    component_id = "root" if component_id == "." else component_id.replace(os.sep, "__")
+    return os.path.join(cache_dir, component_id, name)
+
+
+def _restore_cache_entry(
+    cache_entry_dir: str, cache_key: str, path: str, outputs: List[str]
+) -> bool:
+    entry_file = os.path.join(cache_entry_dir, _CACHE_ENTRY_FILE)
+    try:
+        with open(entry_file, "r") as f:
+            cache_entry = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if cache_entry.get("key") != cache_key or not set(outputs).issubset(
+        cache_entry.get("outputs", [])
+    ):
+        return False
+
+    for output in outputs:
+        cached_output = os.path.join(cache_entry_dir, _CACHE_OUTPUTS_DIR, output)
+        target_output = os.path.join(path, output)
+        if os.path.isdir(target_output):
+            shutil.rmtree(target_output)
+        elif os.path.exists(target_output):
+            os.remove(target_output)
+        if os.path.isdir(cached_output):
+            shutil.copytree(cached_output, target_output)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(target_output)), exist_ok=True)
+            shutil.copy2(cached_output, target_output)
+
+    log(
+        f"Skipping {os.path.basename(cache_entry_dir)} for {os.path.realpath(path)}: inputs are unchanged since the last successful run."
+    )
+    return True
+
+
+def _save_cache_entry(
+    cache_entry_dir: str, cache_key: str, path: str, outputs: List[str]
+) -> None:
+    for output in outputs:
+        if not os.path.exists(os.path.join(path, output)):
+            log(f"Cannot cache the build results, output {output} does not exist.")
+            return
+
+    # Write the new entry into a temporary directory first, so that an entry is never incomplete
+    temp_entry_dir = cache_entry_dir + ".tmp"
+    try:
+        if os.path.exists(temp_entry_dir):
+            shutil.rmtree(temp_entry_dir)
+        os.makedirs(os.path.join(temp_entry_dir, _CACHE_OUTPUTS_DIR))
+        for output in outputs:
+            source_output = os.path.join(path, output)
+            cached_output = os.path.join(temp_entry_dir, _CACHE_OUTPUTS_DIR, output)
+            if os.path.isdir(source_output):
+                shutil.copytree(source_output, cached_output)
+            else:
+                os.makedirs(os.path.dirname(cached_output), exist_ok=True)
+                shutil.copy2(source_output, cached_output)
+        with open(os.path.join(temp_entry_dir, _CACHE_ENTRY_FILE), "w") as f:
+            json.dump({"key": cache_key, "outputs": outputs}, f)
+
+        if os.path.exists(cache_entry_dir):
+            shutil.rmtree(cache_entry_dir)
+        os.rename(temp_entry_dir, cache_entry_dir)
+    except OSError as ex:
+        log(f"Failed to store build results in cache: {ex}")
+
+
+def _get_task_order(tasks: Dict[str, List[str]]) -> List[str]:
+    """Sort the tasks so that every task is placed after all of its dependencies.
+
+    Tasks without dependencies between each other keep the order in which they are defined.
+
+    Args:
+        tasks (Dict[str, List[str]]): Mapping of task names to the names of the tasks they depend on.
+
+    Raises:
+        ValueError: Raised if a task depends on an unknown task or the dependencies contain a cycle.
+
+    Returns:
+        List[str]: The sorted task names.
+    """
+    for task, dependencies in tasks.items():
+        for dependency in dependencies:
+            if dependency not in tasks:
+                raise ValueError(f"{task} depends on unknown task {dependency}.")
+
+    ordered_tasks: List[str] = []
+    remaining_tasks = list(tasks)
+    while remaining_tasks:
+        ready_tasks = [
+            task
+            for task in remaining_tasks
+            if all(dependency in ordered_tasks for dependency in tasks[task])
+        ]
+        if not ready_tasks:
+            raise ValueError(
+                "Dependency cycle between tasks: " + ", ".join(remaining_tasks)
+            )
+        for task in ready_tasks:
+            ordered_tasks.append(task)
+            remaining_tasks.remove(task)
+    return ordered_tasks
+
+
+def _run_task_graph(
+    tasks: Dict[str, List[str]], task_func: Callable[[str], bool], jobs: int = 1
+) -> List[str]:
+    """Run all tasks after their dependencies, with up to `jobs` tasks in parallel.
+
+    No new tasks are started once a task has failed. In parallel mode, the log output of every task is buffered
+    and logged as one block, prefixed with the task name, once the task is finished.
+
+    Args:
+        tasks (Dict[str, List[str]]): Mapping of task names to the names of the tasks they depend on.
+        task_func (Callable[[str], bool]): Function that runs a task by name and returns `True` if it was successful.
+        jobs (int, optional): Maximum number of tasks running in parallel. Defaults to 1.
+
+    Returns:
+        List[str]: The names of all failed tasks.
+    """
+    pending_tasks = _get_task_order(tasks)
+
+    if jobs <= 1:
+        for task in pending_tasks:
+            if not task_func(task):
+                return [task]
+        return []
+
+    finished_tasks: Set[str] = set()
+    failed_tasks: List[str] = []
+    running_tasks: Dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending_tasks or running_tasks:
+            if not failed_tasks:
+                for task in list(pending_tasks):
+                    if len(running_tasks) >= jobs:
+                        break
+                    if all(dependency in finished_tasks for dependency in tasks[task]):
+                        pending_tasks.remove(task)
+                        future = executor.submit(_run_buffered_task, task_func, task)
+                        running_tasks[future] = task
+
+            if not running_tasks:
+                break
+
+            done_futures, _ = wait(running_tasks, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                task = running_tasks.pop(future)
+                successful, output = future.result()
+                for line in output:
+                    log(f"[{task}] {line}")
+                if successful:
+                    finished_tasks.add(task)
+                else:
+                    failed_tasks.append(task)
+
+    return failed_tasks
+
+
+def _run_buffered_task(
+    task_func: Callable[[str], bool], task: str
+) -> Tuple[bool, List[str]]:
+    """Run a task and collect all messages it logs instead of printing them."""
+    _thread_context.log_buffer = []
+    try:
+        successful = task_func(task)
+    except Exception as ex:
+        log(f"Exception during task {task}: {ex}")
+        successful = False
+    finally:
+        output = _thread_context.log_buffer
+        _thread_context.log_buffer = None
+    return successful, output
+
+
+def _stream_output(
+    pipe: Any,
+    output_capture: _OutputCapture,
+    log_output: bool,
+    log_buffer: Optional[List[str]] = None,
+    is_stderr: bool = False,
+) -> None:
+    """Read all lines of a pipe until it is closed, and log and collect them."""
+    _thread_context.log_buffer = log_buffer
+    with pipe:
+        for line in iter(pipe.readline, ""):
+            if log_output:
+                if is_stderr and log_buffer is None:
+                    print(line.rstrip("\n"), file=sys.stderr, flush=True)
+                else:
+                    log(line.rstrip("\n"))
+            output_capture.write(line)
+
+
+async def _stream_output_async(
+    stream: asyncio.StreamReader,
+    output_capture: _OutputCapture,
+    log_prefix: Optional[str] = None,
+) -> None:
+    """Read all lines of a stream until it is closed, and log and collect them.
+
+    The output is read in chunks, since `readline` fails for lines exceeding the buffer limit of the stream.
+    """
+
+    def handle_line(line: bytes) -> None:
+        decoded_line = line.decode("utf-8", errors="replace")
+        if log_prefix is not None:
+            log(log_prefix + decoded_line.rstrip("\n"))
+        output_capture.write(decoded_line)
+
+    pending_output = b""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        pending_output += chunk
+        *lines, pending_output = pending_output.split(b"\n")
+        for line in lines:
+            handle_line(line + b"\n")
+
+    if pending_output:
+        # Last line without a trailing newline
+        handle_line(pending_output)
+
+
 def _is_path_skipped(path: str, args: dict) -> bool:
     """Check whether the path is itself defined as a skip_path or is a sub-path of a skipped path.
 
@@ -600,6 +1555,17 @@ def _get_default_cli_arguments_parser(
         help="Ignore all enforcements and warnings.",
         action="store_true",
     )
+    parser.add_argument(
+        f"--{FLAG_JOBS}",
+        help="Number of components that are allowed to be built in parallel.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--" + FLAG_CACHE_DIR.replace("_", "-"),
+        help="Directory of the build cache. If set, build phases with unchanged inputs are skipped.",
+        default="",
+    )
     parser.add_argument(
         "--" + _FLAG_SKIP_PATH.replace("_", "-"),
         help="Skips the build phases for all (sub)paths provided here",
@@ -632,6 +1598,83 @@ def _create_build_cmd_from_args(module_path: str, sanitized_args: dict) -> str:
     return full_command
 
 
+def _run_build_script_in_process(module_path: str, sanitized_args: dict) -> int:
+    """Execute the build.py script of a component in the current Python process.
+
+    The working directory, `sys.argv`, and `sys.path` are isolated for the build script and restored afterwards.
+
+    Returns:
+        int: The exit code of the build script.
+    """
+    build_script = os.path.join(os.path.realpath(module_path), "build.py")
+    script_dir = os.path.dirname(build_script)
+    log("Building " + module_path + " in-process: " + build_script)
+
+    with open(build_script, "r") as f:
+        has_main_function = any(
+            isinstance(node, ast.FunctionDef) and node.name == "main"
+            for node in ast.parse(f.read(), build_script).body
+        )
+
+    working_dir = os.getcwd()
+    original_argv = sys.argv
+    original_path = list(sys.path)
+    original_modules = set(sys.modules)
+    module_name = (
+        "_universal_build_component_"
+        + hashlib.sha1(build_script.encode("utf-8")).hexdigest()
+    )
+    spec = None
+    if has_main_function:
+        spec = importlib.util.spec_from_file_location(module_name, build_script)
+        if spec is None or spec.loader is None:
+            log(f"Failed to load {build_script}, building it in a new interpreter.")
+            return run(
+                _create_build_cmd_from_args(module_path, sanitized_args),
+                exit_on_error=False,
+                capture=CAPTURE_NONE,
+            ).returncode
+
+    _thread_context.in_process_depth = (
+        getattr(_thread_context, "in_process_depth", 0) + 1
+    )
+    try:
+        os.chdir(script_dir)
+        sys.argv = [build_script] + shlex.split(
+            _concat_command_line_arguments(sanitized_args)
+        )
+        sys.path.insert(0, script_dir)
+
+        if spec is not None and spec.loader is not None:
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            module.main(DashInsensitiveDict(sanitized_args))  # type: ignore
+        else:
+            # The build logic is only contained in the __main__ block of the script
+            runpy.run_path(build_script, run_name="__main__")
+        return 0
+    except SystemExit as ex:
+        if ex.code is None:
+            return 0
+        return ex.code if isinstance(ex.code, int) else EXIT_CODE_GENERAL
+    except Exception as ex:
+        log(f"Exception during in-process build of {module_path}: {ex}")
+        return EXIT_CODE_GENERAL
+    finally:
+        _thread_context.in_process_depth -= 1
+        os.chdir(working_dir)
+        sys.argv = original_argv
+        sys.path[:] = original_path
+        # Remove modules of the component, so that they are not reused by other components
+        for name in set(sys.modules) - original_modules:
+            module_file = getattr(sys.modules[name], "__file__", None) or ""
+            if name == module_name or os.path.realpath(module_file).startswith(
+                script_dir + os.sep
+            ):
+                del sys.modules[name]
+
+
 def _is_valid_command_combination(args: dict) -> bool:
     if (
         args.get(FLAG_RELEASE)
@@ -678,12 +1721,16 @@ def _get_version_tags() -> List["_Version"]:
 
 
 def _get_latest_branch_version() -> Optional[_Version]:
-    result = run(
-        "git describe --tags --match 'v[0-9].*' --abbrev=0",
-        disable_stdout_logging=True,
-        exit_on_error=False,
+    latest_tag = _get_git_metadata(
+        "latest_tag",
+        lambda: run(
+            "git describe --tags --match 'v[0-9].*' --abbrev=0",
+            disable_stdout_logging=True,
+            disable_stderr_logging=True,
+            exit_on_error=False,
+        ).stdout.rstrip("\n"),
     )
-    return _Version.get_version_from_string(result.stdout.rstrip("\n"))
+    return _Version.get_version_from_string(latest_tag)
 
 
 def _get_remote_git_tags() -> List[str]:
@@ -691,12 +1738,93 @@ def _get_remote_git_tags() -> List[str]:
         # if no github token is set, don't try to get the tags from remote
         return []
 
-    result = run(
-        "git ls-remote --tags --sort='-v:refname' --refs",
-        disable_stdout_logging=True,
-        exit_on_error=False,
+    return _get_git_metadata(
+        "remote_tags",
+        lambda: run(
+            "git ls-remote --tags --sort='-v:refname' --refs",
+            disable_stdout_logging=True,
+            disable_stderr_logging=True,
+            exit_on_error=False,
+        )
+        .stdout.rstrip("\n")
+        .split("\n"),
     )
-    return result.stdout.rstrip("\n").split("\n")
+
+
+def _get_git_root(path: str = "./") -> str:
+    """Get the root directory of the git repository containing the path without calling git.
+
+    Returns:
+        str: The real path of the repository root or an empty string if the path is not inside a git repository.
+    """
+    current_path = os.path.realpath(path)
+    while True:
+        if os.path.exists(os.path.join(current_path, ".git")):
+            return current_path
+        parent_path = os.path.dirname(current_path)
+        if parent_path == current_path:
+            return ""
+        current_path = parent_path
+
+
+def _get_git_head(git_root: str) -> str:
+    """Read the content of the HEAD file (current branch ref or commit) of the git repository."""
+    git_dir = os.path.join(git_root, ".git")
+    try:
+        if os.path.isfile(git_dir):
+            # Worktrees and submodules link to their git directory
+            with open(git_dir, "r") as f:
+                git_dir = os.path.join(
+                    git_root, f.read().strip().replace("gitdir:", "", 1).strip()
+                )
+        with open(os.path.join(git_dir, "HEAD"), "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _get_git_metadata(key: str, resolve_func: Callable[[], Any]) -> Any:
+    """Get a git metadata value of the current repository, resolving it only once per pipeline.
+
+    Resolved values are cached in the process and passed to nested build scripts via an environment variable.
+    Cached values are only used as long as the HEAD of the repository is unchanged.
+
+    Args:
+        key (str): Name of the metadata value, e.g. `branch`.
+        resolve_func (Callable[[], Any]): Function to resolve the value if it is not cached. The value must be JSON serializable.
+
+    Returns:
+        Any: The metadata value.
+    """
+    git_root = _get_git_root()
+    if not git_root:
+        return resolve_func()
+
+    if git_root not in _git_metadata:
+        try:
+            inherited_metadata = json.loads(os.environ.get(_GIT_METADATA_ENV, "{}"))
+        except ValueError:
+            inherited_metadata = {}
+        _git_metadata[git_root] = inherited_metadata.get(git_root, {})
+
+    metadata = _git_metadata[git_root]
+    git_head = _get_git_head(git_root)
+    if metadata.get("head") != git_head:
+        metadata.clear()
+        metadata["head"] = git_head
+
+    if key not in metadata:
+        metadata[key] = resolve_func()
+        os.environ[_GIT_METADATA_ENV] = json.dumps(_git_metadata)
+    return metadata[key]
+
+
+def _reset_git_metadata(*keys: str) -> None:
+    """Remove the cached git metadata values of the current repository."""
+    metadata = _git_metadata.get(_get_git_root(), {})
+    for key in keys:
+        metadata.pop(key, None)
+    os.environ[_GIT_METADATA_ENV] = json.dumps(_git_metadata)
 
 
 def _get_version(
@@ -0,0 +1,74 @@
+"""Pytest plugin used by `build_python.run_pytest()` to select tests and to report their results.
+
+The plugin is copied next to the test run and configured via environment variables,
+so that universal-build does not need to be installed in the test environment.
+"""
+
+import json
+import os
+from typing import Any, Dict, List
+
+# File with the node IDs of the tests to run, one per line
+_SELECTION_ENV = "UNIVERSAL_BUILD_TEST_SELECTION"
+# File to write the collected tests and the test results to
+_REPORT_ENV = "UNIVERSAL_BUILD_TEST_REPORT"
+# File that is created on the first failure to stop all test processes sharing this file
+_STOP_ENV = "UNIVERSAL_BUILD_TEST_STOP_FILE"
+
+_collected_tests: List[str] = []
+_test_results: Dict[str, Dict[str, Any]] = {}
+_sessions: List[Any] = []
+
+
+def pytest_sessionstart(session: Any) -> None:
+    _sessions.append(session)
+
+
+def pytest_collection_modifyitems(session: Any, config: Any, items: List[Any]) -> None:
+    selection_file = os.getenv(_SELECTION_ENV)
+    if not selection_file:
+        return
+
+    with open(selection_file, "r") as f:
+        selection = {test_id: i for i, test_id in enumerate(f.read().splitlines())}
+
+    deselected_items = [item for item in items if item.nodeid not in selection]
+    if deselected_items:
+        config.hook.pytest_deselected(items=deselected_items)
+    # Run the selected tests in the order of the selection file
+    items[:] = sorted(
+        (item for item in items if item.nodeid in selection),
+        key=lambda item: selection[item.nodeid],
+    )
+
+
+def pytest_collection_finish(session: Any) -> None:
+    _collected_tests.extend(item.nodeid for item in session.items)
+
+
+def pytest_runtest_logreport(report: Any) -> None:
+    test_result = _test_results.setdefault(
+        report.nodeid, {"duration": 0.0, "outcome": "passed"}
+    )
+    test_result["duration"] += report.duration
+    if report.failed:
+        test_result["outcome"] = "failed"
+    elif report.skipped and test_result["outcome"] == "passed":
+        test_result["outcome"] = "skipped"
+
+    stop_file = os.getenv(_STOP_ENV)
+    if not stop_file:
+        return
+    if report.failed:
+        open(stop_file, "a").close()
+    elif report.when == "teardown" and os.path.exists(stop_file) and _sessions:
+        _sessions[0].shouldstop = "Tests failed in another test process"
+
+
+def pytest_sessionfinish(session: Any, exitstatus: int) -> None:
+    report_file = os.getenv(_REPORT_ENV)
+    if not report_file:
+        return
+
+    with open(report_file, "w") as f:
+        json.dump({"collected": _collected_tests, "results": _test_results}, f)
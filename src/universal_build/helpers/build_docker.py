@@ -1,13 +1,33 @@
 """Utilities to help building Docker images."""
 
 import argparse
+import hashlib
+import json
 import os
+import posixpath
+import re
+import shlex
+import stat
 import subprocess
-from typing import List, Optional
+import tempfile
+import time
+from shutil import rmtree
+from typing import Any, Dict, List, Optional, Pattern, Set, Tuple
 
 from universal_build import build_utils
 
 FLAG_DOCKER_IMAGE_PREFIX = "docker_image_prefix"
+FLAG_DOCKER_CACHE_DIR = "docker_cache_dir"
+FLAG_DOCKER_CACHE_FROM_PREVIOUS = "docker_cache_from_previous"
+
+# Buildx builder with the docker-container driver, required to export the build cache
+_BUILDX_BUILDER = "universal-build"
+# Label with the fingerprint of the build context, the Dockerfile, and the build arguments
+_FINGERPRINT_LABEL = "universal-build.fingerprint"
+_TRIVY_CACHE_DIR = "_trivy"
+_TRIVY_RESULTS_CACHE_DIR = "_trivy-results"
+# Seconds before the first retry of failed pushes, doubled for every further retry
+_PUSH_RETRY_DELAY = 5
 
 
 def parse_arguments(
@@ -34,29 +54,78 @@ def parse_arguments(
         required=False,
         default="",
     )
+    argument_parser.add_argument(
+        "--" + FLAG_DOCKER_CACHE_DIR.replace("_", "-"),
+        help="Directory to export the BuildKit layer cache to and to import it from.",
+        required=False,
+        default="",
+    )
+    argument_parser.add_argument(
+        "--" + FLAG_DOCKER_CACHE_FROM_PREVIOUS.replace("_", "-"),
+        help="Use the image of the previous version as cache source for the Docker build.",
+        action="store_true",
+    )
 
-    return build_utils.parse_arguments(
+    args = build_utils.parse_arguments(
         input_args=input_args, argument_parser=argument_parser
     )
+    if args.get(FLAG_DOCKER_CACHE_DIR):
+        # Use an absolute path, so that all components share the same cache directory
+        args[FLAG_DOCKER_CACHE_DIR] = os.path.abspath(args[FLAG_DOCKER_CACHE_DIR])
+    return args
 
 
 def check_image(
-    image: str, trivy: bool = True, exit_on_error: bool = True
+    image: str,
+    trivy: bool = True,
+    exit_on_error: bool = True,
+    cache_dir: Optional[str] = None,
 ) -> subprocess.CompletedProcess:
     """Run vulnerability checks on Dockerimage.
 
+    If a `cache_dir` is provided, trivy stores the analyzed image layers in this directory, so that only changed layers
+    are analyzed again. Additionally, the check is skipped if the same image (based on the image ID) already passed
+    the check with the same version of the vulnerability database.
+
     Args:
         image (str): The name of the docker image to check.
         trivy (bool, optional): Activate trivy vulnerability check. Defaults to `True`.
         exit_on_error (bool, optional): If `True`, exit process as soon as an error occurs.
+        cache_dir (str, optional): Directory to cache the layers and the check results, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to `None`.
     """
     build_utils.log("Run vulnerability checks on docker image:")
 
     if trivy and build_utils.command_exists("trivy", exit_on_error=exit_on_error):
-        return build_utils.run(
-            f"trivy image --timeout=20m0s --exit-code 1 --severity HIGH,CRITICAL {image}",
+        trivy_command = "trivy"
+        if cache_dir:
+            trivy_command += " --cache-dir=" + shlex.quote(
+                os.path.join(str(cache_dir), _TRIVY_CACHE_DIR)
+            )
+        trivy_scan_args = "--timeout=20m0s --exit-code 1 --severity HIGH,CRITICAL"
+
+        result_file = None
+        if cache_dir:
+            result_key = _get_trivy_result_key(image, trivy_command, trivy_scan_args)
+            if result_key:
+                result_file = os.path.join(
+                    str(cache_dir), _TRIVY_RESULTS_CACHE_DIR, result_key
+                )
+                if os.path.isfile(result_file):
+                    build_utils.log(
+                        f"Skipping vulnerability check of {image}: The image already passed the check with the same vulnerability database."
+                    )
+                    return subprocess.CompletedProcess(
+                        args="", returncode=0, stdout="", stderr=""
+                    )
+
+        completed_process = build_utils.run(
+            f"{trivy_command} image {trivy_scan_args} {image}",
             exit_on_error=exit_on_error,
         )
+        if result_file and completed_process.returncode == 0:
+            os.makedirs(os.path.dirname(result_file), exist_ok=True)
+            open(result_file, "w").close()
+        return completed_process
 
     return subprocess.CompletedProcess(args="", returncode=-1, stdout="", stderr="")
     # TODO: Implement dockl container scan
@@ -109,9 +178,23 @@ def build_docker_image(
     dockerfile: Optional[str] = None,
     additional_build_args: str = "",
     exit_on_error: bool = True,
+    cache_dir: Optional[str] = None,
+    cache_from_previous: bool = False,
+    path: str = "./",
+    force: bool = False,
+    base_images: Optional[List[str]] = None,
 ) -> subprocess.CompletedProcess:
     """Build a docker image from a Dockerfile in the working directory.
 
+    The image is built with BuildKit and contains inline cache metadata, so that it can be used as cache source
+    by later builds once it is pushed. If a `cache_dir` is provided, the image is built via `docker buildx` and the
+    layer cache of all build stages is imported from and exported to this directory.
+
+    Every image is labeled with a fingerprint of the build context (respecting `.dockerignore`), the Dockerfile, and the
+    build arguments. If a local image with the same fingerprint exists, the build is skipped and the tags are added to this image.
+    Changes of remote base images are not part of the fingerprint, use `force` to pull them. The IDs of local base images
+    (e.g. images built in the same build) are part of the fingerprint if they are declared via `base_images`.
+
     Args:
         name (str): Name of the docker image.
         version (str): Version to use as tag.
@@ -119,6 +202,11 @@ def build_docker_image(
         docker_image_prefix (str, optional): The prefix added to the name to indicate an organization on DockerHub or a completely different repository.
         dockerfile (str, optional): Specify a specific Dockerfile. If not specified, the default `Dockerfile` wil be used.
         exit_on_error (bool, optional): If `True`, exit process as soon as an error occurs.
+        cache_dir (str, optional): Directory for the BuildKit layer cache, e.g. `args[FLAG_DOCKER_CACHE_DIR]`. Defaults to `None`.
+        cache_from_previous (bool, optional): Use the image of the latest released version as cache source, e.g. `args[FLAG_DOCKER_CACHE_FROM_PREVIOUS]`. Defaults to `False`.
+        path (str, optional): Build context of the image. Defaults to the working directory.
+        force (bool, optional): Always build the image, even if an image with the same build context exists. Defaults to `False`.
+        base_images (List[str], optional): Local images used in the Dockerfile, the image is rebuilt if any of those images changed.
 
     Returns:
         subprocess.CompletedProcess: Returns the CompletedProcess object of the
@@ -129,23 +217,70 @@ def build_docker_image(
     versioned_tag = get_image_name(name=name, tag=version)
     latest_tag = get_image_name(name=name, tag="latest")
 
-    dockerfile_command = ""
+    base_image_ids = []
+    for base_image in base_images or []:
+        local_image = _get_local_image(base_image)
+        base_image_ids.append(local_image["Id"] if local_image else "")
+    fingerprint = _get_build_context_fingerprint(
+        path, dockerfile, build_args, base_image_ids
+    )
+    image_id = None if force else _get_image_by_fingerprint(fingerprint)
+    if image_id:
+        build_utils.log(
+            f"Skipping build of {versioned_tag}: Image {image_id} was built from the same build context."
+        )
+        return build_utils.run(
+            " && ".join(
+                f"docker tag {image_id} {tag}"
+                for tag in _get_image_tags(name, version, docker_image_prefix)
+            ),
+            exit_on_error=exit_on_error,
+        )
+
+    build_command = ["DOCKER_BUILDKIT=1 docker build"]
+    image_cache_dir = ""
+    if cache_dir:
+        _create_buildx_builder(exit_on_error)
+        image_cache_dir = _get_image_cache_dir(cache_dir, name)
+        build_command = [f"docker buildx build --builder {_BUILDX_BUILDER} --load"]
+        build_command += [
+            f"--{option} {shlex.quote(value)}"
+            for option, value in _get_layer_cache_options(image_cache_dir)
+        ]
+
+    if cache_from_previous:
+        previous_version = build_utils.get_latest_version()
+        if previous_version:
+            build_command.append(
+                "--cache-from "
+                + get_image_name(
+                    name=name, tag=previous_version, image_prefix=docker_image_prefix
+                )
+            )
+        else:
+            build_utils.log("No previous version found to use as cache source.")
+
     if dockerfile:
-        dockerfile_command = " -f " + dockerfile
+        build_command.append("-f " + dockerfile)
 
     completed_process = build_utils.run(
-        "docker build "
-        + dockerfile_command
-        + "-t "
-        + versioned_tag
-        + " -t "
-        + latest_tag
-        + " "
-        + build_args
-        + " ./",
+        " ".join(
+            build_command
+            + [
+                "--build-arg BUILDKIT_INLINE_CACHE=1",
+                f"--label {_FINGERPRINT_LABEL}={fingerprint}",
+                "-t " + versioned_tag,
+                "-t " + latest_tag,
+                build_args,
+                shlex.quote(path),
+            ]
+        ),
         exit_on_error=exit_on_error,
     )
 
+    if image_cache_dir:
+        _replace_layer_cache(image_cache_dir, completed_process.returncode == 0)
+
     if completed_process.returncode > 0:
         build_utils.log(f"Failed to build Docker image {versioned_tag}")
         return completed_process
@@ -162,19 +297,201 @@ def build_docker_image(
     return completed_process
 
 
+def build_docker_images(
+    images: Dict[str, Dict[str, Any]],
+    version: str,
+    docker_image_prefix: str = "",
+    exit_on_error: bool = True,
+    jobs: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    cache_from_previous: bool = False,
+    bake: bool = False,
+) -> List[str]:
+    """Build multiple docker images based on their dependencies.
+
+    An image is only built after all of the images it depends on were built successfully, images that do not depend
+    on each other are built in parallel. Images with the same build definition (path, Dockerfile, and build arguments)
+    are only built once and tagged with all of their names. With `bake`, all images are built via one `docker buildx bake`
+    call. In this case, every image can use the images it depends on in its `FROM` instructions (as `<name>`, `<name>:<version>`,
+    or `<name>:latest`) without building them in an extra step.
+
+    Example:
+    ```
+    build_docker_images(
+        {
+            "base": {"path": "base"},
+            "app": {"path": "app", "depends_on": ["base"]},
+            "app-gpu": {
+                "path": "app",
+                "dockerfile": "Dockerfile.gpu",
+                "depends_on": ["base"],
+            },
+        },
+        version,
+        jobs=args.get(build_utils.FLAG_JOBS),
+    )
+    ```
+
+    Args:
+        images (Dict[str, Dict[str, Any]]): Mapping of the image names to the build definitions of the images. A build definition can contain the build context (`path`), the Dockerfile relative to the build context (`dockerfile`), the build arguments (`build_args`), and the names of the images it depends on (`depends_on`).
+        version (str): Version to use as tag.
+        docker_image_prefix (str, optional): The prefix added to the name to indicate an organization on DockerHub or a completely different repository.
+        exit_on_error (bool, optional): If `True`, exit process if any of the images failed to build.
+        jobs (int, optional): Maximum number of images built at the same time, e.g. `args[build_utils.FLAG_JOBS]`. Defaults to all images.
+        cache_dir (str, optional): Directory for the BuildKit layer cache, e.g. `args[FLAG_DOCKER_CACHE_DIR]`. Defaults to `None`.
+        cache_from_previous (bool, optional): Use the images of the latest released version as cache source, e.g. `args[FLAG_DOCKER_CACHE_FROM_PREVIOUS]`. Defaults to `False`.
+        bake (bool, optional): Build all images via one multi-target `docker buildx bake` definition. Defaults to `False`.
+
+    Returns:
+        List[str]: The names of all images that failed to build.
+    """
+    # Check if docker exists on the system
+    build_utils.command_exists("docker", exit_on_error=exit_on_error)
+
+    try:
+        build_groups = _get_image_build_groups(images)
+    except ValueError as ex:
+        build_utils.log(f"Invalid image definitions: {ex}")
+        if exit_on_error:
+            build_utils.exit_process(build_utils.EXIT_CODE_INVALID_ARGUMENTS)
+        return list(images)
+    group_images = {
+        image: [
+            group_image
+            for group_image in images
+            if _get_image_build_key(images[group_image])
+            == _get_image_build_key(images[image])
+        ]
+        for image in build_groups
+    }
+
+    if bake:
+        completed_process = _bake_docker_images(
+            images,
+            build_groups,
+            group_images,
+            version,
+            docker_image_prefix,
+            cache_dir,
+            cache_from_previous,
+        )
+        failed_images = [] if completed_process.returncode == 0 else list(images)
+    else:
+
+        def build_image_group(image: str) -> bool:
+            definition = images[image]
+            # Buildx builders with the docker-container driver cannot access local images
+            image_cache_dir = cache_dir
+            if cache_dir and build_groups[image]:
+                build_utils.log(
+                    f"Building {image} without layer cache, it depends on local images."
+                    " Use `bake` to build it with layer cache."
+                )
+                image_cache_dir = None
+            completed_process = build_docker_image(
+                image,
+                version,
+                build_args=definition.get("build_args", ""),
+                docker_image_prefix=docker_image_prefix,
+                dockerfile=_get_image_dockerfile(definition),
+                exit_on_error=False,
+                cache_dir=image_cache_dir,
+                cache_from_previous=cache_from_previous,
+                path=definition.get("path", "./"),
+                # Images are rebuilt if any of the images they depend on was rebuilt
+                base_images=[
+                    get_image_name(dependency, version)
+                    for dependency in build_groups[image]
+                ],
+            )
+            if completed_process.returncode != 0:
+                return False
+
+            # Images with the same build definition are only tagged
+            for group_image in group_images[image][1:]:
+                for tag in _get_image_tags(group_image, version, docker_image_prefix):
+                    build_utils.run(
+                        "docker tag " + get_image_name(image, version) + " " + tag,
+                        exit_on_error=False,
+                    )
+            return True
+
+        failed_images = build_utils._run_task_graph(
+            build_groups, build_image_group, jobs=int(jobs or len(build_groups))
+        )
+
+    if failed_images:
+        build_utils.log("Failed to build Docker images: " + ", ".join(failed_images))
+        if exit_on_error:
+            build_utils.exit_process(build_utils.EXIT_CODE_GENERAL)
+    return failed_images
+
+
 def release_docker_image(
-    name: str, version: str, docker_image_prefix: str, exit_on_error: bool = True
+    name: str,
+    version: str,
+    docker_image_prefix: str,
+    exit_on_error: bool = True,
+    retries: int = 3,
+    insecure_registry: bool = False,
 ) -> subprocess.CompletedProcess:
     """Push a Docker image to a repository.
 
+    Tags that already point to the same image digest in the registry are not pushed again (see `release_docker_images`).
+
     Args:
         name (str): The name of the image. Must not be prefixed!
         version (str): The tag used for the image.
         docker_image_prefix (str): The prefix added to the name to indicate an organization on DockerHub or a completely different repository.
         exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
+        retries (int, optional): Number of times a failed push is retried. Defaults to 3.
+        insecure_registry (bool, optional): Allow to access the registry via HTTP, e.g. a local registry. Defaults to `False`.
+
+    Returns:
+        subprocess.CompletedProcess: Returns a CompletedProcess object with the exit code 0 if all tags were released.
+    """
+    failed_images = release_docker_images(
+        [name],
+        version,
+        docker_image_prefix,
+        exit_on_error=exit_on_error,
+        retries=retries,
+        insecure_registry=insecure_registry,
+    )
+    return subprocess.CompletedProcess(
+        args=f"release {name}:{version}",
+        returncode=build_utils.EXIT_CODE_GENERAL if failed_images else 0,
+        stdout="",
+        stderr="",
+    )
+
+
+def release_docker_images(
+    names: List[str],
+    version: str,
+    docker_image_prefix: str,
+    exit_on_error: bool = True,
+    jobs: Optional[int] = None,
+    retries: int = 3,
+    insecure_registry: bool = False,
+) -> List[str]:
+    """Push multiple Docker images to a repository at the same time.
+
+    The versioned tags of all images are pushed first, followed by the `latest` tags if the version has no suffix (pre-release).
+    Before pushing, the digests of the local images are compared with the digests of the tags in the registry and tags
+    that already point to the same image are skipped. Failed pushes are retried with an exponential backoff.
+
+    Args:
+        names (List[str]): The names of the images. Must not be prefixed!
+        version (str): The tag used for the images.
+        docker_image_prefix (str): The prefix added to the name to indicate an organization on DockerHub or a completely different repository.
+        exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
+        jobs (int, optional): Maximum number of pushes running at the same time, e.g. `args[build_utils.FLAG_JOBS]`. Defaults to all tags.
+        retries (int, optional): Number of times a failed push is retried. Defaults to 3.
+        insecure_registry (bool, optional): Allow to access the registry via HTTP, e.g. a local registry. Defaults to `False`.
 
     Returns:
-        subprocess.CompletedProcess: Returns the CompletedProcess object of the `docker push ...` command.
+        List[str]: The names of all images that failed to release.
     """
     # Check if docker exists on the system
     build_utils.command_exists("docker", exit_on_error=exit_on_error)
@@ -185,35 +502,555 @@ def release_docker_image(
         )
         build_utils.exit_process(build_utils.EXIT_CODE_GENERAL)
 
-    versioned_tag = get_image_name(name=name, tag=version)
-    remote_versioned_tag = get_image_name(
-        name=name, tag=version, image_prefix=docker_image_prefix
+    release_tags = [version]
+    # Only push version with latest tag if no suffix is added (pre-release)
+    if "-" not in version:
+        release_tags.append("latest")
+
+    failed_images: List[str] = []
+    for release_tag in release_tags:
+        remote_tags: Dict[str, str] = {}
+        local_digests: Dict[str, Set[str]] = {}
+        for name in names:
+            if name in failed_images:
+                continue
+            local_image = _get_local_image(get_image_name(name=name, tag=version))
+            if not local_image:
+                build_utils.log(f"Docker image {name}:{version} does not exist.")
+                failed_images.append(name)
+                continue
+
+            remote_tag = get_image_name(
+                name=name, tag=release_tag, image_prefix=docker_image_prefix
+            )
+            if remote_tag not in (local_image.get("RepoTags") or []):
+                build_utils.run(
+                    "docker tag " + local_image["Id"] + " " + remote_tag,
+                    exit_on_error=exit_on_error,
+                )
+
+            remote_tags[name] = remote_tag
+            repository = _get_image_repository(remote_tag)
+            local_digests[name] = {
+                repo_digest.split("@")[-1]
+                for repo_digest in local_image.get("RepoDigests") or []
+                if repo_digest.split("@")[0] == repository
+            }
+
+        # Skip the push if the tag already points to the same image in the registry
+        remote_digests = _get_remote_image_digests(
+            list(remote_tags.values()), insecure_registry, jobs
+        )
+        for name, digests in zip(list(remote_tags), remote_digests):
+            if local_digests[name] & digests:
+                build_utils.log(
+                    f"Skipping push of {remote_tags[name]}: Registry has the same image."
+                )
+                del remote_tags[name]
+
+        failed_tags = _push_docker_tags(list(remote_tags.values()), jobs, retries)
+        failed_images += [
+            name
+            for name, remote_tag in remote_tags.items()
+            if remote_tag in failed_tags
+        ]
+
+    if failed_images:
+        build_utils.log(
+            f"Failed to release Docker images: {', '.join(failed_images)} ({version})"
+        )
+        if exit_on_error:
+            build_utils.exit_process(build_utils.EXIT_CODE_GENERAL)
+    return failed_images
+
+
+def _get_image_dockerfile(definition: Dict[str, Any]) -> Optional[str]:
+    """Get the path of the Dockerfile of an image definition relative to the working directory."""
+    if not definition.get("dockerfile"):
+        return None
+    return os.path.join(definition.get("path", "./"), definition["dockerfile"])
+
+
+def _get_image_build_key(definition: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Get the parts of an image definition that determine the built image."""
+    return (
+        os.path.realpath(definition.get("path", "./")),
+        definition.get("dockerfile") or "Dockerfile",
+        definition.get("build_args", ""),
+    )
+
+
+def _get_image_tags(name: str, version: str, docker_image_prefix: str) -> List[str]:
+    """Get the local tags and the remote version tag of an image."""
+    tags = [get_image_name(name, version), get_image_name(name, "latest")]
+    if docker_image_prefix:
+        tags.append(get_image_name(name, version, image_prefix=docker_image_prefix))
+    return tags
+
+
+def _get_image_build_groups(images: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Group the images with the same build definition.
+
+    Raises:
+        ValueError: Raised if an image depends on an unknown image or the dependencies contain a cycle.
+
+    Returns:
+        Dict[str, List[str]]: Mapping of the first image of every group to the first images of the groups it depends on.
+    """
+    group_images: Dict[Tuple[str, str, str], str] = {}
+    image_groups: Dict[str, str] = {}
+    for image, definition in images.items():
+        image_groups[image] = group_images.setdefault(
+            _get_image_build_key(definition), image
+        )
+
+    build_groups: Dict[str, List[str]] = {image: [] for image in group_images.values()}
+    for image, definition in images.items():
+        for dependency in definition.get("depends_on", []):
+            if dependency not in images:
+                raise ValueError(f"{image} depends on unknown image {dependency}.")
+            dependency_group = image_groups[dependency]
+            if dependency_group not in build_groups[image_groups[image]]:
+                build_groups[image_groups[image]].append(dependency_group)
+    build_utils._get_task_order(build_groups)
+    return build_groups
+
+
+def _get_bake_definition(
+    images: Dict[str, Dict[str, Any]],
+    build_groups: Dict[str, List[str]],
+    group_images: Dict[str, List[str]],
+    version: str,
+    docker_image_prefix: str,
+    cache_dir: Optional[str],
+    cache_from_previous: bool,
+) -> Dict[str, Any]:
+    """Get the `docker buildx bake` definition with one target for every group of images."""
+    previous_version = build_utils.get_latest_version() if cache_from_previous else None
+    targets: Dict[str, Dict[str, Any]] = {}
+    for image, dependencies in build_groups.items():
+        definition = images[image]
+        build_args = shlex.split(definition.get("build_args", ""))
+        target: Dict[str, Any] = {
+            "context": definition.get("path", "./"),
+            "dockerfile": definition.get("dockerfile") or "Dockerfile",
+            "tags": [],
+            "args": {"BUILDKIT_INLINE_CACHE": "1"},
+            "labels": {
+                _FINGERPRINT_LABEL: _get_build_context_fingerprint(
+                    definition.get("path", "./"),
+                    _get_image_dockerfile(definition),
+                    definition.get("build_args", ""),
+                )
+            },
+        }
+        for index, build_arg in enumerate(build_args):
+            if build_arg == "--build-arg" and index + 1 < len(build_args):
+                arg_name, _, arg_value = build_args[index + 1].partition("=")
+                target["args"][arg_name] = arg_value
+            elif build_arg.startswith("--build-arg="):
+                arg_name, _, arg_value = build_arg[len("--build-arg=") :].partition("=")
+                target["args"][arg_name] = arg_value
+        if dependencies:
+            # Resolve the images of the dependencies from the targets of the same bake run
+            target["contexts"] = {
+                image_reference: "target:" + dependency
+                for dependency in dependencies
+                for image_reference in [
+                    dependency,
+                    get_image_name(dependency, version),
+                    get_image_name(dependency, "latest"),
+                ]
+            }
+        if cache_dir:
+            for option, value in _get_layer_cache_options(
+                _get_image_cache_dir(cache_dir, image)
+            ):
+                target.setdefault(option, []).append(value)
+        for group_image in group_images[image]:
+            target["tags"] += _get_image_tags(group_image, version, docker_image_prefix)
+            if previous_version:
+                target.setdefault("cache-from", []).append(
+                    get_image_name(
+                        group_image, previous_version, image_prefix=docker_image_prefix
+                    )
+                )
+        targets[image] = target
+
+    return {
+        "group": {"default": {"targets": list(targets)}},
+        "target": targets,
+    }
+
+
+def _bake_docker_images(
+    images: Dict[str, Dict[str, Any]],
+    build_groups: Dict[str, List[str]],
+    group_images: Dict[str, List[str]],
+    version: str,
+    docker_image_prefix: str,
+    cache_dir: Optional[str],
+    cache_from_previous: bool,
+) -> subprocess.CompletedProcess:
+    """Build all images via one `docker buildx bake` call."""
+    bake_definition = _get_bake_definition(
+        images,
+        build_groups,
+        group_images,
+        version,
+        docker_image_prefix,
+        cache_dir,
+        cache_from_previous,
     )
+    builder_args = ""
+    if cache_dir:
+        _create_buildx_builder(exit_on_error=False)
+        builder_args = f" --builder {_BUILDX_BUILDER}"
+    bake_file_descriptor, bake_file = tempfile.mkstemp(
+        prefix="docker-bake-", suffix=".json"
+    )
+    try:
+        with os.fdopen(bake_file_descriptor, "w") as f:
+            json.dump(bake_definition, f, indent=2)
+        completed_process = build_utils.run(
+            f"docker buildx bake{builder_args} --load -f {shlex.quote(bake_file)}",
+            exit_on_error=False,
+        )
+    finally:
+        os.remove(bake_file)
+
+    if cache_dir:
+        for image in build_groups:
+            _replace_layer_cache(
+                _get_image_cache_dir(cache_dir, image),
+                completed_process.returncode == 0,
+            )
+    return completed_process
+
+
+def _create_buildx_builder(exit_on_error: bool) -> None:
+    """Create the buildx builder to export the layer cache, which is not supported by the default docker driver."""
     build_utils.run(
-        "docker tag " + versioned_tag + " " + remote_versioned_tag,
+        f"docker buildx inspect {_BUILDX_BUILDER} > /dev/null 2>&1"
+        f" || docker buildx create --name {_BUILDX_BUILDER} --driver docker-container"
+        # The builder might have been created by a parallel build in the meantime
+        f" || docker buildx inspect {_BUILDX_BUILDER}",
         exit_on_error=exit_on_error,
     )
+
+
+def _get_image_cache_dir(cache_dir: str, name: str) -> str:
+    return os.path.join(str(cache_dir), name.replace("/", "__"))
+
+
+def _get_layer_cache_options(image_cache_dir: str) -> List[Tuple[str, str]]:
+    """Get the options to import the layer cache of an image and to export it into a new directory.
+
+    The cache is exported into a new directory, the existing cache would grow with every build otherwise.
+    """
+    cache_options = []
+    if os.path.isdir(image_cache_dir):
+        cache_options.append(("cache-from", f"type=local,src={image_cache_dir}"))
+    cache_options.append(
+        ("cache-to", f"type=local,dest={image_cache_dir}.new,mode=max")
+    )
+    return cache_options
+
+
+def _replace_layer_cache(image_cache_dir: str, successful: bool) -> None:
+    """Replace the layer cache of an image with the newly exported cache."""
+    new_cache_dir = image_cache_dir + ".new"
+    if successful and os.path.isdir(new_cache_dir):
+        rmtree(image_cache_dir, ignore_errors=True)
+        os.rename(new_cache_dir, image_cache_dir)
+    else:
+        rmtree(new_cache_dir, ignore_errors=True)
+
+
+def _get_local_image(image: str) -> Optional[Dict[str, Any]]:
+    """Get the metadata of a local image (e.g. `Id`, `RepoTags`, and `RepoDigests`)."""
     completed_process = build_utils.run(
-        "docker push " + remote_versioned_tag, exit_on_error=exit_on_error
+        f"docker image inspect {image}",
+        disable_stdout_logging=True,
+        disable_stderr_logging=True,
+        exit_on_error=False,
     )
+    if completed_process.returncode != 0:
+        return None
+    try:
+        return json.loads(str(completed_process.stdout))[0]
+    except (ValueError, IndexError):
+        return None
 
-    if completed_process.returncode > 0:
-        build_utils.log(f"Failed to release Docker image {name}:{version}")
 
-    # Only push version with latest tag if no suffix is added (pre-release)
-    if "-" not in version:
-        remote_latest_tag = get_image_name(
-            name=name, tag="latest", image_prefix=docker_image_prefix
+def _get_image_repository(image: str) -> str:
+    """Get the repository of an image name without the tag, e.g. `localhost:5000/image`."""
+    repository, _, tag = image.rpartition(":")
+    if not repository or "/" in tag:
+        # The colon belongs to the port of the registry
+        return image
+    return repository
+
+
+def _get_remote_image_digests(
+    images: List[str], insecure_registry: bool, jobs: Optional[int]
+) -> List[Set[str]]:
+    """Get the digests of the manifests of all image tags in the registry at the same time."""
+    if not images:
+        return []
+    insecure_args = " --insecure" if insecure_registry else ""
+    completed_processes = build_utils.run_all(
+        [f"docker manifest inspect -v{insecure_args} {image}" for image in images],
+        max_concurrency=jobs or len(images),
+        prefixes=images,
+        exit_on_error=False,
+        disable_stdout_logging=True,
+        disable_stderr_logging=True,
+    )
+
+    remote_digests: List[Set[str]] = []
+    for completed_process in completed_processes:
+        manifests: Any = []
+        # The command fails if the tag does not exist in the registry
+        if completed_process.returncode == 0:
+            try:
+                manifests = json.loads(str(completed_process.stdout))
+            except ValueError:
+                pass
+        # Multi-platform images return a list with one entry per platform
+        if isinstance(manifests, dict):
+            manifests = [manifests]
+        remote_digests.append(
+            {
+                manifest["Descriptor"]["digest"]
+                for manifest in manifests
+                if isinstance(manifest, dict)
+                and "digest" in manifest.get("Descriptor", {})
+            }
         )
+    return remote_digests
 
-        build_utils.log(
-            "Release Docker image with latest tag as well: " + remote_latest_tag
+
+def _push_docker_tags(tags: List[str], jobs: Optional[int], retries: int) -> List[str]:
+    """Push all tags at the same time and retry failed pushes.
+
+    Returns:
+        List[str]: The tags that could not be pushed.
+    """
+    pending_tags = list(tags)
+    for attempt in range(retries + 1):
+        if not pending_tags:
+            break
+        if attempt > 0:
+            retry_delay = _PUSH_RETRY_DELAY * 2 ** (attempt - 1)
+            build_utils.log(
+                f"Retrying push of {len(pending_tags)} tags in {retry_delay}s."
+            )
+            time.sleep(retry_delay)
+
+        completed_processes = build_utils.run_all(
+            ["docker push " + tag for tag in pending_tags],
+            max_concurrency=jobs or len(pending_tags),
+            prefixes=pending_tags,
+            exit_on_error=False,
+            group_output=True,
         )
+        pending_tags = [
+            tag
+            for tag, completed_process in zip(pending_tags, completed_processes)
+            if completed_process.returncode != 0
+        ]
+    return pending_tags
 
-        build_utils.run(
-            "docker tag " + versioned_tag + " " + remote_latest_tag,
-            exit_on_error=exit_on_error,
+
+def _get_trivy_result_key(
+    image: str, trivy_command: str, trivy_scan_args: str
+) -> Optional[str]:
+    """Get the key of a check result based on the image ID, the check options, and the vulnerability database.
+
+    Returns:
+        Optional[str]: The key or `None` if the image ID or the version of the vulnerability database are unknown.
+    """
+    local_image = _get_local_image(image)
+    if not local_image:
+        return None
+
+    # Update the vulnerability database first, otherwise the scan might use a newer version
+    build_utils.run(
+        f"{trivy_command} image --download-db-only",
+        disable_stdout_logging=True,
+        exit_on_error=False,
+    )
+    completed_process = build_utils.run(
+        f"{trivy_command} --version",
+        disable_stdout_logging=True,
+        disable_stderr_logging=True,
+        exit_on_error=False,
+    )
+    trivy_version = [
+        line.strip()
+        for line in str(completed_process.stdout).splitlines()
+        if not line.strip().startswith(("DownloadedAt", "NextUpdate"))
+    ]
+    if completed_process.returncode != 0 or not any(
+        line.startswith("UpdatedAt") for line in trivy_version
+    ):
+        return None
+
+    result_key = hashlib.sha256()
+    result_key.update(local_image["Id"].encode("utf-8"))
+    result_key.update(trivy_scan_args.encode("utf-8"))
+    result_key.update("\n".join(trivy_version).encode("utf-8"))
+    return result_key.hexdigest()
+
+
+def _get_build_context_fingerprint(
+    path: str,
+    dockerfile: Optional[str],
+    build_args: str,
+    base_image_ids: Optional[List[str]] = None,
+) -> str:
+    """Get the fingerprint of the files in the build context, the Dockerfile, the build arguments, and the base image IDs."""
+    fingerprint = hashlib.sha256()
+    fingerprint.update(build_args.encode("utf-8"))
+    for base_image_id in base_image_ids or []:
+        fingerprint.update(base_image_id.encode("utf-8"))
+    # The Dockerfile is always used, even if it is outside of the context or ignored
+    dockerfile = dockerfile or os.path.join(path, "Dockerfile")
+    if os.path.isfile(dockerfile):
+        fingerprint.update(build_utils._get_file_hash(dockerfile).encode("utf-8"))
+    for context_file in _get_build_context_files(path):
+        file_path = os.path.join(path, context_file)
+        file_stat = os.lstat(file_path)
+        if stat.S_ISLNK(file_stat.st_mode):
+            file_hash = "link:" + os.readlink(file_path)
+        else:
+            file_hash = build_utils._get_file_hash(file_path)
+        file_mode = stat.S_IMODE(file_stat.st_mode)
+        fingerprint.update(
+            json.dumps([context_file, file_mode, file_hash]).encode("utf-8")
         )
-        build_utils.run("docker push " + remote_latest_tag, exit_on_error=exit_on_error)
+    return fingerprint.hexdigest()
 
-    return completed_process
+
+def _get_image_by_fingerprint(fingerprint: str) -> Optional[str]:
+    """Get the ID of a local image with the fingerprint label."""
+    completed_process = build_utils.run(
+        f"docker images --filter label={_FINGERPRINT_LABEL}={fingerprint}"
+        " --format '{{.ID}}'",
+        disable_stdout_logging=True,
+        exit_on_error=False,
+    )
+    if completed_process.returncode != 0:
+        return None
+    image_ids = str(completed_process.stdout).split()
+    return image_ids[0] if image_ids else None
+
+
+def _get_build_context_files(path: str) -> List[str]:
+    """Get the paths of all files in the build context that are not excluded via `.dockerignore`, relative to the context."""
+    dockerignore_patterns = _get_dockerignore_patterns(path)
+    # Ignored directories can only be skipped if no files are included again
+    has_exceptions = any(exception for _, exception in dockerignore_patterns)
+
+    context_files = []
+    for root, dirs, files in os.walk(path):
+        relative_root = os.path.relpath(root, path).replace(os.sep, "/")
+        relative_root = "" if relative_root == "." else relative_root + "/"
+        if not has_exceptions:
+            dirs[:] = [
+                dir_name
+                for dir_name in dirs
+                if not _is_dockerignored(
+                    relative_root + dir_name, dockerignore_patterns
+                )
+            ]
+        # Symbolic links to directories are part of the context, but are not followed
+        linked_dirs = [
+            dir_name
+            for dir_name in dirs
+            if os.path.islink(os.path.join(root, dir_name))
+        ]
+        for file_name in files + linked_dirs:
+            if not _is_dockerignored(relative_root + file_name, dockerignore_patterns):
+                context_files.append(relative_root + file_name)
+    return sorted(context_files)
+
+
+def _get_dockerignore_patterns(path: str) -> List[Tuple[Pattern[str], bool]]:
+    """Get the compiled patterns of the `.dockerignore` file in the build context.
+
+    Returns:
+        List[Tuple[Pattern[str], bool]]: The patterns in the order of the file and whether they are exceptions (`!`).
+    """
+    dockerignore_file = os.path.join(path, ".dockerignore")
+    if not os.path.isfile(dockerignore_file):
+        return []
+
+    dockerignore_patterns = []
+    with open(dockerignore_file, "r") as f:
+        for line in f:
+            pattern = line.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            exception = pattern.startswith("!")
+            if exception:
+                pattern = pattern[1:].strip()
+            pattern = posixpath.normpath(pattern.replace(os.sep, "/")).lstrip("/")
+            if not pattern or pattern == ".":
+                continue
+            dockerignore_patterns.append(
+                (re.compile(_get_dockerignore_regex(pattern)), exception)
+            )
+    return dockerignore_patterns
+
+
+def _get_dockerignore_regex(pattern: str) -> str:
+    """Convert a `.dockerignore` pattern into a regular expression, `**` matches any number of directories."""
+    regex = "^"
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "*":
+            if pattern[index + 1 : index + 2] == "*":
+                index += 1
+                # Treat **/ as **
+                if pattern[index + 1 : index + 2] == "/":
+                    index += 1
+                if index + 1 == len(pattern):
+                    regex += ".*"
+                else:
+                    regex += "(.*/)?"
+            else:
+                regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[" and "]" in pattern[index + 1 :]:
+            class_end = pattern.index("]", index + 1)
+            regex += pattern[index : class_end + 1]
+            index = class_end
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            regex += re.escape(pattern[index])
+        else:
+            regex += re.escape(char)
+        index += 1
+    return regex + "$"
+
+
+def _is_dockerignored(
+    file_path: str, dockerignore_patterns: List[Tuple[Pattern[str], bool]]
+) -> bool:
+    """Check if a path is excluded from the build context.
+
+    The last pattern that matches the path or any of its parent directories decides if the path is excluded.
+    """
+    path_parts = file_path.split("/")
+    paths = [file_path] + [
+        "/".join(path_parts[:index]) for index in range(1, len(path_parts))
+    ]
+    ignored = False
+    for regex, exception in dockerignore_patterns:
+        if any(regex.match(path) for path in paths):
+            ignored = not exception
+    return ignored
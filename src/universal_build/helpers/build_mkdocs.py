@@ -4,16 +4,21 @@ import os
 import sys
 
 from universal_build import build_utils
-from universal_build.helpers.build_python import is_pipenv_environment
+from universal_build.helpers.build_python import (
+    get_tool_command,
+    install_pipenv_env,
+    is_pipenv_environment,
+)
 
-_PIPENV_RUN = "pipenv run"
 
-
-def install_build_env(exit_on_error: bool = True) -> None:
+def install_build_env(exit_on_error: bool = True, force: bool = False) -> None:
     """Installs a new virtual environment via pipenv.
 
+    The existing environment is reused if the Pipfile, the Pipfile.lock, the Python version, and the install flags did not change since it was installed.
+
     Args:
         exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
+        force (bool, optional): Always remove and reinstall the environment. Defaults to `False`.
     """
     # Check if pipenv exists
     build_utils.command_exists("pipenv", exit_on_error=exit_on_error)
@@ -24,9 +29,9 @@ def install_build_env(exit_on_error: bool = True) -> None:
             build_utils.exit_process(1)
         return
 
-    build_utils.run("pipenv --rm", exit_on_error=False)
-    build_utils.run(
+    install_pipenv_env(
         f"pipenv install --dev --python={sys.executable} --skip-lock --site-packages",
+        force=force,
         exit_on_error=exit_on_error,
     )
 
@@ -59,14 +64,11 @@ def build_mkdocs(exit_on_error: bool = True) -> None:
         exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
     """
 
-    command_prefix = ""
-    if is_pipenv_environment():
-        command_prefix = _PIPENV_RUN
-    else:
+    if not is_pipenv_environment():
         # Check mkdocs command
         build_utils.command_exists("mkdocs", exit_on_error=exit_on_error)
 
-    build_utils.run(f"{command_prefix} mkdocs build", exit_on_error=exit_on_error)
+    build_utils.run(get_tool_command("mkdocs") + " build", exit_on_error=exit_on_error)
 
 
 def deploy_gh_pages(exit_on_error: bool = True) -> None:
@@ -77,15 +79,12 @@ def deploy_gh_pages(exit_on_error: bool = True) -> None:
     """
     build_utils.log("Deploy documentation to Github pages:")
 
-    command_prefix = ""
-    if is_pipenv_environment():
-        command_prefix = _PIPENV_RUN
-    else:
+    if not is_pipenv_environment():
         # Check mkdocs command
         build_utils.command_exists("mkdocs", exit_on_error=exit_on_error)
 
     build_utils.run(
-        f"{command_prefix} mkdocs gh-deploy --clean",
+        get_tool_command("mkdocs") + " gh-deploy --clean",
         exit_on_error=exit_on_error,
         timeout=120,
     )
@@ -100,14 +99,11 @@ def run_dev_mode(port: int = 8001, exit_on_error: bool = True) -> None:
     """
     build_utils.log(f"Run docs in development mode (http://localhost:{port}):")
 
-    command_prefix = ""
-    if is_pipenv_environment():
-        command_prefix = _PIPENV_RUN
-    else:
+    if not is_pipenv_environment():
         # Check mkdocs command
         build_utils.command_exists("mkdocs", exit_on_error=exit_on_error)
 
     build_utils.run(
-        f"{command_prefix} mkdocs serve --dev-addr 0.0.0.0:{port}",
+        get_tool_command("mkdocs") + f" serve --dev-addr 0.0.0.0:{port}",
         exit_on_error=exit_on_error,
     )
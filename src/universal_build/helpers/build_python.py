@@ -1,16 +1,100 @@
 """Utilities to help building Python libraries."""
 
 import argparse
+import ast
+import hashlib
+import heapq
+import json
 import os
+import platform
 import re
+import shlex
+import sqlite3
 import sys
-from shutil import rmtree
-from typing import List, Optional
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from shutil import copy2, copytree, rmtree, which
+from typing import Any, Dict, List, Optional, Set, Tuple
+from xml.etree import ElementTree
 
 from universal_build import build_utils
 
 FLAG_PYPI_TOKEN = "pypi_token"
 FLAG_PYPI_REPOSITORY = "pypi_repository"
+FLAG_OFFLINE = "offline"
+FLAG_WHEELHOUSE = "wheelhouse"
+FLAG_AFFECTED_ONLY = "affected_only"
+
+# Files that define the packages installed into a pipenv environment
+_PIPENV_ENV_FILES = [
+    "Pipfile",
+    "Pipfile.lock",
+    "setup.py",
+    "setup.cfg",
+    "pyproject.toml",
+]
+
+# Configuration files that can change the results of the code checks
+_CODE_CHECKS_CONFIG_FILES = [
+    "setup.cfg",
+    "pyproject.toml",
+    "tox.ini",
+    ".flake8",
+    ".isort.cfg",
+    ".pydocstyle",
+    ".pydocstylerc",
+]
+_CODE_CHECKS_CACHE_DIR = "_code-checks"
+# Maximum length of a check command with explicit files, the shell command is limited to 128KB
+_MAX_FILE_CHECK_COMMAND_LENGTH = 64 * 1024
+
+# Virtual environments of pipenv environments, resolved once per working directory
+_pipenv_venvs: Dict[str, Optional[str]] = {}
+# File inside of the virtual environment with the key of the installed environment
+_PIPENV_ENV_KEY_FILE = ".universal-build-env"
+
+_PYTHON_INTERPRETERS_CACHE_DIR = "_python-interpreters"
+_WHEELHOUSE_CACHE_DIR = "_wheelhouse"
+# Coverage data file of the test runs inside of the project copies
+_MATRIX_COVERAGE_FILE = ".coverage.matrix"
+
+_BUILD_ENVS_CACHE_DIR = "_build-envs"
+# Default requirements of PEP 517 builds without a [build-system] table
+_DEFAULT_BUILD_REQUIRES = ["setuptools>=40.8.0", "wheel"]
+# Hash of the sources and names of the distributions built into ./dist
+_DISTRIBUTION_BUILD_INFO_FILE = os.path.join("dist", ".build-info.json")
+# Seconds before the first retry of failed uploads, doubled for every further retry
+_UPLOAD_RETRY_DELAY = 5
+
+# Pytest plugin to select tests and to report test results, see `_pytest_plugin.py`
+_PYTEST_PLUGIN_MODULE = "universal_build_pytest_plugin"
+_PYTEST_SELECTION_ENV = "UNIVERSAL_BUILD_TEST_SELECTION"
+_PYTEST_REPORT_ENV = "UNIVERSAL_BUILD_TEST_REPORT"
+_PYTEST_STOP_ENV = "UNIVERSAL_BUILD_TEST_STOP_FILE"
+_TEST_HISTORY_FILE = "test-history.json"
+_TEST_IMPACT_FILE = "test-impact.json"
+# Number of runs in which a failed test is still executed first in fail-fast mode
+_RECENT_FAILURE_RUNS = 10
+# Files that configure the tests, in addition to all conftest.py files
+_TEST_CONFIG_FILES = [
+    "setup.cfg",
+    "pyproject.toml",
+    "pytest.ini",
+    "tox.ini",
+    "Pipfile",
+    "Pipfile.lock",
+]
+# Environment variables that change how pyenv compiles python
+_PYTHON_BUILD_FLAGS = [
+    "PYTHON_CONFIGURE_OPTS",
+    "PYTHON_CFLAGS",
+    "CONFIGURE_OPTS",
+    "CFLAGS",
+    "CPPFLAGS",
+    "LDFLAGS",
+]
 
 
 def parse_arguments(
@@ -43,6 +127,21 @@ def parse_arguments(
         required=False,
         default="",
     )
+    argument_parser.add_argument(
+        "--" + FLAG_OFFLINE.replace("_", "-"),
+        help="Install python environments only from the wheelhouse in the cache directory.",
+        action="store_true",
+    )
+    argument_parser.add_argument(
+        "--" + FLAG_WHEELHOUSE.replace("_", "-"),
+        help="Build the wheels of all locked packages into a wheelhouse in the cache directory and install python environments from there.",
+        action="store_true",
+    )
+    argument_parser.add_argument(
+        "--" + FLAG_AFFECTED_ONLY.replace("_", "-"),
+        help="Only run the tests that are affected by changes since the last test run (requires pytest-cov).",
+        action="store_true",
+    )
 
     return build_utils.parse_arguments(
         input_args=input_args, argument_parser=argument_parser
@@ -55,32 +154,86 @@ def is_pipenv_environment() -> bool:
     if not os.path.exists("Pipfile"):
         return False
 
-    if not build_utils.command_exists("pipenv"):
-        return False
+    return _get_pipenv_venv() is not None
 
-    return (
-        build_utils.run(
-            "pipenv --venv",
-            disable_stderr_logging=True,
-            disable_stdout_logging=True,
-            exit_on_error=False,
-        ).returncode
-        == 0
+
+def get_tool_command(tool: str) -> str:
+    """Get the command to run a tool from the pipenv environment of the current working directory.
+
+    If the tool is installed in the virtual environment, the executable is used directly to avoid the startup time of `pipenv run`.
+    Otherwise, the tool is run via `pipenv run`. Outside of a pipenv environment, the tool is used from the `PATH`.
+
+    Args:
+        tool (str): Name of the tool, e.g. `black`.
+
+    Returns:
+        str: Command to run the tool.
+    """
+    venv = _get_pipenv_venv() if os.path.exists("Pipfile") else None
+    if venv is None:
+        return tool
+
+    tool_path = which(
+        tool, path=os.path.join(venv, "Scripts" if os.name == "nt" else "bin")
     )
+    if tool_path:
+        return shlex.quote(tool_path)
+    return f"pipenv run {tool}"
 
 
-def test_with_py_version(python_version: str, exit_on_error: bool = True) -> None:
+def test_with_py_version(
+    python_version: str, exit_on_error: bool = True, cache_dir: Optional[str] = None
+) -> None:
     """Run pytest in a environment wiht the specified python version.
 
     Args:
         python_version (str): Python version to use inside the virutal environment.
         exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
+        cache_dir (str, optional): Directory to cache the compiled python interpreters, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to `None`.
+    """
+    test_with_py_versions(
+        [python_version], exit_on_error=exit_on_error, cache_dir=cache_dir
+    )
+
+
+def test_with_py_versions(
+    python_versions: List[str],
+    exit_on_error: bool = True,
+    jobs: Optional[int] = None,
+    pytest_args: str = "",
+    cache_dir: Optional[str] = None,
+    max_cache_size: int = 2048,
+    offline: bool = False,
+    wheelhouse: bool = False,
+) -> bool:
+    """Run pytest in environments with the specified python versions at the same time.
+
+    Every python version is tested in its own copy of the project (respecting `.gitignore`) with its own virtual environment,
+    so that the test runs do not interfere with each other or with the environment of the project.
+
+    If a `cache_dir` is provided, the python versions compiled by pyenv are stored in this directory and restored from there
+    if they are not installed. Least recently used interpreters are removed from the cache if it exceeds `max_cache_size`.
+    With `wheelhouse` or `offline`, the environments install all packages of the Pipfile.lock from wheelhouses in the `cache_dir`
+    (see `build_wheelhouse`).
+
+    Args:
+        python_versions (List[str]): Python versions to test with, e.g. `["3.6.12", "3.7.9"]`.
+        exit_on_error (bool, optional): Exit process if the tests fail for any of the python versions. Defaults to `True`.
+        jobs (int, optional): Maximum number of python versions tested at the same time. Defaults to all python versions.
+        pytest_args (str, optional): Additional arguments passed to pytest, e.g. `-m "not slow"`.
+        cache_dir (str, optional): Directory to cache the compiled python interpreters and wheelhouses, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to `None`.
+        max_cache_size (int, optional): Maximum size of all cached python interpreters in megabytes. Defaults to 2048.
+        offline (bool, optional): Install only from the existing wheelhouses without accessing the package index, e.g. `args[FLAG_OFFLINE]`. Defaults to `False`.
+        wheelhouse (bool, optional): Build the missing wheelhouses and install the environments from there, e.g. `args[FLAG_WHEELHOUSE]`. Defaults to `False`.
+
+    Returns:
+        bool: `True` if the tests passed for all python versions.
     """
     if not os.path.exists("Pipfile"):
         build_utils.log(
             "No Pipfile discovered. Testing with specific python version only works with pipenv."
         )
-        return
+        return False
 
     # Check if pyenv command exists
     build_utils.command_exists("pyenv", exit_on_error=exit_on_error)
@@ -88,32 +241,379 @@ def test_with_py_version(python_version: str, exit_on_error: bool = True) -> Non
     # Check if pipenv command exists
     build_utils.command_exists("pipenv", exit_on_error=exit_on_error)
 
-    # Install pipenv environment with specific versio
-    build_utils.run(
-        f"pyenv install --skip-existing {python_version} && pyenv local {python_version}",
-        exit_on_error=exit_on_error,
-    )
-    # Install pipenv environment with specific version
-    build_utils.run(
-        f"pipenv install --dev --python={python_version} --skip-lock",
+    # Install all python versions upfront, already installed versions are skipped
+    versions_dir = os.path.join(_get_pyenv_root(), "versions")
+    if cache_dir:
+        for python_version in python_versions:
+            _restore_python_interpreter(str(cache_dir), versions_dir, python_version)
+
+    build_utils.run_all(
+        [
+            f"pyenv install --skip-existing {python_version}"
+            for python_version in python_versions
+        ],
+        max_concurrency=jobs or len(python_versions),
+        prefixes=python_versions,
         exit_on_error=exit_on_error,
+        group_output=True,
     )
-    # Run pytest in pipenv environment
-    build_utils.run("pipenv run pytest", exit_on_error=exit_on_error)
-    # Remove enviornment
-    build_utils.run("pipenv --rm", exit_on_error=False)
-    # Uninstall pyenv version
-    build_utils.run(
-        f"pyenv local --unset && pyenv uninstall -f {python_version}",
-        exit_on_error=False,
-    )
+
+    if cache_dir:
+        for python_version in python_versions:
+            _save_python_interpreter(str(cache_dir), versions_dir, python_version)
+        _evict_python_interpreters(str(cache_dir), max_cache_size * 1024 * 1024)
+
+    install_envs: List[Dict[str, str]] = [{} for _ in python_versions]
+    if wheelhouse or offline:
+        wheelhouses = _build_wheelhouses(
+            [
+                os.path.join(versions_dir, python_version, "bin", "python")
+                for python_version in python_versions
+            ],
+            cache_dir,
+            offline=offline,
+            exit_on_error=exit_on_error,
+            jobs=jobs,
+        )
+        install_envs = [
+            _get_wheelhouse_env(wheelhouse, offline) for wheelhouse in wheelhouses
+        ]
+
+    project_copies = [
+        _create_project_copy(f"py{python_version}-")
+        for python_version in python_versions
+    ]
+    try:
+        test_commands = [
+            f"cd {shlex.quote(project_copy)} && pyenv local {python_version}"
+            # Create the virtual environment inside of the copy to isolate it
+            " && export PIPENV_VENV_IN_PROJECT=1 PIPENV_IGNORE_VIRTUALENVS=1"
+            f" && export COVERAGE_FILE={_MATRIX_COVERAGE_FILE}"
+            + "".join(
+                f" && export {name}={shlex.quote(value)}"
+                for name, value in install_env.items()
+            )
+            + f" && pipenv install --dev --python={python_version} --skip-lock"
+            f" && pipenv run pytest {pytest_args}"
+            for python_version, project_copy, install_env in zip(
+                python_versions, project_copies, install_envs
+            )
+        ]
+        completed_processes = build_utils.run_all(
+            test_commands,
+            max_concurrency=jobs or len(python_versions),
+            prefixes=python_versions,
+            exit_on_error=False,
+            group_output=True,
+        )
+
+        # Add the coverage data of all python versions to the project coverage data
+        coverage_files = []
+        for python_version, project_copy in zip(python_versions, project_copies):
+            coverage_file = os.path.join(project_copy, _MATRIX_COVERAGE_FILE)
+            if os.path.isfile(coverage_file):
+                _relocate_coverage_data(coverage_file, project_copy, os.getcwd())
+                coverage_files.append(coverage_file)
+        if coverage_files:
+            combine_coverage(coverage_files)
+    finally:
+        for project_copy in project_copies:
+            rmtree(project_copy, ignore_errors=True)
+
+    failed_versions = [
+        python_version
+        for python_version, completed_process in zip(
+            python_versions, completed_processes
+        )
+        if completed_process.returncode != 0
+    ]
+    if failed_versions:
+        build_utils.log(
+            f"Tests failed for python versions: {', '.join(failed_versions)}"
+        )
+        if exit_on_error:
+            build_utils.exit_process(1)
+        return False
+    return True
+
+
+def run_pytest(
+    pytest_args: str = "",
+    shards: int = 1,
+    junit_xml: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    exit_on_error: bool = True,
+    affected_only: bool = False,
+    fail_fast: bool = False,
+) -> bool:
+    """Run pytest, optionally split into multiple shards that are executed as parallel processes.
+
+    The durations of all tests are recorded in every run. The collected tests are distributed over the shards based on
+    these durations, so that all shards need about the same time. The output of every shard is logged as one block
+    and the results of all shards are combined. If pytest-cov is used, every shard writes its own coverage data file
+    and all of them are added to the coverage data of the project (`.coverage`) after the run.
+
+    If `affected_only` is `True`, the files covered by every passed test are recorded via the coverage contexts of pytest-cov
+    (`--cov-context=test`). In later runs, only tests that are new, failed before, or cover a file that changed are executed.
+    The full suite is executed if there is no recorded data, the test configuration (e.g. `setup.cfg` or any `conftest.py`) changed,
+    or any file that is not covered by a test (e.g. test helpers or data files) changed. Partial runs do not create coverage reports.
+    This requires pytest-cov with a configured `--cov` source.
+
+    If `fail_fast` is `True`, tests that failed in one of the last runs are executed first, followed by new tests and
+    all other tests ordered by their duration. The test run stops with the first failure in any of the shards.
+
+    Example:
+    ```
+    build_python.run_pytest('-m "not slow"', shards=os.cpu_count(), junit_xml="test-results.xml")
+    ```
+
+    Args:
+        pytest_args (str, optional): Additional arguments passed to pytest, e.g. `-m "not slow"`.
+        shards (int, optional): Number of parallel pytest processes. Defaults to 1.
+        junit_xml (str, optional): Path to write a JUnit XML report with the results of all shards. Defaults to `None`.
+        cache_dir (str, optional): Directory to store the test durations, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to `.pytest_cache`.
+        exit_on_error (bool, optional): Exit process if any test fails. Defaults to `True`.
+        affected_only (bool, optional): Only run the tests affected by changes since the last run. Defaults to `False`.
+        fail_fast (bool, optional): Run recently failed and fast tests first and stop on the first failure. Defaults to `False`.
+
+    Returns:
+        bool: `True` if the tests of all shards passed.
+    """
+    history_file = _get_test_history_file(cache_dir)
+    test_history = _load_json_file(history_file)
+
+    plugin_dir = tempfile.mkdtemp(prefix="pytest-")
+    try:
+        copy2(
+            os.path.join(os.path.dirname(__file__), "_pytest_plugin.py"),
+            os.path.join(plugin_dir, _PYTEST_PLUGIN_MODULE + ".py"),
+        )
+        pytest_command = (
+            f"PYTHONPATH={shlex.quote(plugin_dir)}${{PYTHONPATH:+:$PYTHONPATH}}"
+            f" {get_tool_command('pytest')} -p {_PYTEST_PLUGIN_MODULE}"
+        )
+        if pytest_args:
+            pytest_command += " " + pytest_args
+
+        test_ids: List[str] = []
+        collection_failed = False
+        if shards > 1 or affected_only or fail_fast:
+            collect_file = os.path.join(plugin_dir, "collected")
+            completed_process = build_utils.run(
+                f"{_PYTEST_REPORT_ENV}={shlex.quote(collect_file + '.json')}"
+                f" COVERAGE_FILE={shlex.quote(collect_file + '.coverage')}"
+                f" {pytest_command} --collect-only -q",
+                disable_stdout_logging=True,
+                exit_on_error=False,
+            )
+            # Exit code 5: no tests were collected
+            if completed_process.returncode not in [0, 5]:
+                # Tests that fail to collect are missing in the collected tests,
+                # the full run reports the collection errors and fails
+                build_utils.log("Test collection failed, running all tests.")
+                collection_failed = True
+            else:
+                test_ids = _load_json_file(collect_file + ".json").get("collected", [])
+        collected_ids = list(test_ids)
+
+        if affected_only:
+            impact_file = os.path.join(os.path.dirname(history_file), _TEST_IMPACT_FILE)
+            test_impact = _load_json_file(impact_file)
+            test_config_hash = _get_test_config_hash()
+            if test_impact.get("config") != test_config_hash:
+                test_impact = {"config": test_config_hash, "tests": {}}
+            # Generated files of the test run are not part of the test inputs
+            impact_excluded_paths = [os.path.dirname(history_file)]
+            if junit_xml:
+                impact_excluded_paths.append(junit_xml)
+
+        if affected_only and not collection_failed:
+            affected_tests = _get_affected_tests(test_ids, test_impact["tests"])
+            if affected_tests is None:
+                build_utils.log("No test impact data available, running all tests.")
+            elif test_impact.get("uncovered") != _get_uncovered_files_digest(
+                test_impact["tests"], impact_excluded_paths
+            ):
+                # Test helpers, fixtures, or data files might affect any test
+                build_utils.log(
+                    "Files that are not covered by any test changed, running all tests."
+                )
+            else:
+                build_utils.log(
+                    f"Running {len(affected_tests)} of {len(test_ids)} tests affected by changes."
+                )
+                if not affected_tests:
+                    return True
+                test_ids = affected_tests
+
+        test_shards: List[Optional[List[str]]] = [None]
+        if test_ids:
+            test_shards = list(
+                _create_test_shards(
+                    test_ids, test_history.get("tests", {}), max(shards, 1)
+                )
+            )
+            if fail_fast:
+                test_shards = [
+                    _order_tests_by_priority(test_shard, test_history)
+                    for test_shard in test_shards
+                    if test_shard is not None
+                ]
+
+        report_files = []
+        junit_files = []
+        coverage_files = []
+        shard_commands = []
+        for index, test_shard in enumerate(test_shards):
+            shard_file = os.path.join(plugin_dir, f"shard-{index}")
+            shard_command = f"{_PYTEST_REPORT_ENV}={shlex.quote(shard_file + '.json')}"
+            if test_shard is not None:
+                with open(shard_file + ".txt", "w") as f:
+                    f.write("\n".join(test_shard))
+                shard_command += (
+                    f" {_PYTEST_SELECTION_ENV}={shlex.quote(shard_file + '.txt')}"
+                )
+            if fail_fast:
+                # The first failure in any shard stops all other shards
+                stop_file = shlex.quote(os.path.join(plugin_dir, "failed"))
+                shard_command += f" {_PYTEST_STOP_ENV}={stop_file}"
+            # Every shard writes its own coverage data, combined after the run
+            coverage_file = shlex.quote(shard_file + ".coverage")
+            shard_command += f" COVERAGE_FILE={coverage_file}"
+            shard_command += " " + pytest_command
+            if junit_xml:
+                shard_command += f" --junitxml={shlex.quote(shard_file + '.xml')}"
+            if affected_only:
+                shard_command += " --cov-context=test"
+                if test_shard is not None and len(test_ids) < len(collected_ids):
+                    # The coverage of a partial run is incomplete
+                    shard_command += " --cov-report= --cov-fail-under=0"
+            if fail_fast:
+                shard_command += " --exitfirst"
+            report_files.append(shard_file + ".json")
+            junit_files.append(shard_file + ".xml")
+            coverage_files.append(shard_file + ".coverage")
+            shard_commands.append(shard_command)
+
+        if len(shard_commands) == 1:
+            completed_processes = [
+                build_utils.run(shard_commands[0], exit_on_error=False)
+            ]
+        else:
+            completed_processes = build_utils.run_all(
+                shard_commands,
+                prefixes=[
+                    f"shard {index + 1}/{len(shard_commands)}"
+                    for index in range(len(shard_commands))
+                ],
+                exit_on_error=False,
+                group_output=True,
+            )
+
+        test_results: Dict[str, Dict[str, Any]] = {}
+        for report_file in report_files:
+            test_results.update(_load_json_file(report_file).get("results", {}))
+        _save_test_history(history_file, test_history, test_results)
+
+        # Only shards running with pytest-cov write coverage data
+        coverage_files = [
+            coverage_file
+            for coverage_file in coverage_files
+            if os.path.isfile(coverage_file)
+        ]
+        if affected_only:
+            _update_test_impact(
+                test_impact, test_results, _get_covered_files(coverage_files)
+            )
+            test_impact["uncovered"] = _get_uncovered_files_digest(
+                test_impact["tests"], impact_excluded_paths
+            )
+            _save_json_file(impact_file, test_impact)
+        if coverage_files:
+            # Add the coverage data of all shards to the project coverage data
+            combine_coverage(coverage_files)
+
+        if junit_xml:
+            # Shards that crashed might not have written a report
+            junit_files = [
+                junit_file for junit_file in junit_files if os.path.isfile(junit_file)
+            ]
+            _merge_junit_reports(junit_files, junit_xml)
+    finally:
+        rmtree(plugin_dir, ignore_errors=True)
+
+    if any(
+        completed_process.returncode != 0 for completed_process in completed_processes
+    ):
+        build_utils.log("Tests failed. Please check the logs and fix the issues.")
+        if exit_on_error:
+            build_utils.exit_process(1)
+        return False
+    return True
+
+
+def combine_coverage(
+    coverage_files: Optional[List[str]] = None,
+    report: bool = False,
+    exit_on_error: bool = False,
+) -> None:
+    """Add coverage data files to the coverage data of the project in the current working directory.
+
+    The data is appended to the existing `.coverage` file, so that the results of multiple test runs (e.g. with different
+    python versions) can be combined step by step. Use `coverage erase` to start with empty coverage data.
+
+    Args:
+        coverage_files (List[str], optional): Coverage data files to add. Defaults to all parallel coverage data files (`.coverage.*`).
+        report (bool, optional): Create the terminal, XML, and HTML reports from the combined coverage data. Defaults to `False`.
+        exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `False`.
+    """
+    if coverage_files is None:
+        coverage_files = sorted(
+            file_name
+            for file_name in os.listdir("./")
+            if file_name.startswith(".coverage.") and os.path.isfile(file_name)
+        )
+
+    coverage_command = get_tool_command("coverage")
+    if coverage_files:
+        build_utils.run(
+            f"{coverage_command} combine --append "
+            + " ".join(shlex.quote(f) for f in coverage_files),
+            exit_on_error=exit_on_error,
+        )
+
+    if report:
+        build_utils.run_all(
+            [
+                f"{coverage_command} report",
+                f"{coverage_command} xml",
+                f"{coverage_command} html",
+            ],
+            prefixes=["coverage report", "coverage xml", "coverage html"],
+            exit_on_error=exit_on_error,
+            group_output=True,
+        )
 
 
-def install_build_env(exit_on_error: bool = True) -> None:
+def install_build_env(
+    exit_on_error: bool = True,
+    force: bool = False,
+    cache_dir: Optional[str] = None,
+    offline: bool = False,
+    wheelhouse: bool = False,
+) -> None:
     """Installs a new virtual environment via pipenv.
 
+    The existing environment is reused if the Pipfile, the Pipfile.lock, the Python version, and the install flags did not change since it was installed.
+
+    With `wheelhouse` or `offline`, all packages of the Pipfile.lock are installed from a wheelhouse in the `cache_dir` (see `build_wheelhouse`).
+
     Args:
         exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
+        force (bool, optional): Always remove and reinstall the environment. Defaults to `False`.
+        cache_dir (str, optional): Directory with the wheelhouses, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to `None`.
+        offline (bool, optional): Install only from the existing wheelhouse without accessing the package index, e.g. `args[FLAG_OFFLINE]`. Defaults to `False`.
+        wheelhouse (bool, optional): Build the wheelhouse if it is missing and install the environment from there, e.g. `args[FLAG_WHEELHOUSE]`. Defaults to `False`.
     """
     if not os.path.exists("Pipfile"):
         build_utils.log("No Pipfile discovered, cannot install pipenv environemnt")
@@ -124,14 +624,94 @@ def install_build_env(exit_on_error: bool = True) -> None:
     # Check if pipenv command exists
     build_utils.command_exists("pipenv", exit_on_error=exit_on_error)
 
-    build_utils.run("pipenv --rm", exit_on_error=False)
-    build_utils.run(
+    install_env: Dict[str, str] = {}
+    if wheelhouse or offline:
+        wheelhouse_dir = _build_wheelhouses(
+            [sys.executable], cache_dir, offline=offline, exit_on_error=exit_on_error
+        )[0]
+        install_env = _get_wheelhouse_env(wheelhouse_dir, offline)
+
+    if install_pipenv_env(
         f"pipenv install --dev --python={sys.executable} --skip-lock",
+        force=force,
         exit_on_error=exit_on_error,
-    )
+        install_env=install_env,
+    ):
+        # Show current environment
+        build_utils.run("pipenv graph", exit_on_error=False)
 
-    # Show current environment
-    build_utils.run("pipenv graph", exit_on_error=False)
+
+def install_pipenv_env(
+    install_command: str,
+    force: bool = False,
+    exit_on_error: bool = True,
+    install_env: Optional[Dict[str, str]] = None,
+) -> bool:
+    """Install the pipenv environment of the current working directory with the install command if it is not up to date.
+
+    The existing environment is reused if the Pipfile, the Pipfile.lock, the packaging files (e.g. `setup.py`), the Python version,
+    and the install command did not change since it was installed.
+
+    Args:
+        install_command (str): The pipenv command to install the environment, e.g. `pipenv install --dev --skip-lock`.
+        force (bool, optional): Always remove and reinstall the environment. Defaults to `False`.
+        exit_on_error (bool, optional): Exit process if the installation fails. Defaults to `True`.
+        install_env (Dict[str, str], optional): Environment variables that are only set for the install command and are not part of the environment key.
+
+    Returns:
+        bool: `True` if the environment was installed, `False` if the existing environment was reused.
+    """
+    env_key = _get_pipenv_env_key(install_command)
+
+    venv = _get_pipenv_venv()
+    if venv and not force:
+        try:
+            with open(os.path.join(venv, _PIPENV_ENV_KEY_FILE), "r") as f:
+                if f.read() == env_key:
+                    build_utils.log(
+                        f"Reusing the pipenv environment in {venv}: Pipfile, Pipfile.lock, and Python version did not change."
+                    )
+                    return False
+        except OSError:
+            pass
+
+    _reset_pipenv_venv()
+    build_utils.run("pipenv --rm", exit_on_error=False)
+    if install_env:
+        install_command = " ".join(
+            [f"{name}={shlex.quote(value)}" for name, value in install_env.items()]
+            + [install_command]
+        )
+    completed_process = build_utils.run(install_command, exit_on_error=exit_on_error)
+    _reset_pipenv_venv()
+
+    venv = _get_pipenv_venv()
+    if completed_process.returncode == 0 and venv:
+        with open(os.path.join(venv, _PIPENV_ENV_KEY_FILE), "w") as f:
+            f.write(env_key)
+    return True
+
+
+def build_wheelhouse(
+    python: str = sys.executable,
+    cache_dir: Optional[str] = None,
+    exit_on_error: bool = True,
+) -> Optional[str]:
+    """Build the wheels of all packages in the Pipfile.lock into a wheelhouse directory.
+
+    A wheelhouse is built once per Pipfile.lock and python interpreter and shared by all components using the same
+    `cache_dir`. Editable, path, and VCS dependencies are not part of the wheelhouse, but the build requirements of the
+    package are, so that the package itself can be installed without the package index.
+
+    Args:
+        python (str, optional): Python interpreter to build the wheels for. Defaults to the current interpreter.
+        cache_dir (str, optional): Directory to store the wheelhouse, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to the temp directory.
+        exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
+
+    Returns:
+        Optional[str]: Directory of the wheelhouse or `None` if it could not be built.
+    """
+    return _build_wheelhouses([python], cache_dir, exit_on_error=exit_on_error)[0]
 
 
 def generate_api_docs(
@@ -147,15 +727,12 @@ def generate_api_docs(
         exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
     """
 
-    command_prefix = ""
-    if is_pipenv_environment():
-        command_prefix = "pipenv run"
-    else:
+    if not is_pipenv_environment():
         # Check lazydocs command
         build_utils.command_exists("lazydocs", exit_on_error=exit_on_error)
 
     build_utils.run(
-        f"{command_prefix} lazydocs --overview-file=README.md"
+        f"{get_tool_command('lazydocs')} --overview-file=README.md"
         f" --src-base-url={github_url}/blob/main {main_package}",
         exit_on_error=exit_on_error,
     )
@@ -166,14 +743,24 @@ def publish_pypi_distribution(
     pypi_user: str = "__token__",
     pypi_repository: Optional[str] = None,
     exit_on_error: bool = True,
+    jobs: Optional[int] = None,
+    retries: int = 3,
+    index_url: Optional[str] = None,
 ) -> None:
     """Publish distribution to pypi.
 
+    Every distribution file in `./dist` is uploaded in its own twine process, all uploads run at the same time.
+    Files whose sha256 hash is already listed on the simple index (PEP 503) of the repository are skipped, so that
+    a failed release can be resumed. Failed uploads are retried with an exponential backoff.
+
     Args:
         pypi_token (str): Token of PyPi repository.
         pypi_user (str, optional): User of PyPi repository. Defaults to "__token__".
         pypi_repository (Optional[str], optional): PyPi repository. If `None` provided, use the production instance.
         exit_on_error (bool, optional): Exit process if an error occurs. Defaults to `True`.
+        jobs (int, optional): Maximum number of uploads running at the same time. Defaults to all distribution files.
+        retries (int, optional): Number of times a failed upload is retried. Defaults to 3.
+        index_url (str, optional): URL of the simple index to check for already uploaded files. Defaults to the simple index of the `pypi_repository`.
     """
     if not pypi_token:
         build_utils.log("PyPI token is required for release (--pypi-token=<TOKEN>)")
@@ -188,11 +775,69 @@ def publish_pypi_distribution(
     # Check twine command
     build_utils.command_exists("twine", exit_on_error=exit_on_error)
 
-    # Publish on pypi
-    build_utils.run(
-        f'twine upload --non-interactive -u "{pypi_user}" -p "{pypi_token}" {pypi_repository_args} dist/*',
-        exit_on_error=exit_on_error,
+    dist_files: List[str] = []
+    if os.path.isdir("dist"):
+        dist_files = sorted(
+            os.path.join("dist", file_name)
+            for file_name in os.listdir("dist")
+            if not file_name.startswith(".")
+            and os.path.isfile(os.path.join("dist", file_name))
+        )
+    if not dist_files:
+        build_utils.log("No distribution files found in ./dist")
+        if exit_on_error:
+            build_utils.exit_process(1)
+        return
+
+    index_url = index_url or _get_simple_index_url(pypi_repository)
+    uploaded_hashes: Dict[str, Set[str]] = {}
+    pending_files = []
+    for dist_file in dist_files:
+        project_name = _get_distribution_project_name(os.path.basename(dist_file))
+        if project_name not in uploaded_hashes:
+            uploaded_hashes[project_name] = _get_uploaded_file_hashes(
+                index_url, project_name
+            )
+        if build_utils._get_file_hash(dist_file) in uploaded_hashes[project_name]:
+            build_utils.log(f"Skipping upload of {dist_file}: Already on the index.")
+            continue
+        pending_files.append(dist_file)
+
+    upload_command = (
+        f'twine upload --non-interactive --skip-existing -u "{pypi_user}"'
+        f' -p "{pypi_token}" {pypi_repository_args}'
     )
+    for attempt in range(retries + 1):
+        if not pending_files:
+            return
+        if attempt > 0:
+            retry_delay = _UPLOAD_RETRY_DELAY * 2 ** (attempt - 1)
+            build_utils.log(
+                f"Retrying upload of {len(pending_files)} files in {retry_delay}s."
+            )
+            time.sleep(retry_delay)
+
+        # Publish on pypi
+        completed_processes = build_utils.run_all(
+            [
+                f"{upload_command} {shlex.quote(dist_file)}"
+                for dist_file in pending_files
+            ],
+            max_concurrency=jobs or len(pending_files),
+            prefixes=[os.path.basename(dist_file) for dist_file in pending_files],
+            exit_on_error=False,
+            group_output=True,
+        )
+        pending_files = [
+            dist_file
+            for dist_file, completed_process in zip(pending_files, completed_processes)
+            if completed_process.returncode != 0
+        ]
+
+    if pending_files:
+        build_utils.log("Failed to upload: " + ", ".join(pending_files))
+        if exit_on_error:
+            build_utils.exit_process(1)
 
 
 def code_checks(
@@ -203,9 +848,17 @@ def code_checks(
     flake8: bool = True,
     safety: bool = False,
     exit_on_error: bool = True,
+    jobs: Optional[int] = None,
+    cache_dir: Optional[str] = None,
 ) -> None:
     """Run linting and style checks.
 
+    All checks are executed concurrently and the output of every check is logged as one block once the check is finished.
+
+    If a `cache_dir` is provided, black, isort, pydocstyle, and flake8 only check files that did not pass the same check before.
+    The results are cached per file based on the file content, the tool version, and the tool configuration.
+    mypy and safety always check the full project, since their results depend on more than a single file.
+
     Args:
         black (bool, optional): Activate black formatting check. Defaults to True.
         isort (bool, optional): Activate isort import sorting check. Defaults to True.
@@ -214,123 +867,938 @@ def code_checks(
         flake8 (bool, optional): Activate flake8 linting check. Defaults to True.
         safety (bool, optional): Activate saftey check via pipenv. Defaults to False.
         exit_on_error (bool, optional): If `True`, exit process as soon as error occures. Defaults to True.
+        jobs (int, optional): Maximum number of checks running at the same time. Defaults to the number of CPUs.
+        cache_dir (str, optional): Directory to cache the results of passed checks, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to `None`.
     """
 
-    command_prefix = ""
-    if is_pipenv_environment():
-        command_prefix = "pipenv run"
-
-    successful: bool = True
+    pipenv_environment = is_pipenv_environment()
+
+    # Mapping of check names to the check commands
+    checks: Dict[str, str] = {}
+    # Cache markers of all files that are checked, written if the check passes
+    check_markers: Dict[str, List[str]] = {}
+    check_keys: Dict[str, str] = {}
+
+    def add_file_check(name: str, tool: str, command: str, path: str) -> None:
+        if not cache_dir:
+            checks[name] = f"{command} {path}"
+            return
+
+        if tool not in check_keys:
+            check_keys[tool] = _get_code_check_key(get_tool_command(tool), command)
+
+        markers = _get_uncached_files(str(cache_dir), check_keys[tool], path)
+        if not markers:
+            build_utils.log(f"Skipping {name}: All files already passed this check.")
+            return
+
+        # Split the files into multiple commands to not exceed the command length limit
+        file_chunks: List[List[str]] = []
+        command_length = 0
+        for file_path in markers:
+            file_arg_length = len(shlex.quote(file_path)) + 1
+            if (
+                not file_chunks
+                or command_length + file_arg_length > _MAX_FILE_CHECK_COMMAND_LENGTH
+            ):
+                file_chunks.append([])
+                command_length = len(command)
+            file_chunks[-1].append(file_path)
+            command_length += file_arg_length
+
+        for index, file_chunk in enumerate(file_chunks):
+            chunk_name = name
+            if len(file_chunks) > 1:
+                chunk_name = f"{name} ({index + 1}/{len(file_chunks)})"
+            checks[chunk_name] = (
+                command + " " + " ".join(shlex.quote(f) for f in file_chunk)
+            )
+            check_markers[chunk_name] = [markers[f] for f in file_chunk]
 
     if black:
-        if not command_prefix:
-            # Check twine command
+        if not pipenv_environment:
+            # Check black command
             build_utils.command_exists("black", exit_on_error=exit_on_error)
 
-        if (
-            build_utils.run(
-                f"{command_prefix} black --check src", exit_on_error=False
-            ).returncode
-            > 0
-        ):
-            successful = False
-
-        if (
-            build_utils.run(
-                f"{command_prefix} black --check tests", exit_on_error=False
-            ).returncode
-            > 0
-        ):
-            successful = False
+        black_command = get_tool_command("black") + " --check"
+        black_exclude = _get_black_exclude()
+        if black_exclude:
+            # black only applies the force-exclude pattern to explicitly passed files
+            black_command += " --force-exclude=" + shlex.quote(black_exclude)
+        add_file_check("black src", "black", black_command, "src")
+        add_file_check("black tests", "black", black_command, "tests")
 
     if isort:
-        if not command_prefix:
-            # Check twine command
+        if not pipenv_environment:
+            # Check isort command
             build_utils.command_exists("isort", exit_on_error=exit_on_error)
 
-        if (
-            build_utils.run(
-                f"{command_prefix} isort --profile black --check-only src",
-                exit_on_error=False,
-            ).returncode
-            > 0
-        ):
-            successful = False
-
-        if (
-            build_utils.run(
-                f"{command_prefix} isort --profile black --check-only tests",
-                exit_on_error=False,
-            ).returncode
-            > 0
-        ):
-            successful = False
+        # Apply the skip configuration also to explicitly passed files
+        isort_command = (
+            get_tool_command("isort") + " --profile black --check-only --filter-files"
+        )
+        add_file_check("isort src", "isort", isort_command, "src")
+        add_file_check("isort tests", "isort", isort_command, "tests")
 
     if pydocstyle:
-        if not command_prefix:
-            # Check twine command
+        if not pipenv_environment:
+            # Check pydocstyle command
             build_utils.command_exists("pydocstyle", exit_on_error=exit_on_error)
 
-        if (
-            build_utils.run(
-                f"{command_prefix} pydocstyle src", exit_on_error=False
-            ).returncode
-            > 0
-        ):
-            successful = False
+        pydocstyle_command = get_tool_command("pydocstyle")
+        add_file_check("pydocstyle src", "pydocstyle", pydocstyle_command, "src")
 
-        # Run linters and checks
     if mypy:
-        if not command_prefix:
-            # Check twine command
+        if not pipenv_environment:
+            # Check mypy command
             build_utils.command_exists("mypy", exit_on_error=exit_on_error)
 
-        if (
-            build_utils.run(
-                f"{command_prefix} mypy src", exit_on_error=False
-            ).returncode
-            > 0
-        ):
-            successful = False
+        checks["mypy src"] = get_tool_command("mypy") + " src"
 
     if flake8:
-        if not command_prefix:
-            # Check twine command
+        if not pipenv_environment:
+            # Check flake8 command
             build_utils.command_exists("flake8", exit_on_error=exit_on_error)
 
-        if (
-            build_utils.run(
-                f"{command_prefix} flake8 --show-source --statistics src",
-                exit_on_error=False,
-            ).returncode
-            > 0
-        ):
-            successful = False
-
-        if (
-            build_utils.run(
-                f"{command_prefix} flake8 --show-source --statistics tests",
-                exit_on_error=False,
-            ).returncode
-            > 0
-        ):
-            successful = False
+        flake8_command = get_tool_command("flake8") + " --show-source --statistics"
+        add_file_check("flake8 src", "flake8", flake8_command, "src")
+        add_file_check("flake8 tests", "flake8", flake8_command, "tests")
 
     if safety:
         # Check pipenv command
         build_utils.command_exists("pipenv", exit_on_error=exit_on_error)
 
         # Check using pipenv (runs safety check)
-        if build_utils.run("pipenv check", exit_on_error=False).returncode > 0:
-            successful = False
+        checks["safety"] = "pipenv check"
 
-    if not successful:
+    # None of the checks depends on another one, so all of them can run at the same time
+    completed_processes = build_utils.run_all(
+        list(checks.values()),
+        max_concurrency=jobs or os.cpu_count(),
+        prefixes=list(checks.keys()),
+        exit_on_error=False,
+        group_output=True,
+    )
+
+    for name, completed_process in zip(checks.keys(), completed_processes):
+        if completed_process.returncode != 0:
+            continue
+        for marker in check_markers.get(name, []):
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            open(marker, "w").close()
+
+    if any(
+        completed_process.returncode != 0 for completed_process in completed_processes
+    ):
         build_utils.log(
             "Code checks (style, linting, safety, ...) failed. Please check the logs and fix the issues."
         )
         build_utils.exit_process(1)
 
 
+def _get_pipenv_venv() -> Optional[str]:
+    """Get the virtual environment of the pipenv environment in the current working directory.
+
+    The path is resolved via `pipenv --venv` only once per working directory.
+    """
+    working_dir = os.path.realpath("./")
+    if working_dir not in _pipenv_venvs:
+        venv = None
+        if build_utils.command_exists("pipenv"):
+            completed_process = build_utils.run(
+                "pipenv --venv",
+                disable_stderr_logging=True,
+                disable_stdout_logging=True,
+                exit_on_error=False,
+            )
+            if completed_process.returncode == 0:
+                venv = str(completed_process.stdout).strip()
+        _pipenv_venvs[working_dir] = venv
+    return _pipenv_venvs[working_dir]
+
+
+def _reset_pipenv_venv() -> None:
+    """Drop the resolved virtual environment of the current working directory, e.g. after it was removed."""
+    _pipenv_venvs.pop(os.path.realpath("./"), None)
+
+
+def _get_pyenv_root() -> str:
+    completed_process = build_utils.run(
+        "pyenv root",
+        disable_stdout_logging=True,
+        disable_stderr_logging=True,
+        exit_on_error=False,
+    )
+    return str(completed_process.stdout).strip() or os.path.expanduser("~/.pyenv")
+
+
+def _get_python_interpreter_dir(
+    cache_dir: str, versions_dir: str, python_version: str
+) -> str:
+    """Get the cache directory of a python version compiled with the current build flags."""
+    interpreter_key = hashlib.sha256()
+    # Compiled interpreters only work on the same platform and in the same location
+    for key_part in [sys.platform, platform.machine(), versions_dir]:
+        interpreter_key.update(key_part.encode("utf-8"))
+    for build_flag in _PYTHON_BUILD_FLAGS:
+        interpreter_key.update(f"{build_flag}={os.getenv(build_flag, '')}".encode())
+    return os.path.join(
+        cache_dir,
+        _PYTHON_INTERPRETERS_CACHE_DIR,
+        f"{python_version}-{interpreter_key.hexdigest()[:16]}",
+    )
+
+
+def _restore_python_interpreter(
+    cache_dir: str, versions_dir: str, python_version: str
+) -> None:
+    """Restore a python version from the interpreter cache, if it is not installed yet."""
+    interpreter_dir = _get_python_interpreter_dir(
+        cache_dir, versions_dir, python_version
+    )
+    target_dir = os.path.join(versions_dir, python_version)
+    if os.path.exists(target_dir) or not os.path.isdir(interpreter_dir):
+        return
+
+    build_utils.log(f"Restoring python {python_version} from {interpreter_dir}")
+    _copy_dir_atomic(interpreter_dir, target_dir)
+    # Mark the interpreter as recently used
+    os.utime(interpreter_dir)
+
+
+def _save_python_interpreter(
+    cache_dir: str, versions_dir: str, python_version: str
+) -> None:
+    """Store an installed python version in the interpreter cache, if it is not cached yet."""
+    interpreter_dir = _get_python_interpreter_dir(
+        cache_dir, versions_dir, python_version
+    )
+    source_dir = os.path.join(versions_dir, python_version)
+    if os.path.isdir(interpreter_dir):
+        os.utime(interpreter_dir)
+        return
+    if not os.path.isdir(source_dir):
+        return
+
+    build_utils.log(f"Caching python {python_version} in {interpreter_dir}")
+    _copy_dir_atomic(source_dir, interpreter_dir)
+
+
+def _evict_python_interpreters(cache_dir: str, max_cache_size: int) -> None:
+    """Remove the least recently used interpreters until the interpreter cache is smaller than `max_cache_size` bytes."""
+    interpreters_dir = os.path.join(cache_dir, _PYTHON_INTERPRETERS_CACHE_DIR)
+    if not os.path.isdir(interpreters_dir):
+        return
+
+    interpreters = []
+    for interpreter in os.listdir(interpreters_dir):
+        interpreter_dir = os.path.join(interpreters_dir, interpreter)
+        if interpreter.startswith(".") or not os.path.isdir(interpreter_dir):
+            continue
+        interpreters.append(
+            (
+                os.path.getmtime(interpreter_dir),
+                _get_dir_size(interpreter_dir),
+                interpreter_dir,
+            )
+        )
+
+    cache_size = sum(interpreter[1] for interpreter in interpreters)
+    for _, interpreter_size, interpreter_dir in sorted(interpreters):
+        if cache_size <= max_cache_size:
+            break
+        build_utils.log(f"Removing least recently used python: {interpreter_dir}")
+        rmtree(interpreter_dir, ignore_errors=True)
+        cache_size -= interpreter_size
+
+
+def _copy_dir_atomic(source_dir: str, target_dir: str) -> None:
+    """Copy a directory via a temporary directory next to the target, so that the target is never incomplete."""
+    target_parent_dir = os.path.dirname(target_dir)
+    os.makedirs(target_parent_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=target_parent_dir)
+    temp_target_dir = os.path.join(temp_dir, os.path.basename(target_dir))
+    try:
+        copytree(source_dir, temp_target_dir, symlinks=True)
+        os.rename(temp_target_dir, target_dir)
+    except OSError:
+        # Another build might have created the target in the meantime
+        if not os.path.isdir(target_dir):
+            raise
+    finally:
+        rmtree(temp_dir, ignore_errors=True)
+
+
+def _get_dir_size(path: str) -> int:
+    dir_size = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            dir_size += os.lstat(os.path.join(root, file_name)).st_size
+    return dir_size
+
+
+def _relocate_coverage_data(
+    coverage_file: str, source_dir: str, target_dir: str
+) -> None:
+    """Change the paths of all measured files in the source directory to the target directory."""
+    source_paths = {os.path.abspath(source_dir), os.path.realpath(source_dir)}
+    try:
+        connection = sqlite3.connect(coverage_file)
+        try:
+            with connection:
+                measured_files = connection.execute("SELECT id, path FROM file")
+                for file_id, file_path in measured_files.fetchall():
+                    for source_path in source_paths:
+                        if file_path.startswith(source_path + os.sep):
+                            connection.execute(
+                                "UPDATE file SET path = ? WHERE id = ?",
+                                (target_dir + file_path[len(source_path) :], file_id),
+                            )
+                            break
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        build_utils.log(f"Failed to relocate coverage data in {coverage_file}: {e}")
+
+
+def _build_wheelhouses(
+    pythons: List[str],
+    cache_dir: Optional[str],
+    offline: bool = False,
+    exit_on_error: bool = True,
+    jobs: Optional[int] = None,
+) -> List[Optional[str]]:
+    """Build the wheelhouses for all python interpreters at the same time, existing wheelhouses are reused."""
+    if not os.path.isfile("Pipfile.lock"):
+        build_utils.log("No Pipfile.lock discovered, cannot build wheelhouse.")
+        if offline and exit_on_error:
+            build_utils.exit_process(1)
+        return [None for _ in pythons]
+
+    wheelhouses_dir = os.path.join(
+        str(cache_dir) if cache_dir else tempfile.gettempdir(), _WHEELHOUSE_CACHE_DIR
+    )
+    wheelhouses = [
+        os.path.join(wheelhouses_dir, _get_wheelhouse_key(python)[:16])
+        for python in pythons
+    ]
+    missing_wheelhouses = [
+        (python, wheelhouse)
+        for python, wheelhouse in zip(pythons, wheelhouses)
+        if not os.path.isdir(wheelhouse)
+    ]
+    if not missing_wheelhouses:
+        return list(wheelhouses)
+    if offline:
+        build_utils.log(
+            "Wheelhouse is missing for offline install: "
+            + ", ".join(python for python, _ in missing_wheelhouses)
+        )
+        if exit_on_error:
+            build_utils.exit_process(1)
+        return [
+            None if (python, wheelhouse) in missing_wheelhouses else wheelhouse
+            for python, wheelhouse in zip(pythons, wheelhouses)
+        ]
+
+    os.makedirs(wheelhouses_dir, exist_ok=True)
+    requirements_file = os.path.join(
+        tempfile.mkdtemp(prefix="wheelhouse-"), "requirements.txt"
+    )
+    with open(requirements_file, "w") as f:
+        f.write("\n".join(_get_locked_requirements() + _get_build_requires()) + "\n")
+
+    # Wheels are built into temporary directories next to the wheelhouses,
+    # so that a wheelhouse is never incomplete
+    temp_dirs = [
+        tempfile.mkdtemp(prefix=".tmp-", dir=wheelhouses_dir)
+        for _ in missing_wheelhouses
+    ]
+    try:
+        completed_processes = build_utils.run_all(
+            [
+                f"{shlex.quote(python)} -m pip wheel --wheel-dir {shlex.quote(temp_dir)}"
+                f" -r {shlex.quote(requirements_file)}"
+                for (python, _), temp_dir in zip(missing_wheelhouses, temp_dirs)
+            ],
+            max_concurrency=jobs or len(missing_wheelhouses),
+            prefixes=[python for python, _ in missing_wheelhouses],
+            exit_on_error=False,
+            group_output=True,
+        )
+        failed_wheelhouses = set()
+        for (python, wheelhouse), temp_dir, completed_process in zip(
+            missing_wheelhouses, temp_dirs, completed_processes
+        ):
+            if completed_process.returncode != 0:
+                build_utils.log(f"Failed to build the wheelhouse for {python}.")
+                failed_wheelhouses.add(wheelhouse)
+                continue
+            try:
+                os.rename(temp_dir, wheelhouse)
+            except OSError:
+                # Another build might have created the wheelhouse in the meantime
+                if not os.path.isdir(wheelhouse):
+                    raise
+    finally:
+        rmtree(os.path.dirname(requirements_file), ignore_errors=True)
+        for temp_dir in temp_dirs:
+            rmtree(temp_dir, ignore_errors=True)
+
+    if failed_wheelhouses and exit_on_error:
+        build_utils.exit_process(1)
+    return [
+        None if wheelhouse in failed_wheelhouses else wheelhouse
+        for wheelhouse in wheelhouses
+    ]
+
+
+def _get_wheelhouse_key(python: str) -> str:
+    """Get the key of a wheelhouse based on the Pipfile.lock, the build requirements, and the python interpreter."""
+    wheelhouse_key = hashlib.sha256()
+    wheelhouse_key.update(build_utils._get_file_hash("Pipfile.lock").encode("utf-8"))
+    wheelhouse_key.update(json.dumps(_get_build_requires()).encode("utf-8"))
+    # The wheels depend on the version, the ABI, and the platform of the interpreter
+    python_info = build_utils.run(
+        f"{shlex.quote(python)} -c"
+        " 'import sys, sysconfig; print(sys.version); print(sysconfig.get_platform())'",
+        disable_stdout_logging=True,
+        exit_on_error=False,
+    )
+    wheelhouse_key.update(python.encode("utf-8"))
+    wheelhouse_key.update(str(python_info.stdout).encode("utf-8"))
+    return wheelhouse_key.hexdigest()
+
+
+def _get_locked_requirements() -> List[str]:
+    """Get the pinned requirements of all packages in the Pipfile.lock, without editable, path, and VCS dependencies."""
+    pipfile_lock = _load_json_file("Pipfile.lock")
+    requirements: Dict[str, str] = {}
+    for section in ["default", "develop"]:
+        for package_name, package in pipfile_lock.get(section, {}).items():
+            if not isinstance(package, dict) or "version" not in package:
+                continue
+            requirement = package_name + package["version"]
+            if package.get("markers"):
+                requirement += "; " + package["markers"]
+            requirements[package_name] = requirement
+    return sorted(requirements.values())
+
+
+def _get_wheelhouse_env(wheelhouse: Optional[str], offline: bool) -> Dict[str, str]:
+    """Get the environment variables to install packages with pip from the wheelhouse."""
+    install_env: Dict[str, str] = {}
+    if wheelhouse:
+        install_env["PIP_FIND_LINKS"] = wheelhouse
+    if offline:
+        install_env["PIP_NO_INDEX"] = "1"
+    return install_env
+
+
+def _create_project_copy(prefix: str, include_ignored: bool = False) -> str:
+    """Copy all files of the current working directory (respecting `.gitignore`) into a new temporary directory.
+
+    With `include_ignored`, all files of the distributions are copied, also the ones ignored by git (see `_get_distribution_files`).
+    """
+    project_copy = tempfile.mkdtemp(prefix=prefix)
+    if include_ignored:
+        input_files = _get_distribution_files()
+    else:
+        input_files = build_utils._get_input_files("./")
+
+    for input_file in input_files:
+        target_file = os.path.join(project_copy, input_file)
+        os.makedirs(os.path.dirname(target_file), exist_ok=True)
+        copy2(input_file, target_file, follow_symlinks=False)
+    return project_copy
+
+
+def _get_distribution_files() -> List[str]:
+    """Get all files in the current working directory that can be part of the distributions, also the ones ignored by git.
+
+    Previous build outputs (`build`, `dist`, and `*.egg-info`), the git repository, and python caches are excluded.
+    Symbolic links to directories are returned as files.
+    """
+    distribution_files: List[str] = []
+    for root, dirs, files in os.walk("."):
+        included_dirs = []
+        for directory in sorted(dirs):
+            if (
+                (root == "." and directory in ["build", "dist"])
+                or directory.endswith(".egg-info")
+                or directory in [".git", "__pycache__"]
+            ):
+                continue
+            if os.path.islink(os.path.join(root, directory)):
+                files.append(directory)
+            else:
+                included_dirs.append(directory)
+        dirs[:] = included_dirs
+        for file_name in sorted(files):
+            distribution_files.append(os.path.normpath(os.path.join(root, file_name)))
+    return distribution_files
+
+
+def _get_pipenv_env_key(install_command: str) -> str:
+    """Get the key of a pipenv environment based on the Pipfile, Pipfile.lock, the packaging files, the Python version, and the install command."""
+    env_key = hashlib.sha256()
+    env_key.update(install_command.encode("utf-8"))
+    env_key.update(sys.version.encode("utf-8"))
+    # The Pipfile can install the local package, which declares its dependencies in the packaging files
+    for pipenv_file in _PIPENV_ENV_FILES:
+        if os.path.isfile(pipenv_file):
+            env_key.update(pipenv_file.encode("utf-8"))
+            env_key.update(build_utils._get_file_hash(pipenv_file).encode("utf-8"))
+    return env_key.hexdigest()
+
+
+def _get_code_check_key(tool_command: str, command: str) -> str:
+    """Get the part of the cache key that covers the tool, its version, and its configuration."""
+    check_key = hashlib.sha256()
+    check_key.update(command.encode("utf-8"))
+
+    tool_version = build_utils.run(
+        f"{tool_command} --version",
+        disable_stdout_logging=True,
+        disable_stderr_logging=True,
+        exit_on_error=False,
+    )
+    check_key.update(str(tool_version.stdout).encode("utf-8"))
+
+    for config_file in _CODE_CHECKS_CONFIG_FILES:
+        if os.path.isfile(config_file):
+            check_key.update(config_file.encode("utf-8"))
+            check_key.update(build_utils._get_file_hash(config_file).encode("utf-8"))
+    return check_key.hexdigest()
+
+
+def _get_black_exclude() -> Optional[str]:
+    """Get the exclude pattern of the black configuration in the pyproject.toml, if no force-exclude pattern is configured."""
+    if not os.path.isfile("pyproject.toml"):
+        return None
+    with open("pyproject.toml", "r", encoding="utf-8") as f:
+        pyproject = f.read()
+
+    black_config = re.search(
+        r"^\[tool\.black\][ \t]*$(.*?)(?=^\[|\Z)", pyproject, re.MULTILINE | re.DOTALL
+    )
+    if not black_config or re.search(
+        r"^force[-_]exclude\s*=", black_config.group(1), re.MULTILINE
+    ):
+        return None
+
+    exclude = re.search(
+        r"^exclude\s*=\s*('{3}|\"{3}|'|\")(.*?)\1",
+        black_config.group(1),
+        re.MULTILINE | re.DOTALL,
+    )
+    return exclude.group(2) if exclude else None
+
+
+def _get_uncached_files(cache_dir: str, check_key: str, path: str) -> Dict[str, str]:
+    """Get all Python files in the path without a cached passed check, mapped to their cache markers."""
+    uncached_files: Dict[str, str] = {}
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(
+            d for d in dirs if not d.startswith(".") and d != "__pycache__"
+        )
+        for file_name in sorted(files):
+            if not file_name.endswith((".py", ".pyi")):
+                continue
+            file_path = os.path.join(root, file_name)
+            marker_key = hashlib.sha256(
+                "\0".join(
+                    [check_key, file_path, build_utils._get_file_hash(file_path)]
+                ).encode("utf-8")
+            ).hexdigest()
+            marker = os.path.join(
+                cache_dir, _CODE_CHECKS_CACHE_DIR, marker_key[:2], marker_key
+            )
+            if not os.path.exists(marker):
+                uncached_files[file_path] = marker
+    return uncached_files
+
+
+def _get_test_history_file(cache_dir: Optional[str]) -> str:
+    """Get the file with the recorded test results of the component in the current working directory."""
+    if cache_dir:
+        return os.path.join(
+            build_utils._get_cache_entry_dir(str(cache_dir), "./", "pytest"),
+            _TEST_HISTORY_FILE,
+        )
+    return os.path.join(".pytest_cache", "universal-build", _TEST_HISTORY_FILE)
+
+
+def _load_json_file(file_path: str) -> Dict[str, Any]:
+    try:
+        with open(file_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_test_history(
+    history_file: str,
+    test_history: Dict[str, Any],
+    test_results: Dict[str, Dict[str, Any]],
+) -> None:
+    """Update the recorded test results with the results of the latest test run."""
+    if not test_results:
+        return
+
+    test_run = test_history.get("runs", 0) + 1
+    test_history["runs"] = test_run
+    tests = test_history.setdefault("tests", {})
+    for test_id, test_result in test_results.items():
+        recorded_test = tests.setdefault(test_id, {})
+        recorded_test["duration"] = round(test_result["duration"], 4)
+        if test_result["outcome"] == "failed":
+            recorded_test["last_failure"] = test_run
+    _save_json_file(history_file, test_history)
+
+
+def _order_tests_by_priority(
+    test_ids: List[str], test_history: Dict[str, Any]
+) -> List[str]:
+    """Order the tests to find failures as early as possible.
+
+    Tests that failed in one of the recent runs come first (latest failure first), followed by new tests and all other tests
+    ordered by their duration (fastest first).
+    """
+    test_run = test_history.get("runs", 0)
+    recorded_tests = test_history.get("tests", {})
+
+    def get_priority(test_id: str) -> Tuple[int, int, float]:
+        if test_id not in recorded_tests:
+            return (1, 0, 0.0)
+        recorded_test = recorded_tests[test_id]
+        last_failure = recorded_test.get("last_failure", 0)
+        if last_failure and test_run - last_failure < _RECENT_FAILURE_RUNS:
+            return (0, -last_failure, recorded_test.get("duration", 0.0))
+        return (2, 0, recorded_test.get("duration", 0.0))
+
+    return sorted(test_ids, key=get_priority)
+
+
+def _save_json_file(file_path: str, data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    # Write to a temporary file first to never leave an incomplete file behind
+    temp_file = file_path + ".tmp"
+    with open(temp_file, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(temp_file, file_path)
+
+
+def _get_test_config_hash() -> str:
+    """Get a hash of all files that configure the tests, changes to these files might affect all tests."""
+    config_hash = hashlib.sha256()
+    for input_file in build_utils._get_input_files("./"):
+        if (
+            input_file in _TEST_CONFIG_FILES
+            or os.path.basename(input_file) == "conftest.py"
+        ):
+            config_hash.update(input_file.encode("utf-8"))
+            config_hash.update(build_utils._get_file_hash(input_file).encode("utf-8"))
+    return config_hash.hexdigest()
+
+
+def _get_files_digest(files: List[str], file_hashes: Dict[str, str]) -> str:
+    """Get a digest of the current content of the files, the file hashes are cached in `file_hashes`."""
+    files_digest = hashlib.sha256()
+    for file_path in sorted(files):
+        if file_path not in file_hashes:
+            file_hashes[file_path] = (
+                build_utils._get_file_hash(file_path)
+                if os.path.isfile(file_path)
+                else ""
+            )
+        files_digest.update(f"{file_path}:{file_hashes[file_path]}\n".encode("utf-8"))
+    return files_digest.hexdigest()
+
+
+def _get_affected_tests(
+    test_ids: List[str], recorded_tests: Dict[str, Dict[str, Any]]
+) -> Optional[List[str]]:
+    """Get all tests that are new, failed in the last run, or cover a file that changed since the last run.
+
+    Returns `None` if there is no recorded data and all tests need to be executed.
+    """
+    if not recorded_tests or not test_ids:
+        return None
+
+    file_hashes: Dict[str, str] = {}
+    return [
+        test_id
+        for test_id in test_ids
+        if test_id not in recorded_tests
+        or _get_files_digest(recorded_tests[test_id]["files"], file_hashes)
+        != recorded_tests[test_id]["digest"]
+    ]
+
+
+def _get_uncovered_files_digest(
+    recorded_tests: Dict[str, Dict[str, Any]], excluded_paths: List[str]
+) -> str:
+    """Get a digest of all input files of the project that are not covered by any of the recorded tests.
+
+    Those are for example test helpers, fixtures, data files, or modules outside of the `--cov` source.
+    """
+    covered_files: Set[str] = set()
+    for recorded_test in recorded_tests.values():
+        covered_files.update(recorded_test["files"])
+    excluded_paths = [os.path.relpath(path) for path in excluded_paths]
+
+    uncovered_files = [
+        input_file
+        for input_file in build_utils._get_input_files("./")
+        if input_file not in covered_files
+        # Coverage data files and python caches change with every test run
+        and not os.path.basename(input_file).startswith(".coverage")
+        and "__pycache__" not in input_file.split(os.sep)
+        and not any(
+            input_file == excluded_path or input_file.startswith(excluded_path + os.sep)
+            for excluded_path in excluded_paths
+        )
+    ]
+    return _get_files_digest(uncovered_files, {})
+
+
+def _get_covered_files(coverage_files: List[str]) -> Dict[str, Set[str]]:
+    """Get the files covered by every test from the coverage contexts (`--cov-context=test`) of the coverage data files."""
+    covered_files: Dict[str, Set[str]] = {}
+    for coverage_file in coverage_files:
+        try:
+            connection = sqlite3.connect(coverage_file)
+            try:
+                rows = connection.execute(
+                    "SELECT file.path, context.context FROM line_bits"
+                    " JOIN file ON file.id = line_bits.file_id"
+                    " JOIN context ON context.id = line_bits.context_id"
+                    " UNION SELECT file.path, context.context FROM arc"
+                    " JOIN file ON file.id = arc.file_id"
+                    " JOIN context ON context.id = arc.context_id"
+                ).fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            continue
+
+        for file_path, context in rows:
+            # pytest-cov uses the node ID and the test phase, e.g. `test_a.py::test|run`
+            test_id = context.rsplit("|", 1)[0]
+            file_path = os.path.relpath(file_path)
+            if test_id and not file_path.startswith(".."):
+                covered_files.setdefault(test_id, set()).add(file_path)
+    return covered_files
+
+
+def _update_test_impact(
+    test_impact: Dict[str, Any],
+    test_results: Dict[str, Dict[str, Any]],
+    covered_files: Dict[str, Set[str]],
+) -> None:
+    """Record the covered files of all passed tests, failed tests are always executed in the next run."""
+    if test_results and not covered_files:
+        build_utils.log(
+            "No coverage contexts found. Selecting affected tests requires pytest-cov with a configured --cov source."
+        )
+
+    recorded_tests = test_impact["tests"]
+    file_hashes: Dict[str, str] = {}
+    for test_id, test_result in test_results.items():
+        if test_result["outcome"] == "failed" or not covered_files:
+            recorded_tests.pop(test_id, None)
+            continue
+        # The test module is usually not part of the measured source files
+        test_files = sorted(
+            covered_files.get(test_id, set()) | {test_id.split("::")[0]}
+        )
+        recorded_tests[test_id] = {
+            "files": test_files,
+            "digest": _get_files_digest(test_files, file_hashes),
+        }
+
+
+def _create_test_shards(
+    test_ids: List[str], recorded_tests: Dict[str, Dict[str, Any]], shards: int
+) -> List[List[str]]:
+    """Distribute the tests over the shards, so that all shards need about the same time.
+
+    The longest tests are assigned first, each to the shard with the lowest total duration (longest processing time first).
+    Tests without a recorded duration are assumed to take the average duration. Within a shard, the collection order is kept.
+    """
+    recorded_durations = [
+        recorded_tests[test_id]["duration"]
+        for test_id in test_ids
+        if "duration" in recorded_tests.get(test_id, {})
+    ]
+    default_duration = (
+        sum(recorded_durations) / len(recorded_durations) if recorded_durations else 1.0
+    )
+    durations = {
+        test_id: recorded_tests.get(test_id, {}).get("duration", default_duration)
+        for test_id in test_ids
+    }
+
+    shard_durations = [(0.0, index) for index in range(min(shards, len(test_ids)))]
+    shard_tests: List[List[str]] = [[] for _ in shard_durations]
+    for test_id in sorted(test_ids, key=lambda test_id: -durations[test_id]):
+        shard_duration, index = heapq.heappop(shard_durations)
+        shard_tests[index].append(test_id)
+        heapq.heappush(shard_durations, (shard_duration + durations[test_id], index))
+
+    test_positions = {test_id: position for position, test_id in enumerate(test_ids)}
+    return [
+        sorted(tests, key=lambda test_id: test_positions[test_id])
+        for tests in shard_tests
+    ]
+
+
+def _merge_junit_reports(junit_files: List[str], junit_xml: str) -> None:
+    """Merge the JUnit XML reports of all shards into a single test suite."""
+    merged_suite = ElementTree.Element("testsuite", {"name": "pytest"})
+    counters = {"errors": 0, "failures": 0, "skipped": 0, "tests": 0}
+    suite_time = 0.0
+    for junit_file in junit_files:
+        for test_suite in ElementTree.parse(junit_file).getroot().iter("testsuite"):
+            for counter in counters:
+                counters[counter] += int(test_suite.get(counter, 0))
+            suite_time += float(test_suite.get("time", 0))
+            merged_suite.extend(list(test_suite))
+
+    for counter, value in counters.items():
+        merged_suite.set(counter, str(value))
+    merged_suite.set("time", f"{suite_time:.3f}")
+
+    junit_dir = os.path.dirname(junit_xml)
+    if junit_dir:
+        os.makedirs(junit_dir, exist_ok=True)
+    test_suites = ElementTree.Element("testsuites")
+    test_suites.append(merged_suite)
+    ElementTree.ElementTree(test_suites).write(
+        junit_xml, encoding="utf-8", xml_declaration=True
+    )
+
+
+def _get_build_requires() -> List[str]:
+    """Get the requirements of the `[build-system]` table in the `pyproject.toml`."""
+    build_requires = list(_DEFAULT_BUILD_REQUIRES)
+    if not os.path.isfile("pyproject.toml"):
+        return build_requires
+
+    with open("pyproject.toml", "r") as f:
+        pyproject = f.read()
+    build_system = re.search(
+        r"^\[build-system\][ \t]*$(.*?)(?=^\[|\Z)", pyproject, re.M | re.S
+    )
+    if not build_system:
+        return build_requires
+
+    requires = re.search(
+        r"^requires\s*=\s*(\[.*?\])", build_system.group(1), re.M | re.S
+    )
+    if requires:
+        try:
+            # Arrays of strings in TOML can be evaluated as python lists
+            build_requires = [str(r) for r in ast.literal_eval(requires.group(1))]
+        except (ValueError, SyntaxError):
+            build_utils.log("Failed to parse the build requirements in pyproject.toml")
+    return build_requires
+
+
+def _get_distribution_source_hash(build_env_key: str) -> str:
+    """Get a hash of all package sources in the current working directory, ignoring previous build outputs.
+
+    The hash covers the same files that are copied to build the wheel, also the ones ignored by git.
+    """
+    source_hash = hashlib.sha256()
+    source_hash.update(build_env_key.encode("utf-8"))
+    for input_file in _get_distribution_files():
+        if os.path.islink(input_file):
+            file_hash = "link:" + os.readlink(input_file)
+        else:
+            file_hash = build_utils._get_file_hash(input_file)
+        source_hash.update(input_file.encode("utf-8"))
+        source_hash.update(file_hash.encode("utf-8"))
+    return source_hash.hexdigest()
+
+
+def _get_build_env(build_env: str, build_requires: List[str]) -> Optional[str]:
+    """Get the python executable of the build environment, the environment is created if it does not exist.
+
+    Returns `None` if the build environment cannot be created.
+    """
+    bin_dir = "Scripts" if os.name == "nt" else "bin"
+    build_python = os.path.join(build_env, bin_dir, "python")
+    if os.path.exists(build_python):
+        return build_python
+
+    build_utils.log(f"Creating build environment in {build_env}")
+    os.makedirs(os.path.dirname(build_env), exist_ok=True)
+    # Create the environment next to the target to never use an incomplete environment
+    temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(build_env))
+    temp_env = os.path.join(temp_dir, "env")
+    try:
+        install_command = (
+            f"{shlex.quote(sys.executable)} -m venv {shlex.quote(temp_env)}"
+            f" && {shlex.quote(os.path.join(temp_env, bin_dir, 'python'))}"
+            " -m pip install --disable-pip-version-check build "
+            + " ".join(shlex.quote(requirement) for requirement in build_requires)
+        )
+        if build_utils.run(install_command, exit_on_error=False).returncode != 0:
+            return None
+        # Only the python executable of the environment is used, which can be moved
+        try:
+            os.rename(temp_env, build_env)
+        except OSError:
+            # Another build might have created the environment in the meantime
+            if not os.path.exists(build_python):
+                raise
+    finally:
+        rmtree(temp_dir, ignore_errors=True)
+    return build_python
+
+
+def _get_simple_index_url(pypi_repository: Optional[str]) -> str:
+    """Get the URL of the simple index (PEP 503) that belongs to the upload URL of the repository."""
+    if not pypi_repository:
+        return "https://pypi.org/simple/"
+    repository_url = pypi_repository.rstrip("/")
+    if repository_url.endswith("/legacy"):
+        # Upload URLs of warehouse instances, e.g. https://test.pypi.org/legacy/
+        repository_url = repository_url[: -len("/legacy")]
+    return repository_url + "/simple/"
+
+
+def _get_distribution_project_name(file_name: str) -> str:
+    """Get the normalized project name (PEP 503) from the file name of a wheel or source distribution."""
+    if file_name.endswith(".whl"):
+        project_name = file_name.split("-")[0]
+    else:
+        project_name = re.sub(r"\.(tar\.gz|tar\.bz2|zip)$", "", file_name)
+        project_name = project_name.rsplit("-", 1)[0]
+    return re.sub(r"[-_.]+", "-", project_name).lower()
+
+
+def _get_uploaded_file_hashes(index_url: str, project_name: str) -> Set[str]:
+    """Get the sha256 hashes of all files of the project on the simple index."""
+    project_url = index_url.rstrip("/") + "/" + project_name + "/"
+    try:
+        with urllib.request.urlopen(project_url, timeout=30) as response:
+            project_page = response.read().decode("utf-8", errors="replace")
+    except urllib.error.HTTPError as ex:
+        if ex.code != 404:
+            build_utils.log(f"Failed to check uploaded files on {project_url}: {ex}")
+        return set()
+    except (urllib.error.URLError, OSError) as ex:
+        build_utils.log(f"Failed to check uploaded files on {project_url}: {ex}")
+        return set()
+    return {
+        file_hash.lower()
+        for file_hash in re.findall(r"#sha256=([0-9a-fA-F]{64})", project_page)
+    }
+
+
 def update_version(module_path: str, version: str, exit_on_error: bool = True) -> None:
     """Update version in specified module.
 
@@ -358,29 +1826,96 @@ def update_version(module_path: str, version: str, exit_on_error: bool = True) -
         f.truncate()
 
 
-def build_distribution(exit_on_error: bool = True) -> None:
+def build_distribution(
+    exit_on_error: bool = True, cache_dir: Optional[str] = None, force: bool = False
+) -> None:
     """Build python package distribution.
 
+    The source distribution and the wheel are built at the same time via PEP 517 (`python -m build`) in a build environment
+    with the requirements from the `[build-system]` table of the `pyproject.toml`. The build environment is cached and only
+    recreated if the build requirements or the python version change. If the package sources did not change since the
+    distributions in `./dist` were built, the build is skipped.
+
     Args:
         exit_on_error (bool, optional): If `True`, exit process as soon as error occures. Defaults to True.
+        cache_dir (str, optional): Directory to cache the build environment, e.g. `args[build_utils.FLAG_CACHE_DIR]`. Defaults to the temp directory.
+        force (bool, optional): Always build the distribution. Defaults to `False`.
     """
+    build_requires = _get_build_requires()
+    build_env_key = hashlib.sha256(
+        json.dumps([sys.version, build_requires]).encode("utf-8")
+    ).hexdigest()
+
+    source_hash = _get_distribution_source_hash(build_env_key)
+    build_info = _load_json_file(_DISTRIBUTION_BUILD_INFO_FILE)
+    if (
+        not force
+        and build_info.get("hash") == source_hash
+        and build_info.get("files")
+        and all(
+            os.path.isfile(os.path.join("./dist", file_name))
+            for file_name in build_info["files"]
+        )
+    ):
+        build_utils.log(
+            "Skipping distribution build: Package sources did not change since the last build."
+        )
+        return
 
-    try:
-        # Ensure there are no old builds
-        rmtree("./dist")
-    except OSError:
-        pass
+    build_python = _get_build_env(
+        os.path.join(
+            str(cache_dir) if cache_dir else tempfile.gettempdir(),
+            _BUILD_ENVS_CACHE_DIR,
+            build_env_key[:16],
+        ),
+        build_requires,
+    )
+    if not build_python:
+        build_utils.log("Failed to create the build environment.")
+        if exit_on_error:
+            build_utils.exit_process(1)
+        return
 
+    output_dir = tempfile.mkdtemp(prefix="dist-")
+    # The wheel is built in a copy of the project, both builds write into ./build.
+    # Files ignored by git are also part of the source distribution and are copied as well.
+    wheel_project_copy = _create_project_copy("wheel-", include_ignored=True)
     try:
-        # Ensure there are no old builds
-        rmtree("./build")
-    except OSError:
-        pass
-
-    # Build the distribution archives
-    build_utils.run(
-        "python setup.py sdist bdist_wheel clean --all", exit_on_error=exit_on_error
-    )
+        build_command = (
+            f"{shlex.quote(build_python)} -m build --no-isolation"
+            f" --outdir {shlex.quote(output_dir)}"
+        )
+        completed_processes = build_utils.run_all(
+            [
+                f"{build_command} --sdist .",
+                f"{build_command} --wheel {shlex.quote(wheel_project_copy)}",
+            ],
+            prefixes=["sdist", "wheel"],
+            exit_on_error=False,
+            group_output=True,
+        )
+        if any(
+            completed_process.returncode != 0
+            for completed_process in completed_processes
+        ):
+            build_utils.log("Failed to build the distribution.")
+            if exit_on_error:
+                build_utils.exit_process(1)
+            return
+
+        try:
+            # Ensure there are no old builds
+            rmtree("./dist")
+        except OSError:
+            pass
+        copytree(output_dir, "./dist")
+        _save_json_file(
+            _DISTRIBUTION_BUILD_INFO_FILE,
+            {"hash": source_hash, "files": sorted(os.listdir(output_dir))},
+        )
+    finally:
+        rmtree(output_dir, ignore_errors=True)
+        rmtree(wheel_project_copy, ignore_errors=True)
 
     # Check twine command
     build_utils.command_exists("twine", exit_on_error=exit_on_error)
@@ -0,0 +1,455 @@
+import json
+import os
+import re
+import stat
+import sys
+
+import pytest
+
+from universal_build.helpers import build_docker
+
+
+def _create_fake_docker(bin_dir) -> str:
+    """Create a fake docker client that records its calls and exports caches."""
+    calls_file = os.path.join(str(bin_dir), "docker.calls")
+    docker_path = os.path.join(str(bin_dir), "docker")
+    with open(docker_path, "w") as f:
+        f.write(
+            f"#!{sys.executable}\n"
+            "import os, sys\n"
+            f"with open({calls_file!r}, 'a') as f:\n"
+            "    f.write(' '.join(sys.argv[1:]) + '\\n')\n"
+            "for arg in sys.argv:\n"
+            "    if arg.startswith('type=local,dest='):\n"
+            "        cache_dir = arg.split('dest=')[1].split(',')[0]\n"
+            "        os.makedirs(cache_dir)\n"
+            "        open(os.path.join(cache_dir, 'index.json'), 'w').close()\n"
+        )
+    os.chmod(docker_path, os.stat(docker_path).st_mode | stat.S_IEXEC)
+    return calls_file
+
+
+def _read_calls(calls_file: str) -> list:
+    if not os.path.exists(calls_file):
+        return []
+    with open(calls_file, "r") as f:
+        return f.read().splitlines()
+
+
+class TestBuildDockerImageClass:
+    def test_layer_cache_is_imported_and_exported(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_docker(bin_dir)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        monkeypatch.setattr(
+            build_docker.build_utils, "get_latest_version", lambda: "0.1.0"
+        )
+        monkeypatch.chdir(tmp_path)
+        cache_dir = str(tmp_path / "cache")
+
+        for _ in range(2):
+            build_docker.build_docker_image(
+                "image",
+                "0.2.0",
+                docker_image_prefix="registry:5000",
+                cache_dir=cache_dir,
+                cache_from_previous=True,
+            )
+
+        build_calls = [call for call in _read_calls(calls_file) if " build " in call]
+        assert len(build_calls) == 2
+        assert "--cache-from registry:5000/image:0.1.0" in build_calls[0]
+        assert "type=local,src=" not in build_calls[0]
+        assert f"type=local,src={os.path.join(cache_dir, 'image')} " in build_calls[1]
+        # The exported cache replaces the previous cache
+        assert os.listdir(cache_dir) == ["image"]
+        assert os.path.isfile(os.path.join(cache_dir, "image", "index.json"))
+
+    def test_cache_dir_argument_is_absolute(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        args = build_docker.parse_arguments(
+            [f"--{build_docker.FLAG_DOCKER_CACHE_DIR.replace('_', '-')}", "cache"]
+        )
+        assert args[build_docker.FLAG_DOCKER_CACHE_DIR] == str(tmp_path / "cache")
+
+
+class TestBuildDockerImagesClass:
+    def test_shared_images_are_built_once(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_docker(bin_dir)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "base").mkdir()
+        (tmp_path / "app").mkdir()
+
+        failed_images = build_docker.build_docker_images(
+            {
+                "app": {"path": "app", "depends_on": ["base"]},
+                "app-copy": {"path": "app", "depends_on": ["base"]},
+                "base": {"path": "base"},
+            },
+            "0.2.0",
+            jobs=2,
+        )
+        assert failed_images == []
+
+        calls = _read_calls(calls_file)
+        build_calls = [call for call in calls if call.startswith("build ")]
+        assert len(build_calls) == 2
+        assert build_calls[0].endswith(" base") and build_calls[1].endswith(" app")
+        assert "tag app:0.2.0 app-copy:0.2.0" in calls
+        assert "tag app:0.2.0 app-copy:latest" in calls
+
+    def test_images_are_rebuilt_with_changed_dependencies(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_docker(bin_dir)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "base").mkdir()
+        (tmp_path / "app").mkdir()
+        images = {
+            "base": {"path": "base"},
+            "app": {"path": "app", "depends_on": ["base"]},
+        }
+
+        def get_built_images(base_image_id: str) -> list:
+            monkeypatch.setattr(
+                build_docker, "_get_local_image", lambda image: {"Id": base_image_id}
+            )
+            if os.path.exists(calls_file):
+                os.remove(calls_file)
+            assert build_docker.build_docker_images(images, "0.2.0") == []
+            return [
+                call.split()[-1]
+                for call in _read_calls(calls_file)
+                if call.startswith("build ")
+            ]
+
+        assert get_built_images("sha256:1") == ["base", "app"]
+
+        # Fake docker client that finds all images built before
+        fingerprints = [
+            call.split("universal-build.fingerprint=")[1].split()[0]
+            for call in _read_calls(calls_file)
+        ]
+        monkeypatch.setattr(
+            build_docker,
+            "_get_image_by_fingerprint",
+            lambda fingerprint: "abc123" if fingerprint in fingerprints else None,
+        )
+        assert get_built_images("sha256:1") == []
+        # The app image is rebuilt on top of the rebuilt base image
+        assert get_built_images("sha256:2") == ["app"]
+
+    def test_invalid_dependencies(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(
+            build_docker.build_utils, "command_exists", lambda *args, **kwargs: True
+        )
+        assert build_docker.build_docker_images(
+            {"app": {"depends_on": ["base"]}}, "0.2.0", exit_on_error=False
+        ) == ["app"]
+
+    def test_bake_definition(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        images = {
+            "base": {"path": "base", "build_args": "--build-arg A=1 --build-arg=B=2"},
+            "app": {
+                "path": "app",
+                "dockerfile": "Dockerfile.app",
+                "depends_on": ["base"],
+            },
+        }
+        build_groups = build_docker._get_image_build_groups(images)
+        bake_definition = build_docker._get_bake_definition(
+            images,
+            build_groups,
+            {"base": ["base"], "app": ["app"]},
+            "0.2.0",
+            "registry:5000",
+            None,
+            False,
+        )
+
+        assert bake_definition["group"]["default"]["targets"] == ["base", "app"]
+        base_target = bake_definition["target"]["base"]
+        assert base_target["args"] == {
+            "BUILDKIT_INLINE_CACHE": "1",
+            "A": "1",
+            "B": "2",
+        }
+        assert base_target["tags"] == [
+            "base:0.2.0",
+            "base:latest",
+            "registry:5000/base:0.2.0",
+        ]
+        app_target = bake_definition["target"]["app"]
+        assert app_target["dockerfile"] == "Dockerfile.app"
+        assert app_target["contexts"] == {
+            "base": "target:base",
+            "base:0.2.0": "target:base",
+            "base:latest": "target:base",
+        }
+
+
+class TestReleaseDockerImagesClass:
+    def _create_fake_registry_docker(self, bin_dir, state: dict) -> str:
+        """Create a fake docker client with local images and a registry."""
+        state_file = os.path.join(str(bin_dir), "state.json")
+        with open(state_file, "w") as f:
+            json.dump(state, f)
+        calls_file = os.path.join(str(bin_dir), "docker.calls")
+        docker_path = os.path.join(str(bin_dir), "docker")
+        with open(docker_path, "w") as f:
+            f.write(
+                f"#!{sys.executable}\n"
+                "import json, os, sys\n"
+                f"state = json.load(open({state_file!r}))\n"
+                "args = sys.argv[1:]\n"
+                "if args[:2] == ['image', 'inspect']:\n"
+                "    print(json.dumps([state['local'][args[2]]]))\n"
+                "elif args[:2] == ['manifest', 'inspect']:\n"
+                "    if args[-1] not in state['remote']:\n"
+                "        sys.exit(1)\n"
+                "    digest = state['remote'][args[-1]]\n"
+                "    print(json.dumps({'Descriptor': {'digest': digest}}))\n"
+                "else:\n"
+                f"    with open({calls_file!r}, 'a') as f:\n"
+                "        f.write(' '.join(args) + '\\n')\n"
+                "    marker_file = os.path.join("
+                f"{str(bin_dir)!r}, args[-1].replace('/', '_') + '.failed')\n"
+                "    if args[0] == 'push' and args[-1] in state['failing']:\n"
+                "        if not os.path.exists(marker_file):\n"
+                "            open(marker_file, 'w').close()\n"
+                "            sys.exit(1)\n"
+            )
+        os.chmod(docker_path, os.stat(docker_path).st_mode | stat.S_IEXEC)
+        return calls_file
+
+    def test_pushes_are_skipped_and_retried(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = self._create_fake_registry_docker(
+            bin_dir,
+            {
+                "local": {
+                    "app:1.0.0": {
+                        "Id": "sha256:app",
+                        "RepoTags": ["app:1.0.0", "localhost:5000/app:1.0.0"],
+                        "RepoDigests": ["localhost:5000/app@sha256:aaa"],
+                    },
+                    "web:1.0.0": {
+                        "Id": "sha256:web",
+                        "RepoTags": ["web:1.0.0"],
+                        "RepoDigests": [],
+                    },
+                },
+                "remote": {
+                    "localhost:5000/app:1.0.0": "sha256:aaa",
+                    "localhost:5000/app:latest": "sha256:old",
+                },
+                "failing": ["localhost:5000/web:1.0.0"],
+            },
+        )
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        monkeypatch.setattr(build_docker, "_PUSH_RETRY_DELAY", 0)
+
+        failed_images = build_docker.release_docker_images(
+            ["app", "web"], "1.0.0", "localhost:5000", insecure_registry=True
+        )
+        assert failed_images == []
+
+        calls = _read_calls(calls_file)
+        push_calls = [call for call in calls if call.startswith("push ")]
+        assert push_calls[:2] == [
+            "push localhost:5000/web:1.0.0",
+            "push localhost:5000/web:1.0.0",
+        ]
+        assert sorted(push_calls[2:]) == [
+            "push localhost:5000/app:latest",
+            "push localhost:5000/web:latest",
+        ]
+        assert "tag sha256:app localhost:5000/app:1.0.0" not in calls
+        assert "tag sha256:web localhost:5000/web:1.0.0" in calls
+
+    def test_image_repository(self):
+        assert (
+            build_docker._get_image_repository("localhost:5000/app:1.0.0")
+            == "localhost:5000/app"
+        )
+        assert (
+            build_docker._get_image_repository("localhost:5000/app")
+            == "localhost:5000/app"
+        )
+
+
+class TestCheckImageClass:
+    def test_check_results_are_cached(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        db_file = tmp_path / "db-version"
+        db_file.write_text("2021-10-01")
+        image_id_file = tmp_path / "image-id"
+        image_id_file.write_text("sha256:aaa")
+        scans_file = str(tmp_path / "trivy.scans")
+        for tool, script in [
+            (
+                "docker",
+                "import json\n"
+                f"image_id = open({str(image_id_file)!r}).read()\n"
+                "print(json.dumps([{'Id': image_id}]))\n",
+            ),
+            (
+                "trivy",
+                "import sys\n"
+                "if '--version' in sys.argv:\n"
+                "    print('Version: 0.20.0')\n"
+                "    print('Vulnerability DB:')\n"
+                f"    print('  UpdatedAt: ' + open({str(db_file)!r}).read())\n"
+                "    print('  DownloadedAt: now')\n"
+                "elif '--download-db-only' not in sys.argv:\n"
+                f"    with open({scans_file!r}, 'a') as f:\n"
+                "        f.write(sys.argv[-1] + '\\n')\n",
+            ),
+        ]:
+            tool_path = bin_dir / tool
+            tool_path.write_text(f"#!{sys.executable}\n" + script)
+            tool_path.chmod(tool_path.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        cache_dir = str(tmp_path / "cache")
+
+        for _ in range(2):
+            completed_process = build_docker.check_image(
+                "app:1.0.0", cache_dir=cache_dir
+            )
+            assert completed_process.returncode == 0
+        assert _read_calls(scans_file) == ["app:1.0.0"]
+
+        # A new vulnerability database or image requires a new check
+        db_file.write_text("2021-10-02")
+        build_docker.check_image("app:1.0.0", cache_dir=cache_dir)
+        image_id_file.write_text("sha256:bbb")
+        build_docker.check_image("app:1.0.0", cache_dir=cache_dir)
+        assert len(_read_calls(scans_file)) == 3
+
+
+class TestBuildContextFingerprintClass:
+    @pytest.mark.parametrize(
+        "pattern,file_path,ignored",
+        [
+            ("*.md", "README.md", True),
+            ("*.md", "docs/README.md", False),
+            ("**/*.md", "docs/README.md", True),
+            ("**/*.md", "README.md", True),
+            ("docs", "docs/api/index.html", True),
+            ("/docs/", "docs/index.html", True),
+            ("docs/**", "docs/api/index.html", True),
+            ("d?cs", "docs/index.html", True),
+            ("[a-c]*.py", "build.py", True),
+            ("[a-c]*.py", "setup.py", False),
+            ("src/*/test_*.py", "src/pkg/test_a.py", True),
+            ("src/*/test_*.py", "src/pkg/sub/test_a.py", False),
+            ("node_modules", "web/node_modules/a.js", False),
+            ("**/node_modules", "web/node_modules/a.js", True),
+            ("*.tar.gz", "dist.tar.gz", True),
+            ("*.tar.gz", "dist.tarxgz", False),
+        ],
+    )
+    def test_dockerignore_pattern(self, pattern: str, file_path: str, ignored: bool):
+        regex = build_docker._get_dockerignore_regex(pattern.strip("/"))
+        dockerignore_patterns = [(re.compile(regex), False)]
+        assert (
+            build_docker._is_dockerignored(file_path, dockerignore_patterns) == ignored
+        )
+
+    def test_dockerignore_exceptions(self, tmp_path):
+        (tmp_path / ".dockerignore").write_text(
+            "# Comment\n"
+            "\n"
+            "*.md\n"
+            "!README.md\n"
+            "docs\n"
+            "!docs/api\n"
+            "docs/api/private.html\n"
+        )
+        for file_path in [
+            "README.md",
+            "CHANGELOG.md",
+            "Dockerfile",
+            "docs/index.html",
+            "docs/api/index.html",
+            "docs/api/private.html",
+        ]:
+            (tmp_path / file_path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / file_path).write_text(file_path)
+
+        assert build_docker._get_build_context_files(str(tmp_path)) == [
+            ".dockerignore",
+            "Dockerfile",
+            "README.md",
+            "docs/api/index.html",
+        ]
+
+    def test_fingerprint(self, tmp_path):
+        (tmp_path / ".dockerignore").write_text("*.log\n")
+        (tmp_path / "Dockerfile").write_text("FROM python:3.8\n")
+        (tmp_path / "app.py").write_text("print('app')\n")
+        fingerprint = build_docker._get_build_context_fingerprint(
+            str(tmp_path), None, ""
+        )
+
+        (tmp_path / "build.log").write_text("ignored")
+        assert (
+            build_docker._get_build_context_fingerprint(str(tmp_path), None, "")
+            == fingerprint
+        )
+        assert (
+            build_docker._get_build_context_fingerprint(
+                str(tmp_path), None, "--build-arg A=1"
+            )
+            != fingerprint
+        )
+        (tmp_path / "app.py").write_text("print('changed')\n")
+        assert (
+            build_docker._get_build_context_fingerprint(str(tmp_path), None, "")
+            != fingerprint
+        )
+
+    def test_build_is_skipped_for_same_context(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_docker(bin_dir)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        (tmp_path / "context").mkdir()
+        monkeypatch.chdir(tmp_path / "context")
+        (tmp_path / "context" / "Dockerfile").write_text("FROM python:3.8\n")
+
+        build_docker.build_docker_image("app", "0.1.0")
+        build_call = next(
+            call for call in _read_calls(calls_file) if call.startswith("build ")
+        )
+        fingerprint = build_call.split("universal-build.fingerprint=")[1].split()[0]
+
+        # Fake docker client that finds the labeled image
+        monkeypatch.setattr(
+            build_docker,
+            "_get_image_by_fingerprint",
+            lambda image_fingerprint: "abc123"
+            if image_fingerprint == fingerprint
+            else None,
+        )
+        build_docker.build_docker_image("app", "0.2.0", docker_image_prefix="registry")
+        calls = _read_calls(calls_file)
+        assert len([call for call in calls if call.startswith("build ")]) == 1
+        assert calls[-3:] == [
+            "tag abc123 app:0.2.0",
+            "tag abc123 app:latest",
+            "tag abc123 registry/app:0.2.0",
+        ]
+
+        build_docker.build_docker_image("app", "0.2.0", force=True)
+        calls = _read_calls(calls_file)
+        assert len([call for call in calls if call.startswith("build ")]) == 2
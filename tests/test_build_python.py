@@ -0,0 +1,721 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import stat
+import sys
+import threading
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from xml.etree import ElementTree
+
+import pytest
+
+from universal_build.helpers import build_python
+
+
+def _create_fake_tool(bin_dir, name: str, exitcode: int = 0) -> str:
+    """Create a fake tool that records the paths it was called with."""
+    calls_file = os.path.join(str(bin_dir), name + ".calls")
+    tool_path = os.path.join(str(bin_dir), name)
+    with open(tool_path, "w") as f:
+        f.write(
+            f"#!{sys.executable}\n"
+            "import sys\n"
+            "if '--version' in sys.argv:\n"
+            "    print('1.0.0')\n"
+            "    sys.exit(0)\n"
+            f"with open({calls_file!r}, 'a') as f:\n"
+            "    f.write(' '.join(a for a in sys.argv[1:] if not a.startswith('-'))"
+            " + '\\n')\n"
+            f"sys.exit({exitcode})\n"
+        )
+    os.chmod(tool_path, os.stat(tool_path).st_mode | stat.S_IEXEC)
+    return calls_file
+
+
+def _read_calls(calls_file: str) -> list:
+    if not os.path.exists(calls_file):
+        return []
+    with open(calls_file, "r") as f:
+        return f.read().splitlines()
+
+
+class TestCodeChecksCacheClass:
+    def _run_black_check(self, cache_dir: str) -> None:
+        build_python.code_checks(
+            isort=False,
+            pydocstyle=False,
+            mypy=False,
+            flake8=False,
+            cache_dir=cache_dir,
+        )
+
+    def test_only_changed_files_are_checked(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_tool(bin_dir, "black")
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+        project_dir = tmp_path / "project"
+        (project_dir / "src").mkdir(parents=True)
+        (project_dir / "tests").mkdir()
+        (project_dir / "src" / "a.py").write_text("a = 1\n")
+        (project_dir / "src" / "b.py").write_text("b = 1\n")
+        (project_dir / "tests" / "test_a.py").write_text("test = 1\n")
+        monkeypatch.chdir(project_dir)
+        cache_dir = str(tmp_path / "cache")
+
+        self._run_black_check(cache_dir)
+        assert sorted(_read_calls(calls_file)) == [
+            "src/a.py src/b.py",
+            "tests/test_a.py",
+        ]
+
+        # Nothing changed, no files need to be checked again
+        os.remove(calls_file)
+        self._run_black_check(cache_dir)
+        assert _read_calls(calls_file) == []
+
+        (project_dir / "src" / "b.py").write_text("b = 2\n")
+        self._run_black_check(cache_dir)
+        assert _read_calls(calls_file) == ["src/b.py"]
+
+    def test_failed_checks_are_not_cached(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_tool(bin_dir, "black", exitcode=1)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+        project_dir = tmp_path / "project"
+        (project_dir / "src").mkdir(parents=True)
+        (project_dir / "src" / "a.py").write_text("a = 1\n")
+        monkeypatch.chdir(project_dir)
+        monkeypatch.setattr(build_python.build_utils, "exit_process", sys.exit)
+        cache_dir = str(tmp_path / "cache")
+
+        for _ in range(2):
+            try:
+                self._run_black_check(cache_dir)
+            except SystemExit:
+                pass
+        assert _read_calls(calls_file) == ["src/a.py", "src/a.py"]
+
+    def test_file_lists_are_split(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_tool(bin_dir, "black")
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        monkeypatch.setattr(build_python, "_MAX_FILE_CHECK_COMMAND_LENGTH", 200)
+
+        project_dir = tmp_path / "project"
+        (project_dir / "src").mkdir(parents=True)
+        for index in range(20):
+            (project_dir / "src" / f"module_{index}.py").write_text("a = 1\n")
+        monkeypatch.chdir(project_dir)
+
+        self._run_black_check(str(tmp_path / "cache"))
+        calls = _read_calls(calls_file)
+        assert len(calls) > 1
+        assert sorted(" ".join(calls).split()) == sorted(
+            f"src/module_{index}.py" for index in range(20)
+        )
+
+    def test_black_exclude_is_forced(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        assert build_python._get_black_exclude() is None
+
+        (tmp_path / "pyproject.toml").write_text(
+            "[tool.black]\n"
+            "exclude = '''\n(\n    build\n  | dist\n)\n'''\n"
+            "line-length = 88\n"
+            "\n"
+            "[tool.isort]\n"
+            "exclude = 'other'\n"
+        )
+        assert build_python._get_black_exclude() == "\n(\n    build\n  | dist\n)\n"
+
+        (tmp_path / "pyproject.toml").write_text(
+            "[tool.black]\nexclude = 'build'\nforce-exclude = 'build'\n"
+        )
+        assert build_python._get_black_exclude() is None
+
+
+class TestToolCommandClass:
+    def test_venv_is_resolved_once(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        venv_dir = tmp_path / "venv"
+        (venv_dir / "bin").mkdir(parents=True)
+        _create_fake_tool(venv_dir / "bin", "black")
+
+        calls_file = str(tmp_path / "pipenv.calls")
+        pipenv_path = bin_dir / "pipenv"
+        pipenv_path.write_text(
+            f"#!{sys.executable}\n"
+            f"with open({calls_file!r}, 'a') as f:\n"
+            "    f.write('called\\n')\n"
+            f"print({str(venv_dir)!r})\n"
+        )
+        pipenv_path.chmod(0o755)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+        project_dir = tmp_path / "project"
+        project_dir.mkdir()
+        (project_dir / "Pipfile").write_text("")
+        monkeypatch.chdir(project_dir)
+        monkeypatch.setattr(build_python, "_pipenv_venvs", {})
+
+        assert build_python.is_pipenv_environment()
+        black_path = str(venv_dir / "bin" / "black")
+        assert build_python.get_tool_command("black") == black_path
+        assert build_python.get_tool_command("mypy") == "pipenv run mypy"
+        assert _read_calls(calls_file) == ["called"]
+
+
+class TestInstallBuildEnvClass:
+    def test_environment_is_reused(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        venv_dir = tmp_path / "venv"
+        venv_dir.mkdir()
+
+        calls_file = str(tmp_path / "pipenv.calls")
+        pipenv_path = bin_dir / "pipenv"
+        pipenv_path.write_text(
+            f"#!{sys.executable}\n"
+            "import sys\n"
+            "if sys.argv[1:] == ['--venv']:\n"
+            f"    print({str(venv_dir)!r})\n"
+            "    sys.exit(0)\n"
+            f"with open({calls_file!r}, 'a') as f:\n"
+            "    f.write(sys.argv[1] + '\\n')\n"
+        )
+        pipenv_path.chmod(0o755)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+        project_dir = tmp_path / "project"
+        project_dir.mkdir()
+        (project_dir / "Pipfile").write_text("[packages]\n")
+        monkeypatch.chdir(project_dir)
+        monkeypatch.setattr(build_python, "_pipenv_venvs", {})
+
+        build_python.install_build_env()
+        assert _read_calls(calls_file) == ["--rm", "install", "graph"]
+
+        # Nothing changed, the environment is reused
+        build_python.install_build_env()
+        assert _read_calls(calls_file) == ["--rm", "install", "graph"]
+
+        (project_dir / "Pipfile").write_text("[packages]\nrequests = '*'\n")
+        build_python.install_build_env()
+        assert _read_calls(calls_file)[3:] == ["--rm", "install", "graph"]
+
+        # Dependencies of the local package are declared in the packaging files
+        (project_dir / "setup.py").write_text("install_requires = ['requests']\n")
+        build_python.install_build_env()
+        assert _read_calls(calls_file)[6:] == ["--rm", "install", "graph"]
+
+        build_python.install_build_env(force=True)
+        assert _read_calls(calls_file)[9:] == ["--rm", "install", "graph"]
+
+    def test_wheelhouse_is_only_used_if_requested(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "Pipfile").write_text("[packages]\n")
+        monkeypatch.setattr(
+            build_python.build_utils, "command_exists", lambda *_, **__: True
+        )
+        install_envs = []
+        monkeypatch.setattr(
+            build_python,
+            "install_pipenv_env",
+            lambda *_, install_env, **__: install_envs.append(install_env),
+        )
+        monkeypatch.setattr(
+            build_python, "_build_wheelhouses", lambda *_, **__: ["/wheels"]
+        )
+
+        build_python.install_build_env(cache_dir=str(tmp_path / "cache"))
+        build_python.install_build_env(
+            cache_dir=str(tmp_path / "cache"), wheelhouse=True
+        )
+        assert install_envs == [{}, {"PIP_FIND_LINKS": "/wheels"}]
+
+
+class TestWheelhouseClass:
+    def test_wheelhouse_is_built_once(self, tmp_path, monkeypatch):
+        calls_file = str(tmp_path / "python.calls")
+        python_path = tmp_path / "python"
+        # Fake interpreter that stores the requirements as the built wheels
+        python_path.write_text(
+            f"#!{sys.executable}\n"
+            "import shutil, sys\n"
+            "if sys.argv[1] == '-c':\n"
+            "    print('3.8.0')\n"
+            "    sys.exit(0)\n"
+            f"with open({calls_file!r}, 'a') as f:\n"
+            "    f.write(' '.join(sys.argv[1:]) + '\\n')\n"
+            "shutil.copy(sys.argv[-1], sys.argv[sys.argv.index('--wheel-dir') + 1])\n"
+        )
+        python_path.chmod(python_path.stat().st_mode | stat.S_IEXEC)
+
+        monkeypatch.chdir(tmp_path)
+        pipfile_lock = {
+            "default": {
+                "six": {"version": "==1.16.0", "markers": "python_version >= '2.7'"}
+            },
+            "develop": {
+                "pytest": {"version": "==6.2.5"},
+                "this-package": {"editable": True, "path": "."},
+            },
+        }
+        (tmp_path / "Pipfile.lock").write_text(json.dumps(pipfile_lock))
+        cache_dir = str(tmp_path / "cache")
+
+        wheelhouse = build_python.build_wheelhouse(str(python_path), cache_dir)
+        assert wheelhouse
+        with open(os.path.join(wheelhouse, "requirements.txt"), "r") as f:
+            assert f.read().splitlines() == [
+                "pytest==6.2.5",
+                "six==1.16.0; python_version >= '2.7'",
+                "setuptools>=40.8.0",
+                "wheel",
+            ]
+        assert build_python.build_wheelhouse(str(python_path), cache_dir) == wheelhouse
+        assert len(_read_calls(calls_file)) == 1
+
+        # A changed lock file requires a new wheelhouse, which is not built offline
+        pipfile_lock["develop"]["pytest"]["version"] = "==7.0.0"
+        (tmp_path / "Pipfile.lock").write_text(json.dumps(pipfile_lock))
+        assert build_python._build_wheelhouses(
+            [str(python_path)], cache_dir, offline=True, exit_on_error=False
+        ) == [None]
+        assert len(_read_calls(calls_file)) == 1
+
+    def test_offline_install_env(self):
+        assert build_python._get_wheelhouse_env("/wheels", offline=False) == {
+            "PIP_FIND_LINKS": "/wheels"
+        }
+        assert build_python._get_wheelhouse_env("/wheels", offline=True) == {
+            "PIP_FIND_LINKS": "/wheels",
+            "PIP_NO_INDEX": "1",
+        }
+
+
+class TestPythonVersionMatrixClass:
+    def _create_fake_tools(self, tmp_path, monkeypatch) -> str:
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = str(tmp_path / "pytest.calls")
+
+        pyenv_root = str(tmp_path / "pyenv")
+        installs_file = str(tmp_path / "pyenv.calls")
+        pyenv_path = bin_dir / "pyenv"
+        pyenv_path.write_text(
+            f"#!{sys.executable}\n"
+            "import os, sys\n"
+            "if sys.argv[1] == 'local':\n"
+            "    with open('.python-version', 'w') as f:\n"
+            "        f.write(sys.argv[2])\n"
+            "if sys.argv[1] == 'root':\n"
+            f"    print({pyenv_root!r})\n"
+            "if sys.argv[1] == 'install':\n"
+            f"    version_dir = os.path.join({pyenv_root!r}, 'versions', sys.argv[-1])\n"
+            "    if not os.path.isdir(version_dir):\n"
+            "        os.makedirs(version_dir)\n"
+            "        with open(os.path.join(version_dir, 'python'), 'w') as f:\n"
+            "            f.write('x' * 1024 * 1024)\n"
+            f"        with open({installs_file!r}, 'a') as f:\n"
+            "            f.write(sys.argv[-1] + '\\n')\n"
+        )
+        pyenv_path.chmod(0o755)
+
+        # Tests fail for all python versions starting with 2
+        pipenv_path = bin_dir / "pipenv"
+        pipenv_path.write_text(
+            f"#!{sys.executable}\n"
+            "import os, sys\n"
+            "if sys.argv[1] == 'run':\n"
+            "    version = open('.python-version').read()\n"
+            f"    with open({calls_file!r}, 'a') as f:\n"
+            "        f.write(version + ' ' + os.getcwd() + '\\n')\n"
+            "    sys.exit(1 if version.startswith('2') else 0)\n"
+        )
+        pipenv_path.chmod(0o755)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+        project_dir = tmp_path / "project"
+        project_dir.mkdir()
+        (project_dir / "Pipfile").write_text("[packages]\n")
+        (project_dir / ".python-version").write_text("3.8.0")
+        monkeypatch.chdir(project_dir)
+        return calls_file
+
+    def test_versions_are_tested_in_isolated_copies(self, tmp_path, monkeypatch):
+        calls_file = self._create_fake_tools(tmp_path, monkeypatch)
+
+        assert build_python.test_with_py_versions(["3.6.12", "3.7.9"])
+
+        calls = sorted(_read_calls(calls_file))
+        assert [call.split(" ")[0] for call in calls] == ["3.6.12", "3.7.9"]
+        project_copies = [call.split(" ", 1)[1] for call in calls]
+        assert str(tmp_path / "project") not in project_copies
+        assert not any(os.path.exists(path) for path in project_copies)
+        assert (tmp_path / "project" / ".python-version").read_text() == "3.8.0"
+
+    def test_failures_are_combined(self, tmp_path, monkeypatch):
+        calls_file = self._create_fake_tools(tmp_path, monkeypatch)
+
+        assert not build_python.test_with_py_versions(
+            ["2.7.18", "3.7.9"], exit_on_error=False
+        )
+        assert len(_read_calls(calls_file)) == 2
+
+    def test_interpreters_are_cached(self, tmp_path, monkeypatch):
+        self._create_fake_tools(tmp_path, monkeypatch)
+        installs_file = str(tmp_path / "pyenv.calls")
+        versions_dir = tmp_path / "pyenv" / "versions"
+        cache_dir = str(tmp_path / "cache")
+
+        assert build_python.test_with_py_versions(["3.6.12"], cache_dir=cache_dir)
+        assert _read_calls(installs_file) == ["3.6.12"]
+
+        # A fresh pyenv installation restores the interpreter from the cache
+        shutil.rmtree(str(versions_dir))
+        assert build_python.test_with_py_versions(["3.6.12"], cache_dir=cache_dir)
+        assert _read_calls(installs_file) == ["3.6.12"]
+        assert (versions_dir / "3.6.12" / "python").exists()
+
+        # The least recently used interpreter is removed if the cache is too large
+        assert build_python.test_with_py_versions(
+            ["3.7.9"], cache_dir=cache_dir, max_cache_size=1
+        )
+        shutil.rmtree(str(versions_dir))
+        assert build_python.test_with_py_versions(
+            ["3.6.12", "3.7.9"], cache_dir=cache_dir, max_cache_size=1
+        )
+        assert _read_calls(installs_file) == ["3.6.12", "3.7.9", "3.6.12"]
+
+
+class TestRunPytestClass:
+    def _create_test_project(self, tmp_path, monkeypatch) -> None:
+        project_dir = tmp_path / "project"
+        (project_dir / "tests").mkdir(parents=True)
+        (project_dir / "tests" / "test_a.py").write_text(
+            "import time\n"
+            "def test_slow():\n"
+            "    time.sleep(0.5)\n"
+            "def test_fast():\n"
+            "    pass\n"
+        )
+        (project_dir / "tests" / "test_b.py").write_text(
+            "def test_one():\n    pass\ndef test_two():\n    pass\n"
+        )
+        monkeypatch.chdir(project_dir)
+        monkeypatch.setenv("PATH", os.path.dirname(sys.executable), prepend=os.pathsep)
+
+    def test_shards_are_balanced_by_duration(self, tmp_path, monkeypatch):
+        self._create_test_project(tmp_path, monkeypatch)
+        cache_dir = str(tmp_path / "cache")
+        junit_xml = str(tmp_path / "junit.xml")
+
+        assert build_python.run_pytest(
+            shards=2, junit_xml=junit_xml, cache_dir=cache_dir
+        )
+        history_file = build_python._get_test_history_file(cache_dir)
+        with open(history_file, "r") as f:
+            recorded_tests = json.load(f)["tests"]
+        assert len(recorded_tests) == 4
+        assert recorded_tests["tests/test_a.py::test_slow"]["duration"] >= 0.5
+
+        shards = build_python._create_test_shards(
+            sorted(recorded_tests.keys()), recorded_tests, 2
+        )
+        assert ["tests/test_a.py::test_slow"] in shards
+
+        test_suite = ElementTree.parse(junit_xml).getroot().find("testsuite")
+        assert test_suite.get("tests") == "4"
+        assert len(test_suite.findall("testcase")) == 4
+
+    def test_failures_are_combined(self, tmp_path, monkeypatch):
+        self._create_test_project(tmp_path, monkeypatch)
+        (tmp_path / "project" / "tests" / "test_c.py").write_text(
+            "def test_failure():\n    assert False\n"
+        )
+
+        assert not build_python.run_pytest(shards=3, exit_on_error=False)
+
+    def test_only_affected_tests_are_executed(self, tmp_path, monkeypatch):
+        pytest.importorskip("pytest_cov")
+        self._create_test_project(tmp_path, monkeypatch)
+        project_dir = tmp_path / "project"
+        (project_dir / "src").mkdir()
+        (project_dir / "src" / "mod_a.py").write_text("def a():\n    return 1\n")
+        (project_dir / "src" / "mod_b.py").write_text("def b():\n    return 1\n")
+        (project_dir / "tests" / "test_c.py").write_text(
+            "import mod_a\ndef test_a():\n    assert mod_a.a() == 1\n"
+        )
+        (project_dir / "tests" / "test_d.py").write_text(
+            "import mod_b\ndef test_b():\n    assert mod_b.b() == 1\n"
+        )
+        (project_dir / "setup.cfg").write_text(
+            "[tool:pytest]\npythonpath = src\naddopts = --cov=src\n"
+        )
+        cache_dir = str(tmp_path / "cache")
+        junit_xml = str(tmp_path / "junit.xml")
+
+        def run_affected_tests() -> list:
+            assert build_python.run_pytest(
+                junit_xml=junit_xml, cache_dir=cache_dir, affected_only=True
+            )
+            test_suite = ElementTree.parse(junit_xml).getroot().find("testsuite")
+            return sorted(test.get("name") for test in test_suite.iter("testcase"))
+
+        assert len(run_affected_tests()) == 6
+        assert (project_dir / ".coverage").exists()
+
+        (project_dir / "src" / "mod_b.py").write_text("def b():\n    return 2 - 1\n")
+        assert run_affected_tests() == ["test_b"]
+
+        # Files that are not covered by any test might affect all tests
+        (project_dir / "tests" / "helper.py").write_text("VALUE = 1\n")
+        assert len(run_affected_tests()) == 6
+        (project_dir / "src" / "mod_b.py").write_text("def b():\n    return 1\n")
+        assert run_affected_tests() == ["test_b"]
+
+        # Changes of the test configuration affect all tests
+        (project_dir / "setup.cfg").write_text(
+            "[tool:pytest]\npythonpath = src\naddopts = --cov=src -v\n"
+        )
+        assert len(run_affected_tests()) == 6
+
+        # Test files that fail to collect are never skipped
+        (project_dir / "tests" / "test_e.py").write_text("import does_not_exist\n")
+        assert not build_python.run_pytest(
+            junit_xml=junit_xml,
+            cache_dir=cache_dir,
+            exit_on_error=False,
+            affected_only=True,
+        )
+
+    def test_recent_failures_run_first(self, tmp_path, monkeypatch):
+        self._create_test_project(tmp_path, monkeypatch)
+        project_dir = tmp_path / "project"
+        (project_dir / "tests" / "test_c.py").write_text(
+            "import os\n"
+            "def test_flaky():\n"
+            "    assert not os.path.exists('fail')\n"
+        )
+        (project_dir / "fail").write_text("")
+        cache_dir = str(tmp_path / "cache")
+        junit_xml = str(tmp_path / "junit.xml")
+
+        def run_fail_fast_tests() -> list:
+            build_python.run_pytest(
+                junit_xml=junit_xml,
+                cache_dir=cache_dir,
+                exit_on_error=False,
+                fail_fast=True,
+            )
+            test_suite = ElementTree.parse(junit_xml).getroot().find("testsuite")
+            return [test.get("name") for test in test_suite.iter("testcase")]
+
+        # New tests run first and the run stops with the first failure
+        assert run_fail_fast_tests()[-1] == "test_flaky"
+        # The failed test runs first in the next run
+        assert run_fail_fast_tests() == ["test_flaky"]
+
+        os.remove(str(project_dir / "fail"))
+        executed_tests = run_fail_fast_tests()
+        assert executed_tests[0] == "test_flaky"
+        # All other tests are ordered by their duration
+        assert executed_tests[-1] == "test_slow"
+
+    def test_coverage_of_all_shards_is_combined(self, tmp_path, monkeypatch):
+        pytest.importorskip("pytest_cov")
+        self._create_test_project(tmp_path, monkeypatch)
+        project_dir = tmp_path / "project"
+        (project_dir / "src").mkdir()
+        for module in ["mod_a", "mod_b"]:
+            (project_dir / "src" / f"{module}.py").write_text("def f():\n    pass\n")
+            (project_dir / "tests" / f"test_{module}.py").write_text(
+                f"import {module}\ndef test_f():\n    {module}.f()\n"
+            )
+        (project_dir / "setup.cfg").write_text(
+            "[tool:pytest]\npythonpath = src\naddopts = --cov=src\n"
+        )
+
+        assert build_python.run_pytest(shards=2)
+
+        connection = sqlite3.connect(str(project_dir / ".coverage"))
+        measured_files = [
+            os.path.basename(row[0])
+            for row in connection.execute("SELECT path FROM file")
+        ]
+        connection.close()
+        assert sorted(measured_files) == ["mod_a.py", "mod_b.py"]
+
+
+class TestCoverageClass:
+    def test_relocate_coverage_data(self, tmp_path):
+        coverage_file = str(tmp_path / ".coverage.matrix")
+        connection = sqlite3.connect(coverage_file)
+        with connection:
+            connection.execute("CREATE TABLE file (id INTEGER PRIMARY KEY, path TEXT)")
+            connection.execute(
+                "INSERT INTO file (path) VALUES (?), (?)",
+                ("/tmp/copy/src/mod_a.py", "/usr/lib/python3/os.py"),
+            )
+        connection.close()
+
+        build_python._relocate_coverage_data(coverage_file, "/tmp/copy", "/project")
+
+        connection = sqlite3.connect(coverage_file)
+        measured_files = sorted(
+            row[0] for row in connection.execute("SELECT path FROM file")
+        )
+        connection.close()
+        assert measured_files == ["/project/src/mod_a.py", "/usr/lib/python3/os.py"]
+
+
+class TestBuildDistributionClass:
+    def test_build_requires_from_pyproject(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        assert build_python._get_build_requires() == ["setuptools>=40.8.0", "wheel"]
+
+        (tmp_path / "pyproject.toml").write_text(
+            "[build-system]\n"
+            'build-backend = "setuptools.build_meta"\n'
+            "requires = [\n"
+            '  "setuptools >= 40.9.0",\n'
+            '  "wheel",\n'
+            "]\n"
+            "\n"
+            "[tool.black]\n"
+            "requires = ['black']\n"
+        )
+        assert build_python._get_build_requires() == ["setuptools >= 40.9.0", "wheel"]
+
+    def test_build_outputs_do_not_change_source_hash(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "setup.py").write_text("")
+        source_hash = build_python._get_distribution_source_hash("key")
+
+        (tmp_path / "dist").mkdir()
+        (tmp_path / "dist" / "pkg-0.1.0.tar.gz").write_text("")
+        (tmp_path / "src" / "pkg.egg-info").mkdir(parents=True)
+        (tmp_path / "src" / "pkg.egg-info" / "PKG-INFO").write_text("")
+        assert build_python._get_distribution_source_hash("key") == source_hash
+
+        (tmp_path / "setup.py").write_text("from setuptools import setup")
+        assert build_python._get_distribution_source_hash("key") != source_hash
+
+        # Files ignored by git are part of the distributions as well
+        build_python.build_utils.run("git init -q", exit_on_error=False)
+        (tmp_path / ".gitignore").write_text("generated.py\n")
+        source_hash = build_python._get_distribution_source_hash("key")
+        (tmp_path / "src" / "generated.py").write_text("")
+        assert build_python._get_distribution_source_hash("key") != source_hash
+
+    def test_wheel_project_copy_includes_ignored_files(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        build_python.build_utils.run("git init -q", exit_on_error=False)
+        (tmp_path / ".gitignore").write_text("generated.py\nbuild/\ndist/\n")
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src" / "generated.py").write_text("")
+        (tmp_path / "build").mkdir()
+        (tmp_path / "dist").mkdir()
+
+        project_copy = build_python._create_project_copy("wheel-", include_ignored=True)
+        try:
+            assert sorted(os.listdir(project_copy)) == [".gitignore", "src"]
+            assert os.path.isfile(os.path.join(project_copy, "src", "generated.py"))
+        finally:
+            shutil.rmtree(project_copy)
+
+
+class TestPublishDistributionClass:
+    def test_uploads_are_skipped_and_retried(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = str(tmp_path / "twine.calls")
+        twine_path = bin_dir / "twine"
+        # Every upload fails on the first attempt
+        twine_path.write_text(
+            f"#!{sys.executable}\n"
+            "import os, sys\n"
+            "if '--version' in sys.argv:\n"
+            "    sys.exit(0)\n"
+            "dist_file = sys.argv[-1]\n"
+            f"with open({calls_file!r}, 'a') as f:\n"
+            "    f.write(dist_file + '\\n')\n"
+            "if not os.path.exists(dist_file + '.failed'):\n"
+            "    open(dist_file + '.failed', 'w').close()\n"
+            "    sys.exit(1)\n"
+        )
+        twine_path.chmod(twine_path.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        monkeypatch.setattr(build_python, "_UPLOAD_RETRY_DELAY", 0)
+
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "dist").mkdir()
+        (tmp_path / "dist" / "My_Pkg-0.1.0-py3-none-any.whl").write_text("wheel")
+        (tmp_path / "dist" / "My_Pkg-0.1.0.tar.gz").write_text("sdist")
+        (tmp_path / "dist" / ".build-info.json").write_text("{}")
+
+        # Local stand-in of the simple index, the wheel is already uploaded
+        wheel_hash = hashlib.sha256(b"wheel").hexdigest()
+        (tmp_path / "index" / "my-pkg").mkdir(parents=True)
+        (tmp_path / "index" / "my-pkg" / "index.html").write_text(
+            f'<a href="../../files/My_Pkg-0.1.0-py3-none-any.whl#sha256={wheel_hash}">'
+            "My_Pkg-0.1.0-py3-none-any.whl</a>"
+        )
+        server = HTTPServer(
+            ("127.0.0.1", 0),
+            functools.partial(
+                SimpleHTTPRequestHandler, directory=str(tmp_path / "index")
+            ),
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            build_python.publish_pypi_distribution(
+                "token", index_url=f"http://127.0.0.1:{server.server_port}/"
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert _read_calls(calls_file) == [
+            os.path.join("dist", "My_Pkg-0.1.0.tar.gz"),
+            os.path.join("dist", "My_Pkg-0.1.0.tar.gz"),
+        ]
+
+    def test_failed_uploads_are_retried(self, tmp_path, monkeypatch):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        calls_file = _create_fake_tool(bin_dir, "twine", exitcode=1)
+        monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+        monkeypatch.setattr(build_python, "_UPLOAD_RETRY_DELAY", 0)
+
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "dist").mkdir()
+        (tmp_path / "dist" / "pkg-0.1.0.tar.gz").write_text("sdist")
+        build_python.publish_pypi_distribution(
+            "token", exit_on_error=False, retries=2, index_url="http://127.0.0.1:9/"
+        )
+        assert len(_read_calls(calls_file)) == 3
+
+    def test_distribution_project_name(self):
+        assert (
+            build_python._get_distribution_project_name("My.Pkg-1.0-py3-none-any.whl")
+            == "my-pkg"
+        )
+        assert (
+            build_python._get_distribution_project_name("my_pkg-1.0.0rc1.tar.gz")
+            == "my-pkg"
+        )
+        assert (
+            build_python._get_simple_index_url("https://test.pypi.org/legacy/")
+            == "https://test.pypi.org/simple/"
+        )
@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 from typing import Tuple
 
 import pytest
@@ -245,6 +246,329 @@ class TestBuildClass:
         assert completed_process.returncode != 0
 
 
+class TestRunClass:
+    command = "for i in 1 2 3 4 5; do echo line$i; done"
+
+    def test_capture_full_output(self):
+        completed_process = build_utils.run(self.command, exit_on_error=False)
+        assert completed_process.stdout == "line1\nline2\nline3\nline4\nline5\n"
+
+    def test_capture_tail_output(self):
+        completed_process = build_utils.run(
+            self.command,
+            exit_on_error=False,
+            capture=build_utils.CAPTURE_TAIL,
+            capture_lines=2,
+        )
+        assert completed_process.stdout == "line4\nline5\n"
+
+    def test_capture_no_output(self):
+        completed_process = build_utils.run(
+            self.command, exit_on_error=False, capture=build_utils.CAPTURE_NONE
+        )
+        assert completed_process.returncode == 0
+        assert completed_process.stdout == ""
+
+    def test_capture_output_in_file(self, tmp_path):
+        capture_file = tmp_path / "output.log"
+        completed_process = build_utils.run(
+            self.command,
+            exit_on_error=False,
+            capture=build_utils.CAPTURE_FILE,
+            capture_file=str(capture_file),
+        )
+        assert completed_process.stdout[:6] == b"line1\n"
+        assert completed_process.stdout.find(b"line5") > 0
+        assert capture_file.read_text().startswith("line1")
+
+    def test_separate_stdout_and_stderr(self):
+        completed_process = build_utils.run(
+            "echo out && echo err >&2", exit_on_error=False
+        )
+        assert completed_process.stdout == "out\n"
+        assert completed_process.stderr == "err\n"
+
+    def test_large_stderr_output(self):
+        completed_process = build_utils.run(
+            f"{sys.executable} -c \"import sys; sys.stderr.write('x' * 1000000); print('done')\"",
+            disable_stderr_logging=True,
+            exit_on_error=False,
+        )
+        assert completed_process.stdout == "done\n"
+        assert len(completed_process.stderr) == 1000000
+
+    def test_capture_empty_output_in_file(self):
+        completed_process = build_utils.run(
+            "true", exit_on_error=False, capture=build_utils.CAPTURE_FILE
+        )
+        assert completed_process.stdout == b""
+
+
+class TestRunAllClass:
+    def test_run_commands_concurrently(self):
+        start_time = time.time()
+        completed_processes = build_utils.run_all(
+            ["sleep 0.5 && echo first", [sys.executable, "-c", "print('second')"]],
+            max_concurrency=2,
+        )
+        assert [
+            completed_process.stdout for completed_process in completed_processes
+        ] == ["first\n", "second\n"]
+        assert time.time() - start_time < 5
+
+    def test_run_with_limited_concurrency(self):
+        start_time = time.time()
+        build_utils.run_all(["sleep 0.3", "sleep 0.3"], max_concurrency=1)
+        assert time.time() - start_time >= 0.6
+
+    def test_exit_on_error(self):
+        with pytest.raises(SystemExit) as pytest_wrapped_e:
+            build_utils.run_all(["exit 3", "echo foo"], exit_on_error=True)
+        assert pytest_wrapped_e.value.code == 3
+
+    def test_grouped_output(self, capsys):
+        build_utils.run_all(
+            ["echo a1 && sleep 0.2 && echo a2", "sleep 0.1 && echo b1"],
+            prefixes=["a", "b"],
+            group_output=True,
+        )
+        output_lines = [
+            line
+            for line in capsys.readouterr().out.splitlines()
+            if "Executing" not in line
+        ]
+        assert output_lines == ["[b] b1", "[a] a1", "[a] a2"]
+
+    def test_separate_output_without_exit(self):
+        completed_processes = build_utils.run_all(
+            ["printf 'no newline'", "echo err >&2 && exit 2"], exit_on_error=False
+        )
+        assert completed_processes[0].stdout == "no newline"
+        assert completed_processes[1].returncode == 2
+        assert completed_processes[1].stderr == "err\n"
+
+
+class TestTaskGraphClass:
+    def test_task_order_respects_dependencies(self):
+        task_order = build_utils._get_task_order(
+            {"docker": ["python-lib"], "python-lib": [], "react-webapp": []}
+        )
+        assert task_order == ["python-lib", "react-webapp", "docker"]
+
+    @pytest.mark.parametrize(
+        "tasks",
+        [
+            {"a": ["b"], "b": ["a"]},
+            {"a": ["unknown"]},
+        ],
+    )
+    def test_task_order_with_invalid_dependencies(self, tasks: dict):
+        with pytest.raises(ValueError):
+            build_utils._get_task_order(tasks)
+
+    def test_parallel_tasks_wait_for_dependencies(self):
+        finished_tasks = []
+
+        def run_task(task: str) -> bool:
+            build_utils.log(f"Running {task}")
+            finished_tasks.append(task)
+            return True
+
+        failed_tasks = build_utils._run_task_graph(
+            {"c": ["a", "b"], "a": [], "b": []}, run_task, jobs=2
+        )
+        assert not failed_tasks
+        assert finished_tasks[-1] == "c"
+
+    def test_parallel_tasks_stop_after_failure(self):
+        started_tasks = []
+
+        def run_task(task: str) -> bool:
+            started_tasks.append(task)
+            return task != "a"
+
+        failed_tasks = build_utils._run_task_graph(
+            {"a": [], "b": ["a"], "c": ["b"]}, run_task, jobs=2
+        )
+        assert failed_tasks == ["a"]
+        assert started_tasks == ["a"]
+
+
+class TestBuildCacheClass:
+    def test_restore_outputs_with_unchanged_inputs(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "main.py").write_text("print('foo')")
+        args = {build_utils.FLAG_CACHE_DIR: str(tmp_path / ".cache")}
+
+        assert not build_utils.restore_from_cache("make", args, outputs=["dist"])
+        (tmp_path / "dist").mkdir()
+        (tmp_path / "dist" / "artifact.txt").write_text("artifact")
+        build_utils.save_to_cache("make", args, outputs=["dist"])
+
+        (tmp_path / "dist" / "artifact.txt").unlink()
+        assert build_utils.restore_from_cache("make", args, outputs=["dist"])
+        assert (tmp_path / "dist" / "artifact.txt").read_text() == "artifact"
+
+    def test_no_restore_with_changed_inputs(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "main.py").write_text("print('foo')")
+        args = {build_utils.FLAG_CACHE_DIR: str(tmp_path / ".cache")}
+
+        assert not build_utils.restore_from_cache("check", args)
+        build_utils.save_to_cache("check", args)
+        assert build_utils.restore_from_cache("check", args)
+
+        (tmp_path / "main.py").write_text("print('bar')")
+        assert not build_utils.restore_from_cache("check", args)
+        assert not build_utils.restore_from_cache(
+            "check", {**args, build_utils.FLAG_VERSION: "1.0.0"}
+        )
+
+    def test_cache_disabled_without_cache_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        build_utils.save_to_cache("check", {})
+        assert not build_utils.restore_from_cache("check", {})
+
+    def test_component_cache_key_includes_dependencies(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        build_utils.run("git init -q", exit_on_error=False)
+        (tmp_path / ".gitignore").write_text("generated.txt\n")
+        for component in ["lib", "app"]:
+            (tmp_path / component).mkdir()
+            (tmp_path / component / "build.py").write_text(
+                "import os\n"
+                "def main(args):\n"
+                "    with open('../builds.txt', 'a') as f:\n"
+                "        f.write(os.path.basename(os.getcwd()) + '\\n')\n"
+            )
+        (tmp_path / "lib" / "generated.txt").write_text("foo")
+        args = {
+            build_utils.FLAG_CACHE_DIR: str(tmp_path / ".cache"),
+            "_sanitized": True,
+        }
+
+        def build_components() -> list:
+            builds_file = tmp_path / "builds.txt"
+            if builds_file.exists():
+                builds_file.unlink()
+            build_utils.build_components(
+                {"lib": [], "app": ["lib"]},
+                args,
+                in_process=True,
+                inputs={"lib": ["generated.txt"]},
+            )
+            if not builds_file.exists():
+                return []
+            return builds_file.read_text().split()
+
+        assert build_components() == ["lib", "app"]
+        assert build_components() == []
+
+        # Changes of declared inputs are detected even if they are ignored by git
+        (tmp_path / "lib" / "generated.txt").write_text("bar")
+        assert build_components() == ["lib", "app"]
+
+    def test_release_and_run_are_never_skipped(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "component").mkdir()
+        (tmp_path / "component" / "build.py").write_text(
+            "def main(args):\n"
+            "    with open('../builds.txt', 'a') as f:\n"
+            "        f.write('build\\n')\n"
+        )
+        cache_dir = str(tmp_path / ".cache")
+
+        for phase in [build_utils.FLAG_MAKE, build_utils.FLAG_RELEASE]:
+            args = {build_utils.FLAG_CACHE_DIR: cache_dir, phase: True}
+            for _ in range(2):
+                assert build_utils._build_component("component", args, in_process=True)
+        assert (tmp_path / "builds.txt").read_text().split() == ["build"] * 3
+
+    def test_cache_dir_from_specific_env_variable(self, monkeypatch):
+        monkeypatch.setenv("CACHE_DIR", "generic")
+        assert build_utils._load_from_env_variables({"cache_dir": ""}, []) == {
+            "cache_dir": ""
+        }
+
+        monkeypatch.setenv("UNIVERSAL_BUILD_CACHE_DIR", "cache")
+        assert build_utils._load_from_env_variables({"cache_dir": ""}, []) == {
+            "cache_dir": "cache"
+        }
+
+
+class TestInProcessBuildClass:
+    def test_main_function_is_called_with_args(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        component_path = tmp_path / "component"
+        component_path.mkdir()
+        (component_path / "build.py").write_text(
+            "import os\n"
+            "def main(args):\n"
+            "    with open('result.txt', 'w') as f:\n"
+            "        f.write(args['my-token'])\n"
+        )
+
+        build_utils.build(
+            "component", {"my_token": "111", "_sanitized": True}, in_process=True
+        )
+        assert (component_path / "result.txt").read_text() == "111"
+        assert os.getcwd() == str(tmp_path)
+
+    def test_main_block_is_executed_with_argv(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        component_path = tmp_path / "component"
+        component_path.mkdir()
+        (component_path / "build.py").write_text(
+            "import sys\n"
+            "if __name__ == '__main__':\n"
+            "    sys.exit(0 if '--make' in sys.argv else 3)\n"
+        )
+
+        build_utils.build(
+            "component", {"make": True, "_sanitized": True}, in_process=True
+        )
+
+        with pytest.raises(SystemExit) as pytest_wrapped_e:
+            build_utils.build(
+                "component", {"make": False, "_sanitized": True}, in_process=True
+            )
+        assert pytest_wrapped_e.value.code == build_utils.EXIT_CODE_GENERAL
+        assert os.getcwd() == str(tmp_path)
+
+
+class TestGitMetadataClass:
+    def test_metadata_is_resolved_once(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / ".git").mkdir()
+        (tmp_path / ".git" / "HEAD").write_text("ref: refs/heads/main")
+        monkeypatch.setattr(build_utils, "_git_metadata", {})
+        monkeypatch.delenv(build_utils._GIT_METADATA_ENV, raising=False)
+
+        resolved_values = []
+
+        def resolve_branch() -> str:
+            resolved_values.append("main")
+            return "main"
+
+        assert build_utils._get_git_metadata("branch", resolve_branch) == "main"
+        assert build_utils._get_git_metadata("branch", resolve_branch) == "main"
+        assert len(resolved_values) == 1
+
+        # Nested build scripts load the metadata from the environment
+        monkeypatch.setattr(build_utils, "_git_metadata", {})
+        assert build_utils._get_git_metadata("branch", resolve_branch) == "main"
+        assert len(resolved_values) == 1
+
+        # Changing HEAD invalidates the metadata
+        (tmp_path / ".git" / "HEAD").write_text("ref: refs/heads/feature/foo")
+        assert build_utils._get_git_metadata("branch", resolve_branch) == "main"
+        assert len(resolved_values) == 2
+
+    def test_sanitized_flag_passed_to_submodule(self):
+        cli_args = build_utils._concat_command_line_arguments({"_sanitized": True})
+        assert cli_args == "--_sanitized"
+
+
 def _mocked_get_remote_git_tags() -> list:
     return sorted(
         ["1.0.0", "1.1.3", "2.1.0", "1.2.0-dev.foo-branch", "1.0.0-dev"], reverse=True